@@ -0,0 +1,81 @@
+import itertools
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+import psycopg2
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+
+from app.services import export
+from app.utils import auth, profiling
+
+logger = logging.getLogger("api.admin")
+
+router = APIRouter()
+
+
+@router.get("/admin/profiles")
+def list_profiles(x_admin_token: str = Header("")):
+    auth.require_admin(x_admin_token)
+    return {"profiles": profiling.list_profiles()}
+
+
+@router.get("/admin/profiles/{profile_id}")
+def get_profile(profile_id: str, format: str = "speedscope", x_admin_token: str = Header("")):
+    auth.require_admin(x_admin_token)
+    session = profiling.get_profile(profile_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "collapsed":
+        return PlainTextResponse(profiling.to_collapsed(session))
+    if format == "speedscope":
+        return Response(
+            content=profiling.to_speedscope(session),
+            media_type="application/json",
+            headers={"Content-Disposition": f'attachment; filename="{profile_id}.speedscope.json"'},
+        )
+    raise HTTPException(status_code=400, detail="Invalid format. Allowed: speedscope, collapsed")
+
+
+@router.get("/admin/export/{source}")
+def export_data(
+    source: str,
+    format: str = "parquet",
+    columns: Optional[str] = Query(None, description="Comma-separated; all columns if omitted"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user_id: Optional[UUID] = Query(None, description="body_metrics only"),
+    patient_id: Optional[str] = Query(None, max_length=128, description="analysis only"),
+    x_admin_token: str = Header(""),
+):
+    """Stream body metrics or stored analysis results as Arrow IPC or Parquet, one record batch at a time"""
+    auth.require_admin(x_admin_token)
+    if format not in export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Allowed: {', '.join(export.EXPORT_FORMATS)}")
+    if start is not None and end is not None and end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    filters = {"user_id": str(user_id) if user_id else None, "patient_id": patient_id}
+    try:
+        query = export.build_query(
+            source, [c.strip() for c in columns.split(",") if c.strip()] if columns else None, start, end, filters
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Run the query before the response starts, so an unreachable database is a 503
+    batches = export.iter_batches(query)
+    try:
+        first = next(batches, None)
+    except (psycopg2.OperationalError, sqlite3.OperationalError) as e:
+        logger.error("Export source %s unavailable: %s", source, e)
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    chained = itertools.chain([first] if first is not None else [], batches)
+    extension = "arrows" if format == "arrow" else "parquet"
+    return StreamingResponse(
+        export.stream(chained, query.schema, format),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{source}.{extension}"'},
+    )
@@ -1,82 +1,129 @@
 import logging
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+import sqlite3
+from datetime import date
+from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, Form, Header, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from app.schemas.analysis import AnalysisResult
-from app.services.extract_text import extract_text_from_upload
-from app.services.llm_client import analyze_text_with_llm
-from app.services.preprocess import compress_report_text
-from app.utils.json_safe import parse_json_safe
-import time
+from app.services import history_store
+from app.services.admission import PRIORITIES
+from app.services.pipeline import (
+    MAX_BATCH_BYTES, AnalysisError, analyze_batch, analyze_document, expand_uploads, file_extension,
+)
+from app.utils import auth
+from app.utils.metrics import ANALYZE_IN_FLIGHT, stage_timer
+from app.utils.profiling import attach_current_thread
 
 logger = logging.getLogger("api.analyze")
 
 router = APIRouter()
 
-MAX_SIZE_BYTES = 10 * 1024 * 1024
-ALLOWED_EXTS = {"pdf", "jpg", "jpeg", "png"}
+
+def _http_error(e: AnalysisError) -> HTTPException:
+    headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+    return HTTPException(status_code=e.status_code, detail=e.detail, headers=headers)
+
+
+def _peer(request: Request) -> Optional[str]:
+    return request.client.host if request.client else None
+
+
+def _trusted(request: Request, x_admin_token: str) -> bool:
+    """The caller holds the admin token or connects from TRUSTED_PROXIES"""
+    return auth.is_admin(x_admin_token) or auth.is_trusted_proxy(_peer(request))
+
+
+def _client_id(request: Request, x_client_id: Optional[str], x_admin_token: str) -> str:
+    """
+    Fair-share key. X-Client-Id counts only from a trusted caller; anyone
+    else is keyed on their address, so a client cannot mint fresh ids to
+    get a fresh share.
+    """
+    if x_client_id and _trusted(request, x_admin_token):
+        return x_client_id[:128]
+    return _peer(request) or "anonymous"
+
+
+def _priority(x_priority: Optional[str], x_admin_token: str, default: str) -> str:
+    """Anyone may lower their priority; "high" needs the admin token"""
+    priority = (x_priority or default).lower()
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"Invalid priority. Allowed: {', '.join(PRIORITIES)}")
+    if priority == "high" and not auth.is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="High priority requires the admin token")
+    return priority
+
 
 @router.post("/analyze", response_model=AnalysisResult)
-def analyze(file: UploadFile = File(...)):
+def analyze(
+    request: Request,
+    file: UploadFile = File(...),
+    patient_id: Optional[str] = Form(None, max_length=128, description="Store the result in this patient's history"),
+    report_date: Optional[date] = Form(None, description="Collection date for the history; defaults to today"),
+    x_client_id: Optional[str] = Header(None),
+    x_priority: Optional[str] = Header(None),
+    x_admin_token: str = Header(""),
+):
+    # Writing into a patient's history needs the same trust as reading it
+    if patient_id and not _trusted(request, x_admin_token):
+        raise HTTPException(status_code=403, detail="patient_id requires the admin token or a trusted proxy")
+    client = _client_id(request, x_client_id, x_admin_token)
+    priority = _priority(x_priority, x_admin_token, "normal")
+    with ANALYZE_IN_FLIGHT.track_inprogress(), attach_current_thread():
+        return _analyze(file, patient_id, report_date, client, priority)
+
+
+def _analyze(file: UploadFile, patient_id: Optional[str] = None, report_date: Optional[date] = None,
+             client: str = "anonymous", priority: str = "normal"):
     filename = file.filename or "upload"
-    ext = filename.split(".")[-1].lower() if "." in filename else ""
-    logger.info(f"Analyze request: filename={filename}, ext={ext}")
-    if ext not in ALLOWED_EXTS:
-        logger.warning(f"Rejected file type: {ext}")
-        raise HTTPException(status_code=400, detail="Invalid file type. Allowed: PDF, JPG, PNG")
-    content = file.file.read()
-    size = len(content)
-    logger.info(f"File size: {size} bytes")
-    if size > MAX_SIZE_BYTES:
-        logger.warning(f"File too large: {size} bytes")
-        raise HTTPException(status_code=400, detail="File too large. Max 10 MB")
-
-    # Extract text
-    try:
-        text = extract_text_from_upload(ext, content)
-        logger.info(f"Extracted text length: {len(text)} chars")
-        text = compress_report_text(text, max_chars=3000)
-        logger.info(f"Preprocessed text length: {len(text)} chars")
-    except Exception as e:
-        logger.exception(f"Failed to parse file: {e}")
-        raise HTTPException(status_code=400, detail=f"Failed to parse file: {e}")
-
-    if not text or not text.strip():
-        logger.warning("No readable text extracted from file")
-        raise HTTPException(status_code=400, detail="No readable text extracted from file")
-
-    # Call LLM
+    logger.info("Analyze request: filename=%s client=%s priority=%s", filename, client, priority)
     try:
-        t0 = time.time()
-        llm_output = analyze_text_with_llm(text)
-        dt = (time.time() - t0) * 1000
-        logger.info(f"LLM call completed in {dt:.1f} ms, output length={len(llm_output)}")
-        # Optionally log a small prefix of output for debugging
-        logger.debug(f"LLM output (prefix): {llm_output[:200]}")
-    except Exception as e:
-        logger.exception(f"LLM failure: {e}")
-        raise HTTPException(status_code=500, detail=f"LLM failure: {e}")
-
-    # Validate JSON
+        ext = file_extension(filename)
+        with stage_timer("upload_read"):
+            content = file.file.read()
+        result = analyze_document(ext, content, client, priority)
+    except AnalysisError as e:
+        raise _http_error(e)
+
+    headers = {}
+    if patient_id:
+        # History is best effort: the analysis is still returned if storing fails
+        try:
+            with stage_timer("history"):
+                report_id = history_store.append_report(patient_id, report_date or date.today(), result, filename)
+            headers["X-Report-Id"] = str(report_id)
+        except sqlite3.Error as e:
+            logger.error("Failed to store report history: %s", e)
+
+    # Already validated: serialize once in pydantic-core and skip response_model re-validation
+    with stage_timer("serialize"):
+        body = result.model_dump_json()
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.post("/analyze/batch")
+def analyze_batch_endpoint(request: Request, files: List[UploadFile] = File(...), x_client_id: Optional[str] = Header(None),
+                           x_admin_token: str = Header("")):
+    """
+    Analyze many files (or zip archives of them) in one request. Streams one
+    NDJSON line per file as soon as it finishes: index, filename, elapsed_ms,
+    status ("ok" or "error") and either result or status_code and error.
+    Items queue for the LLM at low priority and are not shed.
+    """
+    uploads, total = [], 0
+    with stage_timer("upload_read"):
+        for i, f in enumerate(files):
+            # Never read more than the batch budget, whatever the client sent
+            content = f.file.read(MAX_BATCH_BYTES - total + 1)
+            total += len(content)
+            if total > MAX_BATCH_BYTES:
+                raise HTTPException(status_code=413, detail=f"Batch too large. Max {MAX_BATCH_BYTES // (1024 * 1024)} MB")
+            uploads.append((f.filename or f"upload-{i}", content))
     try:
-        parsed = parse_json_safe(llm_output)
-
-        # Ensure required fields exist with defaults if missing
-        if "summary" not in parsed:
-            parsed["summary"] = {"abnormal_count": 0, "risk_level": "low"}
-        if "parameters" not in parsed:
-            parsed["parameters"] = []
-
-        # Clean up parameters to ensure value is always a string
-        for param in parsed.get("parameters", []):
-            if "value" not in param or param["value"] is None:
-                param["value"] = ""
-            elif not isinstance(param["value"], str):
-                param["value"] = str(param["value"])
-
-        result = AnalysisResult(**parsed)
-    except Exception as e:
-        logger.error(f"Invalid JSON output from LLM: {e}")
-        logger.error(f"LLM output was:\n{llm_output}")
-        raise HTTPException(status_code=500, detail=f"Invalid JSON output from LLM: {e}")
-
-    return JSONResponse(content=result.model_dump())
+        items = expand_uploads(uploads)
+    except AnalysisError as e:
+        raise _http_error(e)
+    if not items:
+        raise HTTPException(status_code=400, detail="No files to analyze")
+    logger.info("Batch request: %s files", len(items))
+    return StreamingResponse(analyze_batch(items, _client_id(request, x_client_id, x_admin_token)), media_type="application/x-ndjson")
@@ -0,0 +1,42 @@
+import logging
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+import psycopg2
+from fastapi import APIRouter, Header, HTTPException, Query
+
+from app.schemas.body_metrics import BodyMetricsSeries
+from app.services.body_metrics import ROLLUP_LEVELS, get_connection, pick_level, query_series
+from app.utils import auth
+
+logger = logging.getLogger("api.body_metrics")
+
+router = APIRouter()
+
+
+@router.get("/body-metrics/{user_id}/series", response_model=BodyMetricsSeries)
+def body_metrics_series(
+    user_id: UUID,
+    start: datetime,
+    end: datetime,
+    level: Optional[str] = Query(None, description="day, week or month; picked from the span if omitted"),
+    x_admin_token: str = Header(""),
+):
+    auth.require_admin(x_admin_token)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if level is None:
+        level = pick_level(start, end)
+    elif level not in ROLLUP_LEVELS:
+        raise HTTPException(status_code=400, detail=f"Invalid level. Allowed: {', '.join(ROLLUP_LEVELS)}")
+
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                points = query_series(cur, user_id, start, end, level)
+    except psycopg2.OperationalError as e:
+        logger.error("Database unavailable: %s", e)
+        raise HTTPException(status_code=503, detail="Database unavailable")
+
+    return {"level": level, "points": points}
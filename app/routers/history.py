@@ -0,0 +1,42 @@
+import logging
+import sqlite3
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException
+
+from app.schemas.history import LatestValues, ParameterHistory
+from app.services import history_store
+from app.utils import auth
+
+logger = logging.getLogger("api.history")
+
+router = APIRouter()
+
+
+@router.get("/history/{patient_id}/parameters/{analyte}", response_model=ParameterHistory)
+def parameter_history(patient_id: str, analyte: str, start: Optional[date] = None, end: Optional[date] = None,
+                      x_admin_token: str = Header("")):
+    """Stored values of one analyte for a patient, oldest first; synonyms resolve to the same series"""
+    auth.require_admin(x_admin_token)
+    if start is not None and end is not None and end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    key = history_store.analyte_key(analyte)
+    try:
+        points = history_store.query_series(patient_id, key, start, end)
+    except sqlite3.Error as e:
+        logger.error("History store unavailable: %s", e)
+        raise HTTPException(status_code=503, detail="History store unavailable")
+    return {"patient_id": patient_id, "analyte": key, "points": points}
+
+
+@router.get("/history/{patient_id}/latest", response_model=LatestValues)
+def latest_values(patient_id: str, x_admin_token: str = Header("")):
+    """Most recent value and trend delta of every analyte stored for a patient"""
+    auth.require_admin(x_admin_token)
+    try:
+        values = history_store.query_latest(patient_id)
+    except sqlite3.Error as e:
+        logger.error("History store unavailable: %s", e)
+        raise HTTPException(status_code=503, detail="History store unavailable")
+    return {"patient_id": patient_id, "values": values}
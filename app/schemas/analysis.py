@@ -9,6 +9,11 @@ class Parameter(BaseModel):
     status: str = Field(default="normal", pattern=r"^(normal|high|low)$")
     risk: Optional[str] = None
     explanation: Optional[str] = None
+    # Filled from the analyte knowledge base after validation
+    canonical_name: Optional[str] = None
+    numeric_value: Optional[float] = None
+    canonical_value: Optional[float] = None
+    canonical_unit: Optional[str] = None
 
     @field_validator('name', mode='before')
     @classmethod
@@ -55,6 +60,9 @@ class Parameter(BaseModel):
             # Map 'range' to 'normal_range'
             if 'range' in data and 'normal_range' not in data:
                 data['normal_range'] = data.pop('range')
+            # Missing value becomes "" like an explicit null
+            if data.get('value') is None:
+                data['value'] = ''
             # If status is missing but we have value and normal_range, infer it
             if 'status' not in data or data.get('status') is None:
                 data['status'] = 'normal'  # Default value
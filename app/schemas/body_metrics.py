@@ -0,0 +1,23 @@
+from datetime import datetime
+from typing import List
+from pydantic import BaseModel
+
+
+class MetricStats(BaseModel):
+    avg: float
+    min: float
+    max: float
+
+
+class SeriesPoint(BaseModel):
+    bucket_start: datetime
+    count: int
+    weight_kg: MetricStats
+    fat_percent: MetricStats
+    bmi: MetricStats
+    tdee: MetricStats
+
+
+class BodyMetricsSeries(BaseModel):
+    level: str
+    points: List[SeriesPoint]
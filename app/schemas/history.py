@@ -0,0 +1,33 @@
+from datetime import date
+from typing import List, Optional
+from pydantic import BaseModel
+
+
+class HistoryPoint(BaseModel):
+    report_date: date
+    report_id: int
+    value: float
+    unit: Optional[str] = None
+    status: str
+    # Change from the previous stored value of the same analyte
+    delta: Optional[float] = None
+
+
+class ParameterHistory(BaseModel):
+    patient_id: str
+    analyte: str
+    points: List[HistoryPoint]
+
+
+class LatestValue(BaseModel):
+    analyte: str
+    report_date: date
+    value: float
+    unit: Optional[str] = None
+    status: str
+    delta: Optional[float] = None
+
+
+class LatestValues(BaseModel):
+    patient_id: str
+    values: List[LatestValue]
@@ -0,0 +1,208 @@
+import logging
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from app.services.llm_client import BASE_PROMPT, MAX_INPUT_CHARS, observed_token_rates
+from app.services.result_check import result_lines
+from app.utils.metrics import ADMISSION_DECISIONS, ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT_SECONDS
+
+logger = logging.getLogger("admission")
+
+# ========================
+# Configuration
+# ========================
+
+# Concurrent Ollama calls from this process, shared by /analyze and batches
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "2"))
+# Reject when the predicted wait for an LLM slot is longer than this (0 disables shedding)
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "30"))
+
+# Cost model. Token rates are defaults until Ollama has reported its own; the
+# LLM estimate is further calibrated against observed slot times
+PDF_SECONDS_PER_PAGE = float(os.getenv("ADMISSION_PDF_SECONDS_PER_PAGE", "0.05"))
+OCR_SECONDS_PER_PAGE = float(os.getenv("ADMISSION_OCR_SECONDS_PER_PAGE", "1.5"))
+PROMPT_TOKENS_PER_SECOND = float(os.getenv("ADMISSION_PROMPT_TOKENS_PER_SECOND", "400"))
+EVAL_TOKENS_PER_SECOND = float(os.getenv("ADMISSION_EVAL_TOKENS_PER_SECOND", "40"))
+CHARS_PER_TOKEN = 4
+# Generated tokens per parameter, and result lines per page before extraction has run
+TOKENS_PER_PARAMETER = 45
+LINES_PER_PAGE = 15
+# Weight of the latest call in the calibration average
+CALIBRATION_ALPHA = 0.3
+
+# Lower rank is served first
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+PAGE_PATTERN = re.compile(rb"/Type\s*/Page\b")
+
+_cond = threading.Condition()
+_waiting: List["Ticket"] = []
+_running: Dict["Ticket", float] = {}
+# Start-time fair queuing: each request starts in virtual time where the client's
+# previous one finished (or at the current virtual time if the client was idle)
+_client_finish: Dict[str, float] = {}
+_vtime = 0.0
+# Observed / estimated LLM seconds, averaged
+_calibration = 1.0
+
+
+class Overloaded(Exception):
+    """Predicted queue wait is over the deadline; retry_after is in seconds"""
+
+    def __init__(self, wait: float, retry_after: int):
+        super().__init__(f"Server busy: predicted wait {wait:.0f}s")
+        self.wait = wait
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """One request's place in the LLM queue"""
+
+    __slots__ = ("client", "priority", "cost", "start", "ready", "enqueued")
+
+    def __init__(self, client: str, priority: str, cost: float, start: float):
+        self.client = client
+        self.priority = priority
+        # Estimated LLM seconds
+        self.cost = cost
+        # Virtual start time
+        self.start = start
+        # False until extraction is done and the request actually needs the LLM
+        self.ready = False
+        self.enqueued = time.monotonic()
+
+    def order(self):
+        return PRIORITIES[self.priority], self.start
+
+# ========================
+# Cost estimation
+# ========================
+
+def page_count(ext: str, content: bytes) -> int:
+    """Pages without parsing the document; PDFs with compressed object streams count as one"""
+    if ext != "pdf":
+        return 1
+    return max(1, len(PAGE_PATTERN.findall(content)))
+
+
+def extract_seconds(ext: str, pages: int) -> float:
+    return pages * (PDF_SECONDS_PER_PAGE if ext == "pdf" else OCR_SECONDS_PER_PAGE)
+
+
+def _llm_seconds(text_chars: int, parameters: int) -> float:
+    prompt_tokens = (len(BASE_PROMPT) + min(text_chars, MAX_INPUT_CHARS)) / CHARS_PER_TOKEN
+    eval_tokens = 20 + parameters * TOKENS_PER_PARAMETER
+    prompt_rate, eval_rate = observed_token_rates() or (PROMPT_TOKENS_PER_SECOND, EVAL_TOKENS_PER_SECOND)
+    return (prompt_tokens / prompt_rate + eval_tokens / eval_rate) * _calibration
+
+
+def upload_llm_seconds(pages: int, max_chars: int) -> float:
+    """LLM cost guessed before extraction: a typical page of results, up to the text budget"""
+    lines = pages * LINES_PER_PAGE
+    chars = min(lines * 40, max_chars)
+    return _llm_seconds(chars, min(lines, chars // 40))
+
+
+def text_llm_seconds(text: str) -> float:
+    """LLM cost of the compressed text actually sent to the model"""
+    return _llm_seconds(len(text), len(result_lines(text)))
+
+# ========================
+# Queue
+# ========================
+
+def _predicted_wait(order) -> float:
+    """Seconds until a request with this (rank, virtual start) would get a slot"""
+    now = time.monotonic()
+    ahead = [t.cost for t in _waiting if t.order() < order]
+    if len(_running) + len(ahead) < LLM_CONCURRENCY:
+        return 0.0
+    remaining = sum(max(0.0, t.cost - (now - start)) for t, start in _running.items())
+    return (sum(ahead) + remaining) / LLM_CONCURRENCY
+
+
+def admit(client: str, priority: str, cost: float, lead_seconds: float = 0.0,
+          max_wait: Optional[float] = ADMISSION_MAX_WAIT_SECONDS) -> Ticket:
+    """
+    Queue a request or raise Overloaded. The predicted wait counts everything
+    that would be served first; lead_seconds (the request's own extraction)
+    is subtracted since the queue drains meanwhile. max_wait None never rejects.
+    """
+    with _cond:
+        start = max(_vtime, _client_finish.get(client, 0.0))
+        wait = max(0.0, _predicted_wait((PRIORITIES[priority], start)) - lead_seconds)
+        if max_wait and wait > max_wait:
+            ADMISSION_DECISIONS.labels(priority, "rejected").inc()
+            logger.warning("Rejected %s request from %s: predicted wait %.1fs > %.0fs", priority, client, wait, max_wait)
+            raise Overloaded(wait, max(1, math.ceil(wait - max_wait)))
+        ticket = Ticket(client, priority, cost, start)
+        _client_finish[client] = start + cost
+        _waiting.append(ticket)
+        ADMISSION_QUEUE_DEPTH.inc()
+    ADMISSION_DECISIONS.labels(priority, "admitted").inc()
+    return ticket
+
+
+def _next() -> Optional[Ticket]:
+    ready = [t for t in _waiting if t.ready]
+    return min(ready, key=Ticket.order) if ready else None
+
+
+@contextmanager
+def slot(ticket: Ticket, cost: float):
+    """Hold one of the LLM_CONCURRENCY slots, granted in priority then fair-share order"""
+    global _vtime
+    with _cond:
+        # Re-price with the real text; the client's later requests keep their start times
+        ticket.cost = cost
+        ticket.ready = True
+        _cond.notify_all()
+        while len(_running) >= LLM_CONCURRENCY or _next() is not ticket:
+            _cond.wait()
+        _waiting.remove(ticket)
+        ADMISSION_QUEUE_DEPTH.dec()
+        _running[ticket] = time.monotonic()
+        _vtime = max(_vtime, ticket.start)
+    ADMISSION_WAIT_SECONDS.labels(ticket.priority).observe(time.monotonic() - ticket.enqueued)
+    t0 = time.monotonic()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        with _cond:
+            del _running[ticket]
+            if ok:
+                _calibrate(time.monotonic() - t0, cost)
+            _forget_idle_clients()
+            _cond.notify_all()
+
+
+def leave(ticket: Ticket):
+    """Drop a ticket that never needed its slot (rejected upload, table result, error)"""
+    with _cond:
+        if ticket in _waiting:
+            _waiting.remove(ticket)
+            ADMISSION_QUEUE_DEPTH.dec()
+            _cond.notify_all()
+
+
+def _calibrate(actual: float, estimated: float):
+    global _calibration
+    if estimated <= 0:
+        return
+    ratio = actual / (estimated / _calibration)
+    _calibration = min(10.0, max(0.1, (1 - CALIBRATION_ALPHA) * _calibration + CALIBRATION_ALPHA * ratio))
+
+
+def _forget_idle_clients():
+    # A client whose last request finished in virtual time starts afresh anyway
+    if len(_client_finish) > 1000:
+        for client in [c for c, finish in _client_finish.items() if finish <= _vtime]:
+            del _client_finish[client]
+
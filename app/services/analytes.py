@@ -0,0 +1,214 @@
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app.schemas.analysis import AnalysisResult, Parameter
+
+# ========================
+# Configuration
+# ========================
+
+DEFAULT_ANALYTES_PATH = Path(__file__).resolve().parent.parent / "data" / "analytes.json"
+ANALYTES_PATH = Path(os.getenv("ANALYTES_PATH", str(DEFAULT_ANALYTES_PATH)))
+
+# Summary.risk_level thresholds on abnormal_count (same rule the prompt gives the model)
+MEDIUM_RISK_MIN_ABNORMAL = 1
+HIGH_RISK_MIN_ABNORMAL = 6
+
+NUMBER_PATTERN = re.compile(r"[-+]?\d[\d,]*(?:\.\d+)?")
+PAREN_PATTERN = re.compile(r"\(([^)]*)\)")
+NON_ALNUM_PATTERN = re.compile(r"[^a-z0-9+]+")
+
+
+class Analyte(NamedTuple):
+    name: str
+    unit: str
+    # normalized unit -> factor converting a value in that unit to `unit`
+    factors: Dict[str, float]
+    low: Optional[float]
+    high: Optional[float]
+    synonyms: Tuple[str, ...]
+
+
+# ========================
+# Normalization
+# ========================
+
+def normalize_name(name: str) -> str:
+    """'SGPT (ALT)' -> 'sgpt alt', 'Hb.' -> 'hb'"""
+    return NON_ALNUM_PATTERN.sub(" ", name.lower()).strip()
+
+
+def normalize_unit(unit: str) -> str:
+    """Canonical spelling for unit comparison: 'x10³/µL' -> '10^3/ul', 'cu mm' -> 'ul'"""
+    u = unit.lower().replace(" ", "").replace("µ", "u").replace("μ", "u")
+    u = u.replace("³", "^3").replace("⁶", "^6").replace("⁹", "^9")
+    if u.startswith("x10") or u.startswith("*10"):
+        u = u[1:]
+    return u.replace("cumm", "ul").replace("mm3", "ul")
+
+
+def parse_number(text: Optional[str]) -> Optional[float]:
+    """First number in a value string: '6,500 /uL' -> 6500.0"""
+    if not text:
+        return None
+    m = NUMBER_PATTERN.search(text)
+    if not m:
+        return None
+    try:
+        return float(m.group(0).replace(",", ""))
+    except ValueError:
+        return None
+
+
+def parse_range(text: Optional[str]) -> Optional[Tuple[Optional[float], Optional[float]]]:
+    """
+    Reference range as (low, high), either side open-ended:
+    '13.0 - 17.0', '13 to 17', '< 200', 'up to 40', '> 40'. None when unparseable.
+    """
+    if not text:
+        return None
+    lowered = text.lower()
+    numbers = [float(n.replace(",", "")) for n in NUMBER_PATTERN.findall(lowered.replace(" - ", " "))]
+    if not numbers:
+        return None
+    if "<" in lowered or "up to" in lowered or "upto" in lowered or "below" in lowered:
+        return None, numbers[0]
+    if ">" in lowered or "above" in lowered:
+        return numbers[0], None
+    if len(numbers) >= 2:
+        low, high = abs(numbers[0]), abs(numbers[1])
+        return (low, high) if low <= high else (high, low)
+    return None
+
+
+def status_for(value: float, low: Optional[float], high: Optional[float]) -> str:
+    if low is not None and value < low:
+        return "low"
+    if high is not None and value > high:
+        return "high"
+    return "normal"
+
+
+def risk_level_for(abnormal_count: int) -> str:
+    if abnormal_count >= HIGH_RISK_MIN_ABNORMAL:
+        return "high"
+    if abnormal_count >= MEDIUM_RISK_MIN_ABNORMAL:
+        return "medium"
+    return "low"
+
+
+# ========================
+# Knowledge base
+# ========================
+
+def load_analytes(path: Path = ANALYTES_PATH) -> List[Analyte]:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    analytes = []
+    for entry in data["analytes"]:
+        low, high = entry.get("range") or (None, None)
+        factors = {normalize_unit(u): float(f) for u, f in (entry.get("units") or {}).items()}
+        factors[normalize_unit(entry["unit"])] = 1.0
+        analytes.append(Analyte(
+            name=entry["name"],
+            unit=entry["unit"],
+            factors=factors,
+            low=low,
+            high=high,
+            synonyms=tuple(entry.get("synonyms") or ()),
+        ))
+    return analytes
+
+
+def build_index(analytes: List[Analyte]) -> Dict[str, Analyte]:
+    """Normalized name or synonym -> analyte; first entry wins on collisions"""
+    index = {}
+    for analyte in analytes:
+        for name in (analyte.name, *analyte.synonyms):
+            index.setdefault(normalize_name(name), analyte)
+    return index
+
+
+# Loaded once at import; the API imports this module at startup
+ANALYTES = load_analytes()
+INDEX = build_index(ANALYTES)
+
+
+def hint_vocabulary() -> List[str]:
+    """
+    Names and synonyms as lowercase word sequences, for the preprocess line
+    classifier. One-letter synonyms ('k') would match too much free text.
+    """
+    return sorted(name for name in INDEX if len(name) > 1)
+
+
+def resolve(name: Optional[str]) -> Optional[Analyte]:
+    """
+    Dictionary lookups only: the full normalized name, then the name without its
+    parenthetical, then the parenthetical itself ('SGPT (ALT)' -> 'sgpt', 'alt').
+    """
+    if not name:
+        return None
+    analyte = INDEX.get(normalize_name(name))
+    if analyte is not None or "(" not in name:
+        return analyte
+    outer = normalize_name(PAREN_PATTERN.sub(" ", name))
+    analyte = INDEX.get(outer)
+    if analyte is not None:
+        return analyte
+    for inner in PAREN_PATTERN.findall(name):
+        analyte = INDEX.get(normalize_name(inner))
+        if analyte is not None:
+            return analyte
+    return None
+
+
+def convert(value: float, unit: Optional[str], analyte: Analyte) -> Optional[float]:
+    """Value expressed in the analyte's canonical unit; None for unknown units"""
+    factor = analyte.factors.get(normalize_unit(unit or analyte.unit))
+    if factor is None:
+        return None
+    return value * factor
+
+
+# ========================
+# Result normalization
+# ========================
+
+def normalize_parameter(param: Parameter) -> Parameter:
+    """
+    Fill the numeric fields and recompute status in place. The report's own
+    range wins over the default one; when neither applies the model's status stays.
+    """
+    value = parse_number(param.value)
+    param.numeric_value = value
+    analyte = resolve(param.name)
+    if analyte is not None:
+        param.canonical_name = analyte.name
+        if value is not None:
+            canonical = convert(value, param.unit, analyte)
+            if canonical is not None:
+                param.canonical_value = round(canonical, 4)
+                param.canonical_unit = analyte.unit
+    if value is None:
+        return param
+
+    report_range = parse_range(param.normal_range)
+    if report_range is not None:
+        param.status = status_for(value, *report_range)
+    elif param.canonical_value is not None and (analyte.low is not None or analyte.high is not None):
+        param.status = status_for(param.canonical_value, analyte.low, analyte.high)
+    return param
+
+
+def normalize_result(result: AnalysisResult) -> AnalysisResult:
+    """Normalize every parameter, then derive the summary from the statuses"""
+    for param in result.parameters:
+        normalize_parameter(param)
+    abnormal = sum(1 for p in result.parameters if p.status != "normal")
+    result.summary.abnormal_count = abnormal
+    result.summary.risk_level = risk_level_for(abnormal)
+    return result
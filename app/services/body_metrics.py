@@ -0,0 +1,184 @@
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from psycopg2.pool import ThreadedConnectionPool
+
+# ========================
+# Configuration
+# ========================
+
+DB_CONFIG = {
+    "host": os.getenv("POSTGRES_HOST", "localhost"),
+    "dbname": os.getenv("POSTGRES_DB", "healthdb"),
+    "user": os.getenv("POSTGRES_USER", "healthuser"),
+    "password": os.getenv("POSTGRES_PASSWORD", "healthpass"),
+    "port": int(os.getenv("POSTGRES_PORT", "5432")),
+}
+
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "4"))
+
+# Metrics aggregated into rollups (columns of body_metrics_features)
+ROLLUP_METRICS = ("weight_kg", "fat_percent", "bmi", "tdee")
+
+# Bucket sizes, finest first; values are Postgres date_trunc units
+ROLLUP_LEVELS = ("day", "week", "month")
+
+# Largest span (days) served from each level; keeps a chart under ~100 points
+LEVEL_MAX_SPAN_DAYS = {"day": 92, "week": 730}
+
+# ========================
+# Connections
+# ========================
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ThreadedConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadedConnectionPool(1, DB_POOL_MAX, **DB_CONFIG)
+    return _pool
+
+
+@contextmanager
+def get_connection():
+    """Pooled connection for request handlers; commits on success"""
+    pool = _get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+# ========================
+# Schema
+# ========================
+
+def ensure_rollup_schema(cur):
+    metric_cols = ",\n".join(
+        f"{m}_sum DOUBLE PRECISION NOT NULL, {m}_min DOUBLE PRECISION NOT NULL, {m}_max DOUBLE PRECISION NOT NULL"
+        for m in ROLLUP_METRICS
+    )
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS body_metrics_rollups (
+            user_id UUID NOT NULL,
+            level TEXT NOT NULL,
+            bucket_start TIMESTAMPTZ NOT NULL,
+            n INTEGER NOT NULL,
+            {metric_cols},
+            PRIMARY KEY (user_id, level, bucket_start)
+        )
+    """)
+
+
+def backfill_rollups(cur):
+    """Build rollups from existing features once, when the table is still empty"""
+    cur.execute("SELECT 1 FROM body_metrics_rollups LIMIT 1")
+    if cur.fetchone():
+        return
+    aggregates = ", ".join(f"SUM({m}), MIN({m}), MAX({m})" for m in ROLLUP_METRICS)
+    columns = ", ".join(f"{m}_sum, {m}_min, {m}_max" for m in ROLLUP_METRICS)
+    not_null = " AND ".join(f"{m} IS NOT NULL" for m in ROLLUP_METRICS)
+    for level in ROLLUP_LEVELS:
+        cur.execute(f"""
+            INSERT INTO body_metrics_rollups (user_id, level, bucket_start, n, {columns})
+            SELECT user_id, %s, date_trunc(%s, measured_at, 'UTC'), COUNT(*), {aggregates}
+            FROM body_metrics_features
+            WHERE {not_null}
+            GROUP BY user_id, date_trunc(%s, measured_at, 'UTC')
+        """, (level, level, level))
+
+# ========================
+# Incremental update
+# ========================
+
+def _build_upsert():
+    columns = ", ".join(f"{m}_sum, {m}_min, {m}_max" for m in ROLLUP_METRICS)
+    values = ", ".join(f"%({m})s, %({m})s, %({m})s" for m in ROLLUP_METRICS)
+    updates = ",\n            ".join(
+        f"{m}_sum = r.{m}_sum + EXCLUDED.{m}_sum, "
+        f"{m}_min = LEAST(r.{m}_min, EXCLUDED.{m}_min), "
+        f"{m}_max = GREATEST(r.{m}_max, EXCLUDED.{m}_max)"
+        for m in ROLLUP_METRICS
+    )
+    return f"""
+        INSERT INTO body_metrics_rollups AS r (user_id, level, bucket_start, n, {columns})
+        SELECT %(user_id)s, lvl, date_trunc(lvl, %(measured_at)s::timestamptz, 'UTC'), 1, {values}
+        FROM unnest(%(levels)s::text[]) AS lvl
+        ON CONFLICT (user_id, level, bucket_start) DO UPDATE SET
+            n = r.n + 1,
+            {updates}
+    """
+
+
+UPSERT_SQL = _build_upsert()
+
+
+def update_rollups(cur, user_id, measured_at: datetime, values: dict):
+    """Fold one feature row into the daily/weekly/monthly buckets (one statement)"""
+    params = {m: values[m] for m in ROLLUP_METRICS}
+    params.update(user_id=str(user_id), measured_at=measured_at, levels=list(ROLLUP_LEVELS))
+    cur.execute(UPSERT_SQL, params)
+
+def rebuild_rollups(cur, user_id, measured_at: datetime):
+    """Recount the buckets holding measured_at from the features (after an edit)"""
+    aggregates = ", ".join(f"SUM({m}), MIN({m}), MAX({m})" for m in ROLLUP_METRICS)
+    columns = ", ".join(f"{m}_sum, {m}_min, {m}_max" for m in ROLLUP_METRICS)
+    not_null = " AND ".join(f"{m} IS NOT NULL" for m in ROLLUP_METRICS)
+    for level in ROLLUP_LEVELS:
+        params = {"user_id": str(user_id), "level": level, "measured_at": measured_at}
+        cur.execute("""
+            DELETE FROM body_metrics_rollups
+            WHERE user_id = %(user_id)s AND level = %(level)s
+              AND bucket_start = date_trunc(%(level)s, %(measured_at)s::timestamptz, 'UTC')
+        """, params)
+        cur.execute(f"""
+            INSERT INTO body_metrics_rollups (user_id, level, bucket_start, n, {columns})
+            SELECT user_id, %(level)s, date_trunc(%(level)s, %(measured_at)s::timestamptz, 'UTC'), COUNT(*), {aggregates}
+            FROM body_metrics_features
+            WHERE user_id = %(user_id)s AND {not_null}
+              AND date_trunc(%(level)s, measured_at, 'UTC') = date_trunc(%(level)s, %(measured_at)s::timestamptz, 'UTC')
+            GROUP BY user_id
+        """, params)
+
+# ========================
+# Queries
+# ========================
+
+def pick_level(start: datetime, end: datetime) -> str:
+    span_days = (end - start).total_seconds() / 86400
+    for level in ROLLUP_LEVELS:
+        max_span = LEVEL_MAX_SPAN_DAYS.get(level)
+        if max_span is None or span_days <= max_span:
+            return level
+    return ROLLUP_LEVELS[-1]
+
+
+def query_series(cur, user_id, start: datetime, end: datetime, level: str):
+    stats = ", ".join(f"{m}_sum / n, {m}_min, {m}_max" for m in ROLLUP_METRICS)
+    cur.execute(f"""
+        SELECT bucket_start, n, {stats}
+        FROM body_metrics_rollups
+        WHERE user_id = %s AND level = %s
+          AND bucket_start >= date_trunc(%s, %s::timestamptz, 'UTC')
+          AND bucket_start < %s
+        ORDER BY bucket_start
+    """, (str(user_id), level, level, start, end))
+
+    points = []
+    for row in cur.fetchall():
+        point = {"bucket_start": row[0], "count": row[1]}
+        for i, m in enumerate(ROLLUP_METRICS):
+            avg, lo, hi = row[2 + 3 * i: 5 + 3 * i]
+            point[m] = {"avg": avg, "min": lo, "max": hi}
+        points.append(point)
+    return points
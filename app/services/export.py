@@ -0,0 +1,300 @@
+"""
+Columnar bulk export of body metrics and stored analysis results.
+
+Rows are fetched in bounded batches (a server-side cursor on Postgres, a
+stepping cursor on a read-only SQLite connection) and written as Arrow IPC
+or Parquet one record batch at a time, so memory stays flat however many
+rows match. Only the requested columns are selected, and the time range and
+id filters go into the WHERE clause. pyarrow is imported on first use, so
+it stays out of API startup.
+"""
+import os
+import sqlite3
+import uuid
+from datetime import datetime, time, timedelta, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+import psycopg2
+
+from app.services import body_metrics, history_store
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+# ========================
+# Configuration
+# ========================
+
+# Rows per record batch (and per Parquet row group)
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "50000"))
+
+EXPORT_FORMATS = ("arrow", "parquet")
+
+MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Column types are pyarrow type names, resolved by _arrow_type
+UTC_TIMESTAMP = "timestamp[us, tz=UTC]"
+
+# ========================
+# Sources
+# ========================
+
+class Column(NamedTuple):
+    sql: str
+    type: str
+
+
+class Source(NamedTuple):
+    database: str               # "postgres" or "history"
+    table: str
+    columns: Dict[str, Column]  # in export order
+    time_column: str
+    filters: Dict[str, str]     # filter name -> SQL column
+    order_by: str
+
+
+FEATURE_METRICS = (
+    "weight_kg", "fat_percent", "muscle_percent", "water_percent",
+    "bmi", "bmr", "tdee", "fat_mass_kg", "lean_mass_kg",
+)
+
+SOURCES = {
+    "body_metrics": Source(
+        database="postgres",
+        table="body_metrics_features",
+        columns={
+            "user_id": Column("user_id::text", "string"),
+            "measured_at": Column("measured_at", UTC_TIMESTAMP),
+            **{m: Column(f"{m}::double precision", "float64") for m in FEATURE_METRICS},
+        },
+        time_column="measured_at",
+        filters={"user_id": "user_id"},
+        # Matches the (user_id, measured_at) unique index: no sort
+        order_by="user_id, measured_at",
+    ),
+    "analysis": Source(
+        database="history",
+        table="measurements m JOIN reports r ON r.id = m.report_id",
+        columns={
+            "report_id": Column("m.report_id", "int64"),
+            "patient_id": Column("m.patient_id", "string"),
+            "report_date": Column("m.report_date", "date32"),
+            "analyte": Column("m.analyte", "string"),
+            "value": Column("m.value", "float64"),
+            "unit": Column("m.unit", "string"),
+            "status": Column("m.status", "string"),
+            "delta": Column("m.delta", "float64"),
+            "filename": Column("r.filename", "string"),
+            "risk_level": Column("r.risk_level", "string"),
+        },
+        time_column="m.report_date",
+        filters={"patient_id": "m.patient_id"},
+        order_by="m.id",
+    ),
+}
+
+
+class Query(NamedTuple):
+    source: Source
+    sql: str
+    params: list
+    schema: "pa.Schema"
+
+# ========================
+# Query building
+# ========================
+
+def _utc(value: datetime) -> datetime:
+    """Naive datetimes are taken as UTC"""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def _first_day_from(value: datetime) -> str:
+    """First report date at or after `value` (a report counts at midnight UTC of its date)"""
+    value = _utc(value)
+    day = value.date()
+    if value.time() != time(0):
+        day += timedelta(days=1)
+    return day.isoformat()
+
+
+def _arrow_type(name: str) -> "pa.DataType":
+    import pyarrow as pa
+
+    if name == UTC_TIMESTAMP:
+        return pa.timestamp("us", tz="UTC")
+    return getattr(pa, name)()
+
+
+def build_query(source_name: str, columns: Optional[Sequence[str]] = None, start: Optional[datetime] = None,
+                end: Optional[datetime] = None, filters: Optional[Dict[str, str]] = None) -> Query:
+    """
+    SELECT of the requested columns (all by default) for start <= time < end.
+    Unknown sources, columns or filters raise ValueError; only names from
+    SOURCES ever reach the SQL text.
+    """
+    source = SOURCES.get(source_name)
+    if source is None:
+        raise ValueError(f"Unknown source {source_name!r}. Allowed: {', '.join(SOURCES)}")
+    names = list(columns) if columns else list(source.columns)
+    unknown = [n for n in names if n not in source.columns]
+    if unknown:
+        raise ValueError(f"Unknown columns for {source_name}: {', '.join(unknown)}. "
+                         f"Allowed: {', '.join(source.columns)}")
+    if len(set(names)) != len(names):
+        raise ValueError("Duplicate columns")
+
+    placeholder = "%s" if source.database == "postgres" else "?"
+    where, params = [], []
+    for name, value in (filters or {}).items():
+        if value is None:
+            continue
+        if name not in source.filters:
+            raise ValueError(f"Unknown filter for {source_name}: {name}. Allowed: {', '.join(source.filters)}")
+        where.append(f"{source.filters[name]} = {placeholder}")
+        params.append(value)
+    for bound, op in ((start, ">="), (end, "<")):
+        if bound is None:
+            continue
+        where.append(f"{source.time_column} {op} {placeholder}")
+        # history dates are ISO text: compare against whole days
+        params.append(_utc(bound) if source.database == "postgres" else _first_day_from(bound))
+
+    import pyarrow as pa
+
+    select = ", ".join(source.columns[n].sql for n in names)
+    sql = f"SELECT {select} FROM {source.table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {source.order_by}"
+    schema = pa.schema([pa.field(n, _arrow_type(source.columns[n].type)) for n in names])
+    return Query(source, sql, params, schema)
+
+# ========================
+# Reading
+# ========================
+
+def _postgres_rows(query: Query, batch_rows: int) -> Iterator[List[tuple]]:
+    # Own read-only connection: a long export must not hold a request pool slot
+    conn = psycopg2.connect(**body_metrics.DB_CONFIG)
+    try:
+        conn.set_session(readonly=True)
+        # Named cursor: rows stay on the server until fetched
+        with conn.cursor(name=f"export_{uuid.uuid4().hex[:12]}") as cur:
+            cur.itersize = batch_rows
+            cur.execute(query.sql, query.params)
+            while rows := cur.fetchmany(batch_rows):
+                yield rows
+    finally:
+        conn.close()
+
+
+def _history_rows(query: Query, batch_rows: int) -> Iterator[List[tuple]]:
+    # Read-only and outside history_store's lock: WAL lets appends go on meanwhile
+    uri = Path(history_store.HISTORY_DB_PATH).resolve().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    try:
+        cur = conn.execute(query.sql, query.params)
+        while rows := cur.fetchmany(batch_rows):
+            yield rows
+    finally:
+        conn.close()
+
+
+def _array(values, type_: "pa.DataType") -> "pa.Array":
+    import pyarrow as pa
+
+    if pa.types.is_date32(type_):
+        # SQLite hands dates back as ISO text
+        return pa.array(values, pa.string()).cast(type_)
+    return pa.array(values, type_)
+
+
+def to_batch(rows: List[tuple], schema: "pa.Schema") -> "pa.RecordBatch":
+    import pyarrow as pa
+
+    columns = list(zip(*rows))
+    return pa.RecordBatch.from_arrays(
+        [_array(values, field.type) for values, field in zip(columns, schema)], schema=schema
+    )
+
+
+def iter_batches(query: Query, batch_rows: Optional[int] = None) -> Iterator["pa.RecordBatch"]:
+    """Record batches of at most batch_rows rows; the connection closes with the iterator"""
+    batch_rows = batch_rows or EXPORT_BATCH_ROWS
+    read = _postgres_rows if query.source.database == "postgres" else _history_rows
+    for rows in read(query, batch_rows):
+        yield to_batch(rows, query.schema)
+
+# ========================
+# Writing
+# ========================
+
+def _writer(sink, schema: "pa.Schema", fmt: str):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if fmt == "parquet":
+        return pq.ParquetWriter(sink, schema, compression="zstd")
+    if fmt == "arrow":
+        return pa.ipc.new_stream(sink, schema)
+    raise ValueError(f"Invalid format {fmt!r}. Allowed: {', '.join(EXPORT_FORMATS)}")
+
+
+def write(batches: Iterable["pa.RecordBatch"], schema: "pa.Schema", sink, fmt: str) -> int:
+    """Write batches to a path or binary file one at a time; returns the row count"""
+    rows = 0
+    with _writer(sink, schema, fmt) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
+
+
+class _Chunks:
+    """Write-only file object whose bytes are handed out as they arrive"""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def stream(batches: Iterable["pa.RecordBatch"], schema: "pa.Schema", fmt: str) -> Iterator[bytes]:
+    """The encoded file as chunks, about one record batch each, for a streaming response"""
+    import pyarrow as pa
+
+    chunks = _Chunks()
+    with _writer(pa.PythonFile(chunks, mode="w"), schema, fmt) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            data = chunks.take()
+            if data:
+                yield data
+    data = chunks.take()
+    if data:
+        yield data
@@ -1,14 +1,73 @@
 import io
-from typing import Literal
+from contextlib import contextmanager
+from typing import Iterator, List, Literal
 
-from app.services.pdf_parser import extract_text_from_pdf_bytes
-from app.services.ocr_service import extract_text_from_image_bytes
+from app.services import extraction_cache
+from app.services.pdf_parser import (
+    EXTRACTOR_VERSION as PDF_EXTRACTOR_VERSION,
+    PDF_ENGINE,
+    PageStream,
+    extract_pages_from_pdf_bytes,
+    open_pdf_pages,
+)
+from app.services.ocr_service import extract_text_from_image_bytes, extractor_version as ocr_extractor_version
+from app.utils.metrics import EXTRACT_SECONDS, timed
 
 Ext = Literal["pdf", "jpg", "jpeg", "png"]
 
-def extract_text_from_upload(ext: Ext, data: bytes) -> str:
+def _extract_pages(ext: Ext, data: bytes) -> List[str]:
     if ext == "pdf":
-        return extract_text_from_pdf_bytes(data)
+        with timed(EXTRACT_SECONDS, PDF_ENGINE):
+            return extract_pages_from_pdf_bytes(data)
     else:
-        return extract_text_from_image_bytes(data)
+        with timed(EXTRACT_SECONDS, "tesseract"):
+            return [extract_text_from_image_bytes(data)]
+
+def _cache_key(ext: Ext, data: bytes) -> str:
+    version = PDF_EXTRACTOR_VERSION if ext == "pdf" else ocr_extractor_version()
+    return extraction_cache.cache_key(data, version)
+
+def extract_pages_from_upload(ext: Ext, data: bytes) -> List[str]:
+    """
+    Per-page text, served from the on-disk extraction cache when this exact
+    document was already extracted by the same extractor version.
+    """
+    if not extraction_cache.enabled():
+        return _extract_pages(ext, data)
+    key = _cache_key(ext, data)
+    pages = extraction_cache.get(key)
+    if pages is None:
+        pages = _extract_pages(ext, data)
+        extraction_cache.put(key, pages)
+    return pages
+
+@contextmanager
+def open_upload_pages(ext: Ext, data: bytes) -> Iterator[PageStream]:
+    """
+    Like extract_pages_from_upload, but PDF pages are extracted lazily as the
+    caller iterates. A fresh extraction is cached only if every page was read.
+    """
+    if ext != "pdf":
+        pages = extract_pages_from_upload(ext, data)
+        yield PageStream(len(pages), iter(pages))
+        return
+    key = _cache_key(ext, data) if extraction_cache.enabled() else None
+    pages = extraction_cache.get(key) if key else None
+    if pages is not None:
+        yield PageStream(len(pages), iter(pages))
+        return
 
+    read = []
+
+    def collect(stream):
+        for text in stream:
+            read.append(text)
+            yield text
+
+    with timed(EXTRACT_SECONDS, PDF_ENGINE), open_pdf_pages(data) as stream:
+        yield PageStream(stream.count, collect(stream.pages))
+    if key and len(read) == stream.count:
+        extraction_cache.put(key, read)
+
+def extract_text_from_upload(ext: Ext, data: bytes) -> str:
+    return "\n".join(t for t in extract_pages_from_upload(ext, data) if t)
@@ -0,0 +1,165 @@
+import hashlib
+import logging
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import List, Optional
+
+from app.utils.metrics import record_cache
+
+logger = logging.getLogger("extraction_cache")
+
+# ========================
+# Configuration
+# ========================
+
+# Empty disables the cache
+EXTRACT_CACHE_DIR = os.getenv("EXTRACT_CACHE_DIR", "")
+EXTRACT_CACHE_MAX_BYTES = int(float(os.getenv("EXTRACT_CACHE_MAX_MB", "512")) * 1024 * 1024)
+# Evict down to this fraction of the limit so eviction scans stay rare
+EVICT_TO_FRACTION = 0.9
+ZLIB_LEVEL = 6
+
+MAGIC = b"EXC1"
+COUNT = struct.Struct(">I")
+
+_lock = threading.Lock()
+# Bytes on disk as seen by this process; None until first measured
+_total_bytes = None
+
+# ========================
+# Keys and paths
+# ========================
+
+def cache_key(data: bytes, extractor_version: str) -> str:
+    """Document hash salted with the extractor version: upgrades invalidate naturally"""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(extractor_version.encode())
+    h.update(b"\0")
+    h.update(data)
+    return h.hexdigest()
+
+
+def _path(key: str) -> Path:
+    return Path(EXTRACT_CACHE_DIR) / key[:2] / f"{key}.pages"
+
+# ========================
+# Encoding
+# ========================
+
+def encode_pages(pages: List[str]) -> bytes:
+    """MAGIC, page count, then length-prefixed zlib blobs, one per page"""
+    parts = [MAGIC, COUNT.pack(len(pages))]
+    for page in pages:
+        blob = zlib.compress(page.encode("utf-8"), ZLIB_LEVEL)
+        parts.append(COUNT.pack(len(blob)))
+        parts.append(blob)
+    return b"".join(parts)
+
+
+def decode_pages(raw: bytes) -> List[str]:
+    if raw[:4] != MAGIC:
+        raise ValueError("bad magic")
+    (count,) = COUNT.unpack_from(raw, 4)
+    pos = 4 + COUNT.size
+    pages = []
+    for _ in range(count):
+        (length,) = COUNT.unpack_from(raw, pos)
+        pos += COUNT.size
+        pages.append(zlib.decompress(raw[pos:pos + length]).decode("utf-8"))
+        pos += length
+    return pages
+
+# ========================
+# Cache
+# ========================
+
+def enabled() -> bool:
+    return bool(EXTRACT_CACHE_DIR)
+
+
+def get(key: str) -> Optional[List[str]]:
+    """Cached pages, or None. A hit refreshes the entry's mtime, which eviction uses as LRU order."""
+    path = _path(key)
+    try:
+        raw = path.read_bytes()
+        pages = decode_pages(raw)
+    except FileNotFoundError:
+        record_cache("extract", False)
+        return None
+    except (OSError, ValueError, struct.error, zlib.error) as e:
+        logger.warning("Dropping unreadable cache entry %s: %s", path.name, e)
+        path.unlink(missing_ok=True)
+        record_cache("extract", False)
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    record_cache("extract", True)
+    return pages
+
+
+def put(key: str, pages: List[str]):
+    global _total_bytes
+    path = _path(key)
+    raw = encode_pages(pages)
+    try:
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".tmp{os.getpid()}.{threading.get_ident()}")
+        tmp.write_bytes(raw)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("Failed to write extraction cache entry: %s", e)
+        return
+    with _lock:
+        if _total_bytes is None:
+            _total_bytes = _disk_usage()
+        else:
+            _total_bytes += len(raw)
+        if _total_bytes > EXTRACT_CACHE_MAX_BYTES:
+            _total_bytes = _evict(int(EXTRACT_CACHE_MAX_BYTES * EVICT_TO_FRACTION))
+
+
+def _entries():
+    root = Path(EXTRACT_CACHE_DIR)
+    if not root.exists():
+        return []
+    entries = []
+    for path in root.glob("*/*.pages"):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    return entries
+
+
+def _disk_usage() -> int:
+    return sum(size for _, size, _ in _entries())
+
+
+def _evict(target_bytes: int) -> int:
+    """Delete least recently used entries until the cache fits; returns the new size"""
+    entries = sorted(_entries(), key=lambda e: e[0])
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in entries:
+        if total <= target_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    if removed:
+        logger.info("Evicted %s extraction cache entries, %s bytes left", removed, total)
+    return total
+
+
+def clear():
+    global _total_bytes
+    with _lock:
+        for _, _, path in _entries():
+            path.unlink(missing_ok=True)
+        _total_bytes = 0
@@ -0,0 +1,285 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from app.schemas.analysis import AnalysisResult, Parameter
+from app.services.analytes import normalize_name, resolve
+
+# ========================
+# Configuration
+# ========================
+
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "history/history.sqlite3")
+
+# ========================
+# Connection
+# ========================
+
+_conn = None
+_lock = threading.Lock()
+
+
+def _open(path: str) -> sqlite3.Connection:
+    if path != ":memory:":
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    ensure_schema(conn)
+    return conn
+
+
+def _open_shared():
+    """Open the shared writer connection if needed; caller holds _lock"""
+    global _conn
+    if _conn is None:
+        _conn = _open(HISTORY_DB_PATH)
+
+
+@contextmanager
+def get_connection():
+    """
+    The process-wide connection inside a transaction. SQLite allows one writer
+    anyway, so a lock around a single connection beats a pool here.
+    """
+    with _lock:
+        _open_shared()
+        _conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield _conn
+            _conn.execute("COMMIT")
+        except Exception:
+            _conn.execute("ROLLBACK")
+            raise
+
+
+@contextmanager
+def read_connection():
+    """
+    A connection of its own in a plain (deferred) read transaction: no lock and
+    no write reservation, and under WAL it reads a consistent snapshot while
+    appends go on.
+    """
+    if HISTORY_DB_PATH == ":memory:":
+        # Only the shared connection sees an in-memory database
+        with get_connection() as conn:
+            yield conn
+        return
+    if _conn is None:
+        # First use creates the file and schema
+        with _lock:
+            _open_shared()
+    conn = sqlite3.connect(HISTORY_DB_PATH, check_same_thread=False, isolation_level=None)
+    try:
+        conn.execute("BEGIN")
+        yield conn
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def reset_connection(path: Optional[str] = None):
+    """Reopen on another database file; used by tests"""
+    global _conn, HISTORY_DB_PATH
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+        if path is not None:
+            HISTORY_DB_PATH = path
+
+# ========================
+# Schema
+# ========================
+
+def ensure_schema(conn: sqlite3.Connection):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY,
+            patient_id TEXT NOT NULL,
+            report_date TEXT NOT NULL,
+            filename TEXT,
+            abnormal_count INTEGER NOT NULL,
+            risk_level TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS reports_patient_date ON reports (patient_id, report_date);
+
+        CREATE TABLE IF NOT EXISTS measurements (
+            id INTEGER PRIMARY KEY,
+            report_id INTEGER NOT NULL REFERENCES reports (id) ON DELETE CASCADE,
+            patient_id TEXT NOT NULL,
+            analyte TEXT NOT NULL,
+            report_date TEXT NOT NULL,
+            value REAL NOT NULL,
+            unit TEXT,
+            status TEXT NOT NULL,
+            delta REAL
+        );
+        CREATE INDEX IF NOT EXISTS measurements_series
+            ON measurements (patient_id, analyte, report_date, id);
+
+        -- Newest value per patient and analyte: appending a report only has to
+        -- read these rows to compute its deltas
+        CREATE TABLE IF NOT EXISTS latest_values (
+            patient_id TEXT NOT NULL,
+            analyte TEXT NOT NULL,
+            report_date TEXT NOT NULL,
+            measurement_id INTEGER NOT NULL,
+            value REAL NOT NULL,
+            unit TEXT,
+            status TEXT NOT NULL,
+            delta REAL,
+            PRIMARY KEY (patient_id, analyte)
+        ) WITHOUT ROWID;
+    """)
+
+
+def analyte_key(name: str) -> str:
+    """Series key: the knowledge base name when known, else the normalized report name"""
+    analyte = resolve(name)
+    return normalize_name(analyte.name if analyte else name)
+
+
+def _measurement(param: Parameter):
+    """
+    (analyte, value, unit) in canonical units where the knowledge base allows;
+    otherwise as reported, so one series can hold several units
+    """
+    if param.canonical_value is not None:
+        return analyte_key(param.canonical_name), param.canonical_value, param.canonical_unit
+    if param.numeric_value is not None and param.name:
+        return analyte_key(param.name), param.numeric_value, param.unit or None
+    return None
+
+# ========================
+# Incremental append
+# ========================
+
+UPSERT_LATEST_SQL = """
+    INSERT INTO latest_values (patient_id, analyte, report_date, measurement_id, value, unit, status, delta)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (patient_id, analyte) DO UPDATE SET
+        report_date = excluded.report_date,
+        measurement_id = excluded.measurement_id,
+        value = excluded.value,
+        unit = excluded.unit,
+        status = excluded.status,
+        delta = excluded.delta
+"""
+
+
+def _delta(value, unit, previous_value, previous_unit):
+    """Change from the previous value; None across units, which are not comparable"""
+    return value - previous_value if unit == previous_unit else None
+
+
+def _backdated_delta(conn, patient_id, analyte, report_date, value, unit):
+    """
+    A report older than the latest stored one: take the delta from the value
+    just before it, and re-point the delta of the value just after it.
+    Both are single index seeks on measurements_series.
+    """
+    prev = conn.execute("""
+        SELECT value, unit FROM measurements
+        WHERE patient_id = ? AND analyte = ? AND report_date <= ?
+        ORDER BY report_date DESC, id DESC LIMIT 1
+    """, (patient_id, analyte, report_date)).fetchone()
+    nxt = conn.execute("""
+        SELECT id, value, unit FROM measurements
+        WHERE patient_id = ? AND analyte = ? AND report_date > ?
+        ORDER BY report_date, id LIMIT 1
+    """, (patient_id, analyte, report_date)).fetchone()
+    if nxt is not None:
+        next_delta = _delta(nxt[1], nxt[2], value, unit)
+        conn.execute("UPDATE measurements SET delta = ? WHERE id = ?", (next_delta, nxt[0]))
+        conn.execute(
+            "UPDATE latest_values SET delta = ? WHERE patient_id = ? AND analyte = ? AND measurement_id = ?",
+            (next_delta, patient_id, analyte, nxt[0]),
+        )
+    return None if prev is None else _delta(value, unit, prev[0], prev[1])
+
+
+def append_report(patient_id: str, report_date: date, result: AnalysisResult,
+                  filename: Optional[str] = None) -> int:
+    """
+    Store one analyzed report and its numeric parameters; returns the report id.
+    Deltas are computed against latest_values, not by rescanning the history.
+    """
+    day = report_date.isoformat()
+    with get_connection() as conn:
+        report_id = conn.execute(
+            "INSERT INTO reports (patient_id, report_date, filename, abnormal_count, risk_level, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (patient_id, day, filename, result.summary.abnormal_count, result.summary.risk_level,
+             datetime.now(timezone.utc).isoformat()),
+        ).lastrowid
+        latest = {
+            row[0]: row[1:]
+            for row in conn.execute(
+                "SELECT analyte, report_date, value, unit FROM latest_values WHERE patient_id = ?", (patient_id,)
+            )
+        }
+        for param in result.parameters:
+            measurement = _measurement(param)
+            if measurement is None:
+                continue
+            analyte, value, unit = measurement
+            current = latest.get(analyte)
+            is_newest = current is None or day >= current[0]
+            if current is None:
+                delta = None
+            elif is_newest:
+                delta = _delta(value, unit, current[1], current[2])
+            else:
+                delta = _backdated_delta(conn, patient_id, analyte, day, value, unit)
+            measurement_id = conn.execute(
+                "INSERT INTO measurements (report_id, patient_id, analyte, report_date, value, unit, status, delta) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (report_id, patient_id, analyte, day, value, unit, param.status, delta),
+            ).lastrowid
+            if is_newest:
+                conn.execute(UPSERT_LATEST_SQL, (patient_id, analyte, day, measurement_id, value, unit, param.status, delta))
+                # A report may list the same analyte twice; chain within it too
+                latest[analyte] = (day, value, unit)
+    return report_id
+
+# ========================
+# Queries
+# ========================
+
+def query_series(patient_id: str, analyte: str, start: Optional[date] = None, end: Optional[date] = None):
+    """Time series of one analyte, oldest first; covered by measurements_series"""
+    sql = "SELECT report_date, value, unit, status, delta, report_id FROM measurements WHERE patient_id = ? AND analyte = ?"
+    params = [patient_id, analyte]
+    if start is not None:
+        sql += " AND report_date >= ?"
+        params.append(start.isoformat())
+    if end is not None:
+        sql += " AND report_date <= ?"
+        params.append(end.isoformat())
+    sql += " ORDER BY report_date, id"
+    with read_connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [
+        {"report_date": r[0], "value": r[1], "unit": r[2], "status": r[3], "delta": r[4], "report_id": r[5]}
+        for r in rows
+    ]
+
+
+def query_latest(patient_id: str):
+    with read_connection() as conn:
+        rows = conn.execute(
+            "SELECT analyte, report_date, value, unit, status, delta FROM latest_values "
+            "WHERE patient_id = ? ORDER BY analyte",
+            (patient_id,),
+        ).fetchall()
+    return [
+        {"analyte": r[0], "report_date": r[1], "value": r[2], "unit": r[3], "status": r[4], "delta": r[5]}
+        for r in rows
+    ]
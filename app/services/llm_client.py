@@ -1,7 +1,23 @@
+import hashlib
 import os
+import tempfile
 import time
 import requests
 import logging
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from app.utils import host_semaphore
+from app.utils.metrics import (
+    LLM_FAILURES,
+    LLM_IN_FLIGHT,
+    LLM_REQUEST_SECONDS,
+    LLM_HOST_SLOT_WAIT_SECONDS,
+    OLLAMA_DURATION_SECONDS,
+    OLLAMA_TOKENS,
+    stage_timer,
+    timed,
+)
 
 logger = logging.getLogger("llm_client")
 
@@ -10,14 +26,38 @@ logger = logging.getLogger("llm_client")
 # ========================
 
 MODEL = os.getenv("OLLAMA_MODEL", "mistral")
+# Cascade mode: when set, this (small) model answers first and MODEL only
+# gets the reports whose fast answer scores below CASCADE_MIN_SCORE
+FAST_MODEL = os.getenv("OLLAMA_FAST_MODEL", "")
+CASCADE_MIN_SCORE = float(os.getenv("CASCADE_MIN_SCORE", "0.85"))
 OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434")
 
 OLLAMA_TEMPERATURE = float(os.getenv("OLLAMA_TEMPERATURE", "0.0"))
 OLLAMA_NUM_PREDICT = int(os.getenv("OLLAMA_NUM_PREDICT", "120"))
 OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "2048"))
+# How long Ollama keeps the model loaded after a call (Ollama's own default is 5m)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
 
 MAX_INPUT_CHARS = int(os.getenv("MAX_INPUT_CHARS", "2000"))
 LLM_TIMEOUT_SECONDS = int(os.getenv("LLM_TIMEOUT_SECONDS", "40"))
+# Loading a large model from disk can take much longer than a warm call
+LLM_WARMUP_TIMEOUT_SECONDS = int(os.getenv("LLM_WARMUP_TIMEOUT_SECONDS", "300"))
+# Ollama calls in flight per backend across every worker process on this host,
+# e.g. OLLAMA_NUM_PARALLEL: "4" for any backend or "http://gpu1:11434=4,http://gpu2:11434=2".
+# Empty disables the host-wide limit (each process is still bounded by LLM_CONCURRENCY)
+LLM_HOST_SLOTS = os.getenv("LLM_HOST_SLOTS", "")
+LLM_HOST_SLOTS_DIR = os.getenv("LLM_HOST_SLOTS_DIR", os.path.join(tempfile.gettempdir(), "llm-slots"))
+# Longest wait for a host slot before the call fails without reaching Ollama
+LLM_SLOT_WAIT_SECONDS = int(os.getenv("LLM_SLOT_WAIT_SECONDS", "120"))
+
+# Repair prompts get a generation budget proportional to the lines they cover
+REPAIR_TOKENS_PER_LINE = int(os.getenv("REPAIR_TOKENS_PER_LINE", "60"))
+REPAIR_TOKENS_OVERHEAD = 16
+
+# Weight of the latest call in the observed token rates
+RATE_ALPHA = 0.3
+# model -> (prompt tokens/s, generated tokens/s) as reported by Ollama, averaged
+_token_rates: Dict[str, Tuple[float, float]] = {}
 
 # ========================
 # Prompt
@@ -45,6 +85,14 @@ BASE_PROMPT = (
     '{"summary":{"abnormal_count":0,"risk_level":"low"},"parameters":[{"name":"","value":"","unit":"","normal_range":"","status":"","risk":null,"explanation":null}]}\n'
 )
 
+# Follow-up for the few lines a first answer missed or got wrong
+REPAIR_PROMPT = (
+    "You are a medical lab analyzer. Extract the blood test parameter on EACH line below: "
+    "name, numeric value only, unit, normal_range from the line, status normal/high/low (lowercase).\n"
+    "Return ONLY valid JSON in this format:\n"
+    '{"parameters":[{"name":"","value":"","unit":"","normal_range":"","status":""}]}\n'
+)
+
 # ========================
 # Utilities
 # ========================
@@ -57,13 +105,28 @@ def _truncate_text(text: str) -> str:
 
 
 def build_prompt(report_text: str) -> str:
-    report_text = _truncate_text(report_text)
-    return (
-        BASE_PROMPT
-        + "\nInput report text:\n---\n"
-        + report_text
-        + "\n---\nReturn ONLY the JSON object:\n"
-    )
+    with stage_timer("prompt_build"):
+        report_text = _truncate_text(report_text)
+        return (
+            BASE_PROMPT
+            + "\nInput report text:\n---\n"
+            + report_text
+            + "\n---\nReturn ONLY the JSON object:\n"
+        )
+
+
+def build_repair_prompt(lines: List[str]) -> str:
+    with stage_timer("prompt_build"):
+        return REPAIR_PROMPT + "\nLines:\n---\n" + _truncate_text("\n".join(lines)) + "\n---\nReturn ONLY the JSON object:\n"
+
+
+def answer_version() -> str:
+    """Hash of what shapes an answer besides the report: models and prompt. Salts cached answers"""
+    h = hashlib.blake2b(digest_size=16)
+    for part in (MODEL, FAST_MODEL, BASE_PROMPT):
+        h.update(part.encode())
+        h.update(b"\0")
+    return h.hexdigest()
 
 
 def _clean_llm_output(output: str) -> str:
@@ -87,57 +150,169 @@ def _clean_llm_output(output: str) -> str:
     return output.replace("\\/", "/")
 
 
+# ========================
+# Host-wide slots
+# ========================
+
+def parse_host_slots(spec: str) -> Dict[str, int]:
+    """ "4" -> {"": 4}; "url=4,url=2" -> per-backend counts ("" is the default)"""
+    slots = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        url, sep, count = part.rpartition("=")
+        slots[url.rstrip("/") if sep else ""] = int(count)
+    return slots
+
+
+_host_slot_counts = parse_host_slots(LLM_HOST_SLOTS)
+_semaphores: Dict[str, host_semaphore.HostSemaphore] = {}
+
+
+def _host_semaphore(url: str) -> Optional[host_semaphore.HostSemaphore]:
+    url = url.rstrip("/")
+    slots = _host_slot_counts.get(url, _host_slot_counts.get(""))
+    if not slots or not host_semaphore.available():
+        return None
+    if url not in _semaphores:
+        name = hashlib.blake2b(url.encode(), digest_size=8).hexdigest()
+        _semaphores[url] = host_semaphore.HostSemaphore(os.path.join(LLM_HOST_SLOTS_DIR, name), slots)
+    return _semaphores[url]
+
+
+@contextmanager
+def _host_slot(url: str, model: str):
+    """FIFO slot on this backend shared with the other worker processes"""
+    semaphore = _host_semaphore(url)
+    if semaphore is None:
+        yield
+        return
+    with timed(LLM_HOST_SLOT_WAIT_SECONDS, model):
+        try:
+            fd = semaphore.acquire(LLM_SLOT_WAIT_SECONDS)
+        except host_semaphore.SlotTimeout:
+            LLM_FAILURES.labels(model).inc()
+            raise
+    try:
+        yield
+    finally:
+        semaphore.release(fd)
+
 # ========================
 # Ollama HTTP Call
 # ========================
 
-def _call_ollama_api(prompt: str, timeout: int) -> str:
-    response = requests.post(
-        f"{OLLAMA_API_URL}/api/generate",
-        json={
-            "model": MODEL,
-            "prompt": prompt,
-            "stream": False,
-            "options": {
-                "temperature": OLLAMA_TEMPERATURE,
-                "num_predict": OLLAMA_NUM_PREDICT,
-                "num_ctx": OLLAMA_NUM_CTX,
-            }
-        },
-        timeout=timeout,
-    )
-
-    response.raise_for_status()
-    return response.json().get("response", "")
+def _record_ollama_stats(body: dict, model: str):
+    """Export Ollama's own timings (reported in nanoseconds) and token counts"""
+    for phase in ("load", "prompt_eval", "eval"):
+        ns = body.get(f"{phase}_duration")
+        if ns is not None:
+            OLLAMA_DURATION_SECONDS.labels(model, phase).observe(ns / 1e9)
+    if body.get("prompt_eval_count") is not None:
+        OLLAMA_TOKENS.labels(model, "prompt").inc(body["prompt_eval_count"])
+    if body.get("eval_count") is not None:
+        OLLAMA_TOKENS.labels(model, "eval").inc(body["eval_count"])
+    _update_token_rates(body, model)
+
+
+def _update_token_rates(body: dict, model: str):
+    rates = []
+    for phase in ("prompt_eval", "eval"):
+        count, ns = body.get(f"{phase}_count"), body.get(f"{phase}_duration")
+        if not count or not ns:
+            return
+        rates.append(count / (ns / 1e9))
+    old = _token_rates.get(model)
+    if old is not None:
+        rates = [(1 - RATE_ALPHA) * o + RATE_ALPHA * r for o, r in zip(old, rates)]
+    _token_rates[model] = (rates[0], rates[1])
+
+
+def observed_token_rates(model: str = MODEL) -> Optional[Tuple[float, float]]:
+    """(prompt, generated) tokens per second seen from Ollama for this model, if any call reported them"""
+    return _token_rates.get(model)
+
+
+def _call_ollama_api(prompt: str, timeout: int, model: str = MODEL, num_predict: Optional[int] = None) -> str:
+    # The read timeout only starts once a host slot is ours, so it measures Ollama, not the queue
+    with _host_slot(OLLAMA_API_URL, model), LLM_IN_FLIGHT.track_inprogress(), timed(LLM_REQUEST_SECONDS, model):
+        try:
+            response = requests.post(
+                f"{OLLAMA_API_URL}/api/generate",
+                json={
+                    "model": model,
+                    "prompt": prompt,
+                    "stream": False,
+                    "keep_alive": OLLAMA_KEEP_ALIVE,
+                    "options": {
+                        "temperature": OLLAMA_TEMPERATURE,
+                        "num_predict": num_predict or OLLAMA_NUM_PREDICT,
+                        "num_ctx": OLLAMA_NUM_CTX,
+                    }
+                },
+                timeout=timeout,
+            )
+            response.raise_for_status()
+        except Exception:
+            LLM_FAILURES.labels(model).inc()
+            raise
+
+    body = response.json()
+    _record_ollama_stats(body, model)
+    return body.get("response", "")
 
 
 # ========================
 # Public API
 # ========================
 
-def analyze_text_with_llm(report_text: str, max_retries: int = 1) -> str:
+def analyze_text_with_llm(report_text: str, max_retries: int = 1, model: str = MODEL) -> str:
     prompt = build_prompt(report_text)
 
     for attempt in range(max_retries + 1):
         try:
-            logger.info(f"LLM request attempt {attempt + 1}")
-            output = _call_ollama_api(prompt, LLM_TIMEOUT_SECONDS)
+            logger.info("LLM request attempt %s (%s)", attempt + 1, model)
+            output = _call_ollama_api(prompt, LLM_TIMEOUT_SECONDS, model)
             return _clean_llm_output(output)
 
         except Exception as e:
-            logger.warning(f"LLM failure attempt {attempt + 1}: {e}")
+            logger.warning("LLM failure attempt %s: %s", attempt + 1, e)
             if attempt >= max_retries:
                 raise
             time.sleep(1)
 
 
+def repair_lines_with_llm(lines: List[str], model: str = MODEL) -> str:
+    """
+    One short call for just these report lines, without retries: the caller
+    already holds a usable partial answer.
+    """
+    prompt = build_repair_prompt(lines)
+    num_predict = REPAIR_TOKENS_OVERHEAD + REPAIR_TOKENS_PER_LINE * len(lines)
+    logger.info("LLM repair request for %s lines (%s, num_predict=%s)", len(lines), model, num_predict)
+    return _clean_llm_output(_call_ollama_api(prompt, LLM_TIMEOUT_SECONDS, model, num_predict))
+
+
 # ========================
-# Warmup (optional)
+# Warmup
 # ========================
 
-def warmup_model():
+def warmup_model(model: str = MODEL) -> bool:
+    """
+    Load the model into memory without generating anything: Ollama treats a
+    generate call without a prompt as a preload and keeps the model resident
+    for OLLAMA_KEEP_ALIVE.
+    """
     try:
-        _call_ollama_api("Hello", 20)
-        logger.info("LLM warmup completed")
+        with timed(LLM_REQUEST_SECONDS, model):
+            # Same num_ctx as real calls, or Ollama reloads the model on the first one
+            response = requests.post(
+                f"{OLLAMA_API_URL}/api/generate",
+                json={"model": model, "keep_alive": OLLAMA_KEEP_ALIVE, "options": {"num_ctx": OLLAMA_NUM_CTX}},
+                timeout=LLM_WARMUP_TIMEOUT_SECONDS,
+            )
+            response.raise_for_status()
+        _record_ollama_stats(response.json(), model)
+        logger.info("LLM warmup completed (%s)", model)
+        return True
     except Exception as e:
-        logger.warning(f"LLM warmup failed: {e}")
+        logger.warning("LLM warmup failed (%s): %s", model, e)
+        return False
@@ -0,0 +1,302 @@
+"""
+Index of analyzed reports by similarity rather than bytes: a photo taken
+twice or a PDF re-exported by another system hashes differently but has a
+close SimHash of its text or dHash of its image. Fingerprints are found by
+multi-index hashing: a 64-bit hash is cut into radius + 1 chunks, so any hash
+within the radius shares at least one chunk exactly and only the rows with a
+matching chunk need a Hamming distance check.
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+from PIL import Image
+
+from app.schemas.analysis import AnalysisResult
+from app.services import llm_client
+from app.services.preprocess import iter_line_features
+from app.utils.metrics import record_cache
+
+logger = logging.getLogger("near_duplicates")
+
+# ========================
+# Configuration
+# ========================
+
+# Empty disables the index
+NEAR_DUP_INDEX_PATH = os.getenv("NEAR_DUP_INDEX_PATH", "")
+NEAR_DUP_MAX_ENTRIES = int(os.getenv("NEAR_DUP_MAX_ENTRIES", "50000"))
+# Largest Hamming distance (of 64 bits) still counted as the same report
+NEAR_DUP_TEXT_DISTANCE = int(os.getenv("NEAR_DUP_TEXT_DISTANCE", "3"))
+NEAR_DUP_IMAGE_DISTANCE = int(os.getenv("NEAR_DUP_IMAGE_DISTANCE", "5"))
+# Evict down to this fraction of the limit so eviction runs stay rare
+EVICT_TO_FRACTION = 0.9
+
+HASH_BITS = 64
+WORD_PATTERN = re.compile(r"[a-z]+|\d+(?:[.,]\d+)?")
+# Words, numbers and single symbols (units like "/", "%", "^"; "+" grades) of a result line
+LINE_TOKEN_PATTERN = re.compile(r"[a-z]+|\d+(?:[.,]\d+)?|[^\sa-z\d]")
+# Results reported as words rather than numbers
+QUALITATIVE_WORDS = frozenset({
+    "negative", "positive", "nil", "absent", "present", "trace", "reactive", "nonreactive",
+    "detected", "seen", "normal", "abnormal", "clear", "turbid",
+})
+
+_conn = None
+_lock = threading.Lock()
+# Entries in the index as seen by this process; None until first counted
+_entries = None
+
+
+class Fingerprint(NamedTuple):
+    # SimHash of the compressed text
+    text: int
+    # dHash of the uploaded image; None for PDFs
+    image: Optional[int]
+    # Digest of the normalized result lines; a match must have the same results
+    values: str
+
+# ========================
+# Hashes
+# ========================
+
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big")
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash over word pairs, weighted by count"""
+    words = WORD_PATTERN.findall(text.lower())
+    features = Counter(zip(words, words[1:])) if len(words) > 1 else Counter(words)
+    weights = [0] * HASH_BITS
+    for feature, count in features.items():
+        h = _feature_hash(" ".join(feature) if isinstance(feature, tuple) else feature)
+        for bit in range(HASH_BITS):
+            weights[bit] += count if h >> bit & 1 else -count
+    return sum(1 << bit for bit, w in enumerate(weights) if w > 0)
+
+
+def image_hash(data: bytes) -> Optional[int]:
+    """64-bit dHash: brightness gradients of a 9x8 grayscale thumbnail. None if not an image"""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            small = img.convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    except Exception:
+        return None
+    pixels = small.tobytes()
+    h = 0
+    for row in range(8):
+        for col in range(8):
+            h = h << 1 | (pixels[row * 9 + col] < pixels[row * 9 + col + 1])
+    return h
+
+
+def _normalized_line(line: str) -> str:
+    """Token by token, so spacing and decimal commas do not count but names, units and words do"""
+    return " ".join(t.replace(",", ".") for t in LINE_TOKEN_PATTERN.findall(line.lower()))
+
+
+def value_digest(text: str) -> str:
+    """
+    The whole result lines (name, value, unit, qualitative result), normalized
+    and order-independent. Two reports whose text is near-identical but whose
+    results differ (an amended value, a flipped "Negative", another unit)
+    must not share a result, and this is cheap to check on every candidate.
+    """
+    lines = sorted(
+        _normalized_line(f.text) for f in iter_line_features(text)
+        if f.is_candidate or QUALITATIVE_WORDS.intersection(WORD_PATTERN.findall(f.text.lower()))
+    )
+    return hashlib.blake2b("\n".join(lines).encode(), digest_size=16).hexdigest()
+
+
+def fingerprint(text: str, image: Optional[int] = None) -> Fingerprint:
+    """Fingerprint of the compressed text, with the upload's image_hash if it was an image"""
+    return Fingerprint(simhash(text), image, value_digest(text))
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _chunks(h: int, parts: int) -> List[int]:
+    """h cut into `parts` chunks of (nearly) equal width"""
+    chunks, start = [], 0
+    for i in range(parts):
+        width = HASH_BITS // parts + (i < HASH_BITS % parts)
+        chunks.append(h >> start & ((1 << width) - 1))
+        start += width
+    return chunks
+
+
+def _signed(h: int) -> int:
+    # SQLite integers are signed 64-bit
+    return h - (1 << HASH_BITS) if h >= 1 << (HASH_BITS - 1) else h
+
+
+def _unsigned(h: int) -> int:
+    return h + (1 << HASH_BITS) if h < 0 else h
+
+# ========================
+# Connection
+# ========================
+
+def _open(path: str) -> sqlite3.Connection:
+    if path != ":memory:":
+        Path(path).parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY,
+            answer_version TEXT NOT NULL,
+            value_digest TEXT NOT NULL,
+            result TEXT NOT NULL,
+            created REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS chunks (
+            kind TEXT NOT NULL,
+            part INTEGER NOT NULL,
+            chunk INTEGER NOT NULL,
+            report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+            hash INTEGER NOT NULL,
+            PRIMARY KEY (kind, part, chunk, report_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_chunks_report ON chunks (report_id);
+    """)
+    return conn
+
+
+def _connection() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        _conn = _open(NEAR_DUP_INDEX_PATH)
+    return _conn
+
+
+def reset_connection(path: Optional[str] = None):
+    """Reopen on another database file; used by tests"""
+    global _conn, _entries, NEAR_DUP_INDEX_PATH
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+        _entries = None
+        if path is not None:
+            NEAR_DUP_INDEX_PATH = path
+
+# ========================
+# Index
+# ========================
+
+def enabled() -> bool:
+    return bool(NEAR_DUP_INDEX_PATH)
+
+
+def _radius(kind: str) -> int:
+    return NEAR_DUP_TEXT_DISTANCE if kind == "text" else NEAR_DUP_IMAGE_DISTANCE
+
+
+def _hashes(fp: Fingerprint) -> List[Tuple[str, int]]:
+    return [(kind, h) for kind, h in (("text", fp.text), ("image", fp.image)) if h is not None]
+
+
+def _candidates(conn: sqlite3.Connection, kind: str, h: int) -> List[Tuple[int, int]]:
+    """(distance, report id) of the indexed hashes of this kind within the radius"""
+    radius = _radius(kind)
+    found = {}
+    for part, chunk in enumerate(_chunks(h, radius + 1)):
+        rows = conn.execute(
+            "SELECT report_id, hash FROM chunks WHERE kind = ? AND part = ? AND chunk = ?",
+            (kind, part, chunk),
+        )
+        for report_id, other in rows:
+            distance = hamming(h, _unsigned(other))
+            if distance <= radius:
+                found[report_id] = distance
+    return [(d, report_id) for report_id, d in found.items()]
+
+
+def find(fp: Fingerprint) -> Optional[AnalysisResult]:
+    """
+    Stored result of the closest indexed report whose text or image is within
+    the radius and whose result lines carry the same values, or None.
+    """
+    try:
+        with _lock:
+            conn = _connection()
+            candidates = sorted(c for kind, h in _hashes(fp) for c in _candidates(conn, kind, h))
+            version = llm_client.answer_version()
+            for distance, report_id in candidates:
+                row = conn.execute(
+                    "SELECT result FROM reports WHERE id = ? AND answer_version = ? AND value_digest = ?",
+                    (report_id, version, fp.values),
+                ).fetchone()
+                if row is not None:
+                    logger.info("Near-duplicate of report %s (distance %s)", report_id, distance)
+                    record_cache("near_duplicate", True)
+                    return AnalysisResult.model_validate_json(row[0])
+    except (sqlite3.Error, ValueError) as e:
+        logger.warning("Near-duplicate lookup failed: %s", e)
+    record_cache("near_duplicate", False)
+    return None
+
+
+def add(fp: Fingerprint, result: AnalysisResult):
+    global _entries
+    try:
+        with _lock:
+            conn = _connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                report_id = conn.execute(
+                    "INSERT INTO reports (answer_version, value_digest, result, created) VALUES (?, ?, ?, ?)",
+                    (llm_client.answer_version(), fp.values, result.model_dump_json(), time.time()),
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO chunks (kind, part, chunk, report_id, hash) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (kind, part, chunk, report_id, _signed(h))
+                        for kind, h in _hashes(fp)
+                        for part, chunk in enumerate(_chunks(h, _radius(kind) + 1))
+                    ],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if _entries is None:
+                _entries = conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+            else:
+                _entries += 1
+            if _entries > NEAR_DUP_MAX_ENTRIES:
+                _entries = _evict(conn, int(NEAR_DUP_MAX_ENTRIES * EVICT_TO_FRACTION))
+    except sqlite3.Error as e:
+        logger.warning("Failed to index report for near-duplicate lookup: %s", e)
+
+
+def _evict(conn: sqlite3.Connection, target: int) -> int:
+    """Delete the oldest reports down to target entries; returns the new count"""
+    total = conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+    if total > target:
+        conn.execute("DELETE FROM reports WHERE id IN (SELECT id FROM reports ORDER BY id LIMIT ?)", (total - target,))
+        logger.info("Evicted %s near-duplicate index entries, %s left", total - target, target)
+        total = target
+    return total
+
+
+def clear():
+    global _entries
+    with _lock:
+        _connection().execute("DELETE FROM reports")
+        _entries = 0
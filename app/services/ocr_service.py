@@ -1,7 +1,24 @@
 import io
 from typing import Optional
 from PIL import Image
-import pytesseract
+
+from app.utils.metrics import EXTRACT_PAGE_SECONDS, timed
+
+
+# pytesseract is imported on first use: it pulls in pandas whenever that is
+# installed (~0.35 s and tens of MB), which API startup should not pay for
+
+_extractor_version = None
+
+
+def extractor_version() -> str:
+    """tesseract binary version; part of the extraction cache key (one subprocess, then cached)"""
+    global _extractor_version
+    if _extractor_version is None:
+        import pytesseract
+
+        _extractor_version = f"tesseract-{pytesseract.get_tesseract_version()}-1"
+    return _extractor_version
 
 def extract_text_from_image_bytes(data: bytes) -> str:
     try:
@@ -11,6 +28,9 @@ def extract_text_from_image_bytes(data: bytes) -> str:
     # Convert to RGB to avoid mode issues
     if img.mode not in ("RGB", "L"):
         img = img.convert("RGB")
-    text = pytesseract.image_to_string(img)
+    import pytesseract
+
+    with timed(EXTRACT_PAGE_SECONDS, "tesseract"):
+        text = pytesseract.image_to_string(img)
     return text or ""
 
@@ -1,15 +1,128 @@
 import io
+import os
+from contextlib import contextmanager
+from typing import Iterator, List, NamedTuple
 import pdfplumber
 
-def extract_text_from_pdf_bytes(data: bytes) -> str:
-    text_parts = []
+from app.services.table_extract import page_to_text
+from app.utils.metrics import EXTRACT_PAGE_SECONDS, timed
+
+# "pdfplumber" (default; result grids come out as table rows) or "pymupdf" (faster, plain text only)
+PDF_ENGINE = os.getenv("PDF_ENGINE", "pdfplumber")
+
+# Bump the suffix when the extraction logic changes; part of the cache key
+if PDF_ENGINE == "pymupdf":
+    import pymupdf
+
+    EXTRACTOR_VERSION = f"pymupdf-{pymupdf.VersionBind}-1"
+else:
+    EXTRACTOR_VERSION = f"pdfplumber-{pdfplumber.__version__}-2"
+
+# Per-document extraction budgets; each bounds what one document can make the worker hold (0 disables)
+# Pages in the document, checked before any page is parsed
+EXTRACT_MAX_PAGES = int(os.getenv("EXTRACT_MAX_PAGES", "1000"))
+# Layout objects (chars, rects, lines, curves, images) pdfplumber may build for one page
+EXTRACT_MAX_PAGE_OBJECTS = int(os.getenv("EXTRACT_MAX_PAGE_OBJECTS", "200000"))
+# Characters of extracted text across the pages read so far
+EXTRACT_MAX_CHARS = int(os.getenv("EXTRACT_MAX_CHARS", "5000000"))
+
+
+class DocumentTooLarge(Exception):
+    """The document exceeds one of the EXTRACT_MAX_* budgets"""
+
+
+class PageStream(NamedTuple):
+    count: int
+    # Page texts, extracted as they are consumed
+    pages: Iterator[str]
+
+
+def _check_pages(count: int):
+    if EXTRACT_MAX_PAGES and count > EXTRACT_MAX_PAGES:
+        raise DocumentTooLarge(f"{count} pages (limit {EXTRACT_MAX_PAGES})")
+
+
+def _check_objects(page):
+    # page.objects is the parsed layout every later step (words, tables, text) works from
+    if EXTRACT_MAX_PAGE_OBJECTS:
+        count = sum(len(objs) for objs in page.objects.values())
+        if count > EXTRACT_MAX_PAGE_OBJECTS:
+            raise DocumentTooLarge(
+                f"page {page.page_number} has {count} layout objects (limit {EXTRACT_MAX_PAGE_OBJECTS})"
+            )
+
+
+class _CharBudget:
+    """Running total of extracted characters for one document"""
+
+    def __init__(self):
+        self.used = 0
+
+    def take(self, text: str, page_number: int):
+        self.used += len(text)
+        if EXTRACT_MAX_CHARS and self.used > EXTRACT_MAX_CHARS:
+            raise DocumentTooLarge(
+                f"{self.used} characters of text by page {page_number} (limit {EXTRACT_MAX_CHARS})"
+            )
+
+
+def _iter_pages(pdf) -> Iterator[str]:
+    budget = _CharBudget()
+    for page in pdf.pages:
+        try:
+            with timed(EXTRACT_PAGE_SECONDS, "pdfplumber"):
+                _check_objects(page)
+                # Same text as extract_text(), with result grids as "name | value | unit | range"
+                text = page_to_text(page)
+        except DocumentTooLarge:
+            raise
+        except Exception:
+            # Skip problematic pages
+            text = ""
+        finally:
+            # Drop the page's cached chars, words and layout before the next one
+            page.close()
+        budget.take(text, page.page_number)
+        yield text
+
+
+def _iter_pymupdf_pages(doc) -> Iterator[str]:
+    budget = _CharBudget()
+    for number in range(doc.page_count):
+        try:
+            with timed(EXTRACT_PAGE_SECONDS, "pymupdf"):
+                text = doc.load_page(number).get_text(sort=True)
+        except Exception:
+            text = ""
+        budget.take(text, number + 1)
+        yield text
+
+
+@contextmanager
+def open_pdf_pages(data: bytes) -> Iterator[PageStream]:
+    """
+    Page count plus a lazy page-text iterator. Each page's layout caches are
+    released as soon as its text is out, and the document is closed when the
+    block exits, so a consumer that stops early skips the remaining pages.
+    Raises DocumentTooLarge when the document breaks one of its own
+    EXTRACT_MAX_* budgets (page count up front, layout objects per page,
+    text characters so far), so concurrent extractions never count against
+    each other.
+    """
+    if PDF_ENGINE == "pymupdf":
+        with pymupdf.open(stream=data, filetype="pdf") as doc:
+            _check_pages(doc.page_count)
+            yield PageStream(doc.page_count, _iter_pymupdf_pages(doc))
+        return
     with pdfplumber.open(io.BytesIO(data)) as pdf:
-        for page in pdf.pages:
-            try:
-                text = page.extract_text() or ""
-                text_parts.append(text)
-            except Exception:
-                # Skip problematic pages
-                continue
-    return "\n".join(t for t in text_parts if t)
+        _check_pages(len(pdf.pages))
+        yield PageStream(len(pdf.pages), _iter_pages(pdf))
 
+
+def extract_pages_from_pdf_bytes(data: bytes) -> List[str]:
+    """Text per page; pages that fail to extract are kept as empty strings"""
+    with open_pdf_pages(data) as stream:
+        return list(stream.pages)
+
+def extract_text_from_pdf_bytes(data: bytes) -> str:
+    return "\n".join(t for t in extract_pages_from_pdf_bytes(data) if t)
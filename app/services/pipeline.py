@@ -0,0 +1,578 @@
+import contextvars
+import io
+import json
+import logging
+import os
+import time
+import zipfile
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from pydantic import ValidationError
+
+from app.schemas.analysis import AnalysisResult
+from app.services import admission, near_duplicates, section_cache
+from app.services.admission import LLM_CONCURRENCY, Overloaded, Ticket
+from app.services.analytes import normalize_result
+from app.services.extract_text import open_upload_pages
+from app.services.llm_client import (
+    CASCADE_MIN_SCORE,
+    FAST_MODEL,
+    MODEL,
+    analyze_text_with_llm,
+    repair_lines_with_llm,
+)
+from app.services.pdf_parser import DocumentTooLarge
+from app.services.preprocess import compress_report_pages, compress_report_text
+from app.services.result_check import (
+    INVALID,
+    Score,
+    merge_parameters,
+    result_lines,
+    score_result,
+    source_lines,
+    unmatched_lines,
+    usable,
+    validate_items,
+)
+from app.services.section_cache import section_key, split_sections
+from app.services.table_extract import table_result
+from app.utils.json_safe import parse_json_safe, salvage_array_items
+from app.utils.logging_setup import log_payload
+from app.utils.metrics import (
+    ANALYZE_IN_FLIGHT,
+    ANALYZE_RESULTS,
+    CASCADE_ESCALATIONS,
+    CASCADE_SCORE,
+    LLM_REPAIR_LINES,
+    LLM_REPAIRS,
+    LLM_TIER_RESULTS,
+    LLM_TIER_SECONDS,
+    stage_timer,
+    timed,
+)
+
+logger = logging.getLogger("pipeline")
+
+# ========================
+# Configuration
+# ========================
+
+MAX_SIZE_BYTES = 10 * 1024 * 1024
+ALLOWED_EXTS = {"pdf", "jpg", "jpeg", "png"}
+COMPRESS_MAX_CHARS = 3000
+# Documents up to this many pages are read whole (cached, eligible for the table
+# path); longer ones are read only until COMPRESS_MAX_CHARS of result lines are found
+EXTRACT_FULL_MAX_PAGES = int(os.getenv("EXTRACT_FULL_MAX_PAGES", "20"))
+
+# Documents extracted in parallel within one batch
+BATCH_EXTRACT_WORKERS = int(os.getenv("BATCH_EXTRACT_WORKERS", str(min(8, os.cpu_count() or 1))))
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "100"))
+# Upload bytes plus the uncompressed size of every archive entry, per batch
+MAX_BATCH_BYTES = int(os.getenv("MAX_BATCH_MB", "200")) * 1024 * 1024
+# Answer clean results tables without the LLM
+TABLE_SKIP_LLM = os.getenv("TABLE_SKIP_LLM", "1") not in ("", "0")
+# Re-prompt only for the lines a model answer missed or got wrong
+LLM_REPAIR = os.getenv("LLM_REPAIR", "1") not in ("", "0")
+
+# Fair-share client for batch items that do not name one
+BATCH_CLIENT = "batch"
+
+
+class AnalysisError(Exception):
+    """Pipeline failure with the HTTP status it maps to"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[int] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        # Seconds, sent as Retry-After with 429
+        self.retry_after = retry_after
+
+
+class BatchItem(NamedTuple):
+    filename: str
+    content: Optional[bytes]
+    # Set when the item was rejected while unpacking the upload
+    error: Optional[AnalysisError] = None
+    # Archive entries are inflated by this when the item is processed
+    load: Optional[Callable[[], bytes]] = None
+
+
+# ========================
+# Stages
+# ========================
+
+def file_extension(filename: str) -> str:
+    ext = filename.split(".")[-1].lower() if "." in filename else ""
+    if ext not in ALLOWED_EXTS:
+        logger.warning("Rejected file type: %s", ext)
+        raise AnalysisError(400, "Invalid file type. Allowed: PDF, JPG, PNG")
+    return ext
+
+
+def check_size(size: int):
+    if size > MAX_SIZE_BYTES:
+        logger.warning("File too large: %s bytes", size)
+        raise AnalysisError(400, "File too large. Max 10 MB")
+
+
+class Extracted(NamedTuple):
+    # Compressed text for the LLM
+    text: str
+    # Complete result when the document is a clean results table
+    table: Optional[AnalysisResult] = None
+    # Perceptual hash of an image upload, for the near-duplicate index
+    image_hash: Optional[int] = None
+
+
+def extract_stage(ext: str, content: bytes) -> Extracted:
+    """Extracted and compressed report text, plus the table-only result if there is one"""
+    try:
+        with stage_timer("extract"), open_upload_pages(ext, content) as stream:
+            if stream.count <= EXTRACT_FULL_MAX_PAGES:
+                pages = list(stream.pages)
+            else:
+                # Long document: pages are read only until the LLM's text budget is full
+                pages = None
+                read = _counted(stream.pages)
+                text = compress_report_pages(read, max_chars=COMPRESS_MAX_CHARS)
+                logger.info("Read %s of %s pages before the text budget filled", read.count, stream.count)
+        if pages is not None:
+            text = "\n".join(t for t in pages if t)
+            logger.info("Extracted text length: %s chars", len(text))
+            # Before compression: truncation must not drop rows from a table result
+            with stage_timer("table"):
+                table = table_result(text) if TABLE_SKIP_LLM else None
+            with stage_timer("compress"):
+                text = compress_report_text(text, max_chars=COMPRESS_MAX_CHARS)
+        else:
+            table = None
+        logger.info("Preprocessed text length: %s chars", len(text))
+    except DocumentTooLarge as e:
+        logger.warning("Extraction budget exceeded: %s", e)
+        raise AnalysisError(413, f"Document too large to extract: {e}")
+    except Exception as e:
+        logger.exception("Failed to parse file: %s", e)
+        raise AnalysisError(400, f"Failed to parse file: {e}")
+
+    if not text or not text.strip():
+        logger.warning("No readable text extracted from file")
+        raise AnalysisError(400, "No readable text extracted from file")
+    image_hash = near_duplicates.image_hash(content) if ext != "pdf" and near_duplicates.enabled() else None
+    return Extracted(text, table, image_hash)
+
+
+class _counted:
+    """Iterator wrapper that counts the items taken from it"""
+
+    def __init__(self, items):
+        self._items = iter(items)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._items)
+        self.count += 1
+        return item
+
+
+def llm_stage(text: str) -> str:
+    """Raw model output; callers hold an admission slot"""
+    try:
+        t0 = time.perf_counter()
+        with stage_timer("llm"):
+            if FAST_MODEL:
+                llm_output = cascade(text)
+            else:
+                with timed(LLM_TIER_SECONDS, "single"):
+                    llm_output = analyze_text_with_llm(text)
+        dt = (time.perf_counter() - t0) * 1000
+        logger.info("LLM call completed in %.1f ms, output length=%s", dt, len(llm_output))
+        # Optionally log a small prefix of output for debugging
+        logger.debug("LLM output (prefix): %s", llm_output[:200])
+    except Exception as e:
+        logger.exception("LLM failure: %s", e)
+        raise AnalysisError(500, f"LLM failure: {e}")
+    return llm_output
+
+
+def _escalation_reason(score: Score) -> str:
+    if not score.valid:
+        return "invalid"
+    return "coverage" if score.coverage <= score.consistency else "consistency"
+
+
+def cascade(text: str) -> str:
+    """
+    FAST_MODEL first; its answer is kept when the deterministic score (schema
+    validity, coverage of the report's result lines, value/range consistency)
+    reaches CASCADE_MIN_SCORE, otherwise MODEL answers from scratch.
+    """
+    with timed(LLM_TIER_SECONDS, "fast"):
+        try:
+            output = analyze_text_with_llm(text, max_retries=0, model=FAST_MODEL)
+        except Exception as e:
+            logger.warning("Fast model failed, escalating: %s", e)
+            output = None
+    score = INVALID
+    if output is not None:
+        try:
+            score = score_result(parse_analysis(output), text)
+        except Exception:
+            pass
+        CASCADE_SCORE.observe(score.value)
+        if score.value >= CASCADE_MIN_SCORE:
+            LLM_TIER_RESULTS.labels("fast").inc()
+            return output
+
+    reason = "error" if output is None else _escalation_reason(score)
+    logger.info("Escalating to %s: %s (score %.2f)", MODEL, reason, score.value)
+    CASCADE_ESCALATIONS.labels(reason).inc()
+    with timed(LLM_TIER_SECONDS, "large"):
+        output = analyze_text_with_llm(text)
+    LLM_TIER_RESULTS.labels("large").inc()
+    return output
+
+
+def parse_analysis(llm_output: str) -> AnalysisResult:
+    """
+    Fast path: well-formed model output is parsed and validated in one
+    pydantic-core pass. Fenced, chatty or incomplete output falls back to
+    parse_json_safe plus defaults for the missing sections.
+    """
+    try:
+        with stage_timer("validate"):
+            return AnalysisResult.model_validate_json(llm_output)
+    except ValidationError:
+        pass
+
+    with stage_timer("json_parse"):
+        parsed = parse_json_safe(llm_output)
+
+    # Ensure required fields exist with defaults if missing
+    if "summary" not in parsed:
+        parsed["summary"] = {"abnormal_count": 0, "risk_level": "low"}
+    if "parameters" not in parsed:
+        parsed["parameters"] = []
+
+    with stage_timer("validate"):
+        return AnalysisResult.model_validate(parsed)
+
+
+def result_stage(llm_output: str, text: Optional[str] = None) -> AnalysisResult:
+    """
+    Validated, normalized result. With the report text, an incomplete or
+    partly invalid answer goes through repair_stage instead of failing.
+    """
+    try:
+        result = parse_analysis(llm_output)
+    except Exception as e:
+        if text is None or not LLM_REPAIR:
+            logger.error("Invalid JSON output from LLM: %s", e)
+            log_payload(logger, logging.ERROR, "llm_output", llm_output)
+            raise AnalysisError(500, f"Invalid JSON output from LLM: {e}")
+        logger.warning("Invalid JSON output from LLM, salvaging valid parameters: %s", e)
+        result = None
+    if text is not None and LLM_REPAIR:
+        result = repair_stage(result, llm_output, text)
+    with stage_timer("normalize"):
+        return normalize_result(result)
+
+
+def repair_stage(result: Optional[AnalysisResult], llm_output: str, text: str) -> AnalysisResult:
+    """
+    Keep the parameters that validate, then ask the model about only the
+    result lines none of them accounts for (missing from the answer, or
+    dropped because their item failed validation) and merge the answers.
+    """
+    if result is None:
+        with stage_timer("json_parse"):
+            kept, rejected = validate_items(salvage_array_items(llm_output, "parameters"))
+    else:
+        kept = [p for p in result.parameters if usable(p)]
+        rejected = len(result.parameters) - len(kept)
+    partial = AnalysisResult(summary={"abnormal_count": 0, "risk_level": "low"}, parameters=kept)
+    missing = unmatched_lines(partial, result_lines(text))
+    if not missing:
+        if result is None and not kept:
+            LLM_REPAIRS.labels("failed").inc()
+            raise AnalysisError(500, f"Invalid JSON output from LLM: {llm_output[:200]}")
+        return partial if rejected or result is None else result
+
+    logger.info("Repairing %s lines (%s parameters kept, %s rejected)", len(missing), len(kept), rejected)
+    LLM_REPAIR_LINES.observe(len(missing))
+    try:
+        with stage_timer("repair"):
+            output = repair_lines_with_llm(missing)
+        extra, _ = validate_items(salvage_array_items(output, "parameters"))
+    except Exception as e:
+        logger.warning("LLM repair failed: %s", e)
+        extra = []
+    if not extra and not kept:
+        LLM_REPAIRS.labels("failed").inc()
+        raise AnalysisError(500, "Invalid JSON output from LLM and repair found no parameters")
+    LLM_REPAIRS.labels("repaired" if extra else "unchanged").inc()
+    return merge_parameters(partial, extra)
+
+
+def _attribute(params, sections: List[str]) -> Tuple[List[list], list]:
+    """Fresh parameters grouped by the section of their source line, plus those matching no line"""
+    lines, owner = [], []
+    for i, section in enumerate(sections):
+        for line in section.split("\n"):
+            lines.append(line)
+            owner.append(i)
+    grouped, orphans = [[] for _ in sections], []
+    for param, index in zip(params, source_lines(params, lines)):
+        if index is None:
+            orphans.append(param)
+        else:
+            grouped[owner[index]].append(param)
+    return grouped, orphans
+
+
+def section_stage(text: str, ticket: Optional[Ticket]) -> Tuple[AnalysisResult, str]:
+    """
+    Parameters per report section, from the section cache where possible.
+    Only unseen sections go to the model, in one call; its answer is split
+    back by source line and cached per section. A section is cached only
+    when every result line in it got a parameter, so a miss is retried.
+    """
+    # Repeated sections (footers, headers) count once
+    unique = {section_key(s): s for s in split_sections(text)}
+    keys = list(unique)
+    params: Dict[str, list] = section_cache.get_many(keys)
+    missing = [k for k in keys if k not in params]
+    orphans = []
+    source = "cache"
+    if missing:
+        missing_text = "\n".join(unique[k] for k in missing)
+        logger.info("%s of %s report sections not cached, %s chars to the LLM", len(missing), len(keys), len(missing_text))
+        with admission.slot(ticket, admission.text_llm_seconds(missing_text)):
+            fresh = result_stage(llm_stage(missing_text), missing_text)
+        grouped, orphans = _attribute(fresh.parameters, [unique[k] for k in missing])
+        complete = {}
+        for key, found in zip(missing, grouped):
+            params[key] = found
+            section = AnalysisResult(summary={"abnormal_count": 0, "risk_level": "low"}, parameters=found)
+            if not unmatched_lines(section, result_lines(unique[key])):
+                complete[key] = found
+        section_cache.put_many(complete)
+        source = "llm"
+    merged = [p for k in keys for p in params[k]] + orphans
+    result = AnalysisResult(summary={"abnormal_count": 0, "risk_level": "low"}, parameters=merged)
+    with stage_timer("normalize"):
+        return normalize_result(result), source
+
+
+def analyze_extracted(extracted: Extracted, ticket: Optional[Ticket]) -> AnalysisResult:
+    """
+    Table result, a near-duplicate's stored result, or the LLM answer once
+    the ticket gets an admission slot (tables and near-duplicates need none)
+    """
+    try:
+        if extracted.table is not None:
+            logger.info("Clean results table, skipping LLM (%s parameters)", len(extracted.table.parameters))
+            ANALYZE_RESULTS.labels("table").inc()
+            return extracted.table
+        fingerprint = near_duplicates.fingerprint(extracted.text, extracted.image_hash) \
+            if near_duplicates.enabled() else None
+        if fingerprint is not None:
+            with stage_timer("near_duplicate"):
+                result = near_duplicates.find(fingerprint)
+            if result is not None:
+                ANALYZE_RESULTS.labels("near_duplicate").inc()
+                return result
+        if section_cache.enabled() and extracted.text.strip():
+            result, source = section_stage(extracted.text, ticket)
+        else:
+            with admission.slot(ticket, admission.text_llm_seconds(extracted.text)):
+                result, source = result_stage(llm_stage(extracted.text), extracted.text), "llm"
+        if fingerprint is not None:
+            near_duplicates.add(fingerprint, result)
+        ANALYZE_RESULTS.labels(source).inc()
+        return result
+    finally:
+        if ticket is not None:
+            admission.leave(ticket)
+
+
+def admit_upload(ext: str, content: bytes, client: str, priority: str) -> Ticket:
+    """Admission ticket priced from page count and file type; raises AnalysisError(429) when overloaded"""
+    pages = admission.page_count(ext, content)
+    try:
+        return admission.admit(
+            client, priority,
+            admission.upload_llm_seconds(pages, COMPRESS_MAX_CHARS),
+            lead_seconds=admission.extract_seconds(ext, pages),
+        )
+    except Overloaded as e:
+        raise AnalysisError(429, str(e), retry_after=e.retry_after)
+
+
+def analyze_document(ext: str, content: bytes, client: str = "anonymous", priority: str = "normal") -> AnalysisResult:
+    """Full pipeline for one uploaded document; raises AnalysisError"""
+    logger.info("File size: %s bytes", len(content))
+    check_size(len(content))
+    ticket = admit_upload(ext, content, client, priority)
+    try:
+        extracted = extract_stage(ext, content)
+    except AnalysisError:
+        admission.leave(ticket)
+        raise
+    return analyze_extracted(extracted, ticket)
+
+
+# ========================
+# Batches
+# ========================
+
+def _is_hidden(path: str) -> bool:
+    return path.startswith("__MACOSX/") or os.path.basename(path).startswith(".")
+
+
+def _too_many_files():
+    return AnalysisError(400, f"Too many files in batch. Max {MAX_BATCH_FILES}")
+
+
+def _too_many_bytes():
+    return AnalysisError(413, f"Batch too large. Max {MAX_BATCH_BYTES // (1024 * 1024)} MB uncompressed")
+
+
+def _zip_entry_loader(name: str, content: bytes, info: zipfile.ZipInfo) -> Callable[[], bytes]:
+    def load() -> bytes:
+        # Own ZipFile per read: items are loaded from several extraction threads
+        try:
+            with zipfile.ZipFile(io.BytesIO(content)) as archive, archive.open(info) as entry:
+                # ZipExtFile stops at the directory's file_size, so the declared
+                # sizes checked in expand_zip bound what is inflated here
+                return entry.read(MAX_SIZE_BYTES + 1)
+        except (zipfile.BadZipFile, zlib.error, EOFError, RuntimeError, NotImplementedError) as e:
+            raise AnalysisError(400, f"Unreadable archive entry {name}: {e}")
+    return load
+
+
+def expand_zip(filename: str, content: bytes, max_files: int = MAX_BATCH_FILES,
+               max_bytes: int = MAX_BATCH_BYTES) -> Tuple[List[BatchItem], int]:
+    """
+    One lazy item per supported file in the archive, and the uncompressed
+    bytes they declare. Only the directory is read here: entries are counted
+    and sized without inflating them.
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(content))
+    except zipfile.BadZipFile as e:
+        return [BatchItem(filename, None, AnalysisError(400, f"Invalid zip archive: {e}"))], 0
+    items, total = [], 0
+    with archive:
+        for info in archive.infolist():
+            if info.is_dir() or _is_hidden(info.filename):
+                continue
+            if len(items) >= max_files:
+                raise _too_many_files()
+            name = f"{filename}/{info.filename}"
+            if info.file_size > MAX_SIZE_BYTES:
+                items.append(BatchItem(name, None, AnalysisError(400, "File too large. Max 10 MB")))
+                continue
+            total += info.file_size
+            if total > max_bytes:
+                raise _too_many_bytes()
+            items.append(BatchItem(name, None, load=_zip_entry_loader(name, content, info)))
+    return items, total
+
+
+def expand_uploads(uploads) -> List[BatchItem]:
+    """
+    (filename, bytes) pairs to batch items; zip archives are unpacked lazily.
+    Enforces MAX_BATCH_FILES and MAX_BATCH_BYTES before anything is inflated.
+    """
+    items, total = [], 0
+    for filename, content in uploads:
+        if filename.lower().endswith(".zip"):
+            entries, size = expand_zip(filename, content, MAX_BATCH_FILES - len(items), MAX_BATCH_BYTES - total)
+            items.extend(entries)
+            total += size
+        else:
+            items.append(BatchItem(filename, content))
+            total += len(content)
+        if len(items) > MAX_BATCH_FILES:
+            raise _too_many_files()
+        if total > MAX_BATCH_BYTES:
+            raise _too_many_bytes()
+    return items
+
+
+def _prepare(item: BatchItem) -> Extracted:
+    if item.error is not None:
+        raise item.error
+    ext = file_extension(item.filename)
+    content = item.content if item.content is not None else item.load()
+    check_size(len(content))
+    return extract_stage(ext, content)
+
+
+def _record(index: int, item: BatchItem, t0: float, result: Optional[AnalysisResult] = None,
+            error: Optional[Exception] = None) -> str:
+    head = {
+        "index": index,
+        "filename": item.filename,
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1),
+    }
+    if result is not None:
+        head["status"] = "ok"
+        # Splice the pre-serialized result in rather than dumping it twice
+        return json.dumps(head)[:-1] + ', "result": ' + result.model_dump_json() + "}\n"
+    if isinstance(error, AnalysisError):
+        head.update(status="error", status_code=error.status_code, error=error.detail)
+    else:
+        logger.exception("Unexpected batch failure for %s: %s", item.filename, error)
+        head.update(status="error", status_code=500, error=str(error))
+    return json.dumps(head) + "\n"
+
+
+def _analyze_batch_item(extracted: Extracted, client: str) -> AnalysisResult:
+    # Batch items queue at low priority and are never shed: the client already waits on a stream
+    cost = admission.text_llm_seconds(extracted.text)
+    return analyze_extracted(extracted, admission.admit(client, "low", cost, max_wait=None))
+
+
+def _submit(pool: ThreadPoolExecutor, fn, *args):
+    """Run fn on the pool in a copy of the caller's context, so its logs keep the request id"""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+def analyze_batch(items: List[BatchItem], client: str = BATCH_CLIENT) -> Iterator[str]:
+    """
+    NDJSON lines, one per item, in completion order. Extraction runs on its own
+    pool; each extracted text goes straight to the LLM pool, whose calls share
+    the process-wide admission slots with single /analyze requests.
+    """
+    t0 = time.perf_counter()
+    extract_pool = ThreadPoolExecutor(BATCH_EXTRACT_WORKERS, thread_name_prefix="batch-extract")
+    llm_pool = ThreadPoolExecutor(LLM_CONCURRENCY, thread_name_prefix="batch-llm")
+    pending = {}
+    try:
+        with ANALYZE_IN_FLIGHT.track_inprogress():
+            for index, item in enumerate(items):
+                pending[_submit(extract_pool, _prepare, item)] = (index, item, "extract")
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, item, stage = pending.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        yield _record(index, item, t0, error=error)
+                    elif stage == "extract" and future.result().table is not None:
+                        yield _record(index, item, t0, result=analyze_extracted(future.result(), None))
+                    elif stage == "extract":
+                        pending[_submit(llm_pool, _analyze_batch_item, future.result(), client)] = (index, item, "llm")
+                    else:
+                        yield _record(index, item, t0, result=future.result())
+    finally:
+        # Client went away: drop work that has not started yet
+        extract_pool.shutdown(wait=False, cancel_futures=True)
+        llm_pool.shutdown(wait=False, cancel_futures=True)
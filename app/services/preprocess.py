@@ -1,4 +1,7 @@
 import re
+from typing import Iterable, Iterator, List, NamedTuple
+
+from app.services.analytes import hint_vocabulary
 
 PARAM_HINTS = [
     "hemoglobin", "hb", "wbc", "rbc", "platelet", "platelets",
@@ -9,38 +12,143 @@ PARAM_HINTS = [
     "vitamin d", "tsh", "t3", "t4", "iron", "ferritin"
 ]
 
-UNIT_PATTERN = re.compile(r"\b(%|mg/dl|g/dl|mmol/l|10\^\d+/u?l|10\^\d+/?l|g/l|ng/ml|pg/ml|fl|u/l|iu/l|k/u?l|m/u?l|cells/u?l)\b", re.I)
-NUMBER_PATTERN = re.compile(r"[-+]?\b\d+(?:\.\d+)?\b")
+# Units as they appear in lowercased text; 10^n/L style units are matched by POWER_UNIT_PATTERN
+UNITS = frozenset({
+    "%", "mg/dl", "g/dl", "mmol/l", "g/l", "ng/ml", "pg/ml", "fl", "u/l", "iu/l",
+    "k/ul", "k/l", "m/ul", "m/l", "cells/ul", "cells/l",
+})
+POWER_UNIT_PATTERN = re.compile(r"10\^\d+/?u?l\b")
+
+# Word-ish tokens: keeps decimals ("9.6") and units ("mg/dl") in one piece,
+# splits on spaces, brackets, colons and commas. "%" is its own token.
+TOKEN_PATTERN = re.compile(r"[a-z0-9/^.]+|%")
+
+# Fallback kicks in when fewer lines than this look like parameters
+MIN_CANDIDATE_LINES = 10
+
+
+def _with_trailing_dot(words):
+    return frozenset(words) | frozenset(w + "." for w in words)
+
+
+def _build_hint_index(hints):
+    """
+    Compile the hint vocabulary into whole-word lookup sets: single-word hints
+    (plus plural "s") for O(1) token membership, and multi-word hints keyed by
+    their first word. Whole-word matching means "alt" no longer hits "health".
+    """
+    single, multi = set(), {}
+    for hint in hints:
+        words = hint.lower().split()
+        if len(words) == 1:
+            single.update((words[0], words[0] + "s"))
+        else:
+            multi.setdefault(words[0], set()).add(tuple(words[1:]))
+    return _with_trailing_dot(single), multi
+
+
+# Analyte knowledge base names and synonyms extend the built-in hints
+HINT_WORDS, HINT_PHRASES = _build_hint_index([*PARAM_HINTS, *hint_vocabulary()])
+UNIT_TOKENS = _with_trailing_dot(UNITS)
+
+
+class LineFeatures(NamedTuple):
+    """Per-line scores from the classifier; reusable by later stages"""
+    text: str
+    hints: int
+    numbers: int
+    units: int
+    has_colon: bool
+
+    @property
+    def is_candidate(self) -> bool:
+        """Likely a parameter line: a value with a unit, or a known analyte name"""
+        return (self.numbers > 0 and self.units > 0) or self.hints > 0
+
+    @property
+    def score(self) -> int:
+        return 2 * self.hints + min(self.numbers, 3) + 2 * min(self.units, 1) + int(self.has_colon)
+
+
+def _count_phrases(tokens) -> int:
+    count = 0
+    for i, tok in enumerate(tokens):
+        for rest in HINT_PHRASES.get(tok, ()):
+            following = tuple(t.rstrip(".") for t in tokens[i + 1:i + 1 + len(rest)])
+            if following == rest:
+                count += 1
+    return count
+
+
+def classify_line(line: str) -> LineFeatures:
+    """
+    Single tokenization pass; hint and unit detection are set intersections,
+    so the cost does not grow with the size of the hint vocabulary.
+    Counts are distinct hints/units per line, not occurrences.
+    """
+    lower = line.lower()
+    tokens = TOKEN_PATTERN.findall(lower)
+    hints = len(HINT_WORDS.intersection(tokens))
+    if not HINT_PHRASES.keys().isdisjoint(tokens):
+        hints += _count_phrases(tokens)
+    units = len(UNIT_TOKENS.intersection(tokens))
+    if "^" in lower:
+        units += len(POWER_UNIT_PATTERN.findall(lower))
+    numbers = sum(1 for t in tokens if t[0].isdigit())
+    return LineFeatures(line, hints, numbers, units, ":" in line)
+
+
+def iter_line_features(text: str) -> Iterator[LineFeatures]:
+    for raw in text.splitlines():
+        line = raw.strip()
+        if line:
+            yield classify_line(line)
+
+
+def classify_lines(text: str) -> List[LineFeatures]:
+    return list(iter_line_features(text))
 
 
 def compress_report_text(text: str, max_chars: int = 3000) -> str:
     """
     Reduce long report text by keeping lines likely to contain parameters and values.
     Heuristics: lines with numbers and units, or lines containing known parameter hints.
+    Single pass: candidates are deduplicated as they are found, and label: value
+    lines are set aside for the fallback used when too few candidates turn up.
+    """
+    return compress_report_pages((text,), max_chars)
+
+
+def compress_report_pages(pages: Iterable[str], max_chars: int = 3000) -> str:
+    """
+    compress_report_text over page texts, pulled one at a time. Once the kept
+    lines fill max_chars the output is fixed (the colon fallback only appends),
+    so no further pages are requested.
     """
-    lines = [l.strip() for l in text.splitlines()]
     keep = []
-    for l in lines:
-        if not l:
-            continue
-        lower = l.lower()
-        has_number = bool(NUMBER_PATTERN.search(lower))
-        has_unit = bool(UNIT_PATTERN.search(lower))
-        has_hint = any(h in lower for h in PARAM_HINTS)
-        if (has_number and has_unit) or has_hint:
-            keep.append(l)
-    # Fallback: if too few lines, include lines with colon (label: value)
-    if len(keep) < 10:
-        keep.extend([l for l in lines if ":" in l])
-    # Deduplicate while preserving order
+    colon_lines = []
     seen = set()
-    filtered = []
-    for l in keep:
-        if l not in seen:
-            seen.add(l)
-            filtered.append(l)
-    result = "\n".join(filtered)
+    # Length of "\n".join(keep)
+    size = -1
+    for text in pages:
+        for features in iter_line_features(text):
+            line = features.text
+            if features.is_candidate:
+                if line not in seen:
+                    seen.add(line)
+                    keep.append(line)
+                    size += len(line) + 1
+            elif features.has_colon:
+                colon_lines.append(line)
+        if size >= max_chars:
+            break
+    # Fallback: if too few lines, include lines with colon (label: value)
+    if len(keep) < MIN_CANDIDATE_LINES:
+        for line in colon_lines:
+            if line not in seen:
+                seen.add(line)
+                keep.append(line)
+    result = "\n".join(keep)
     if len(result) <= max_chars:
         return result
     return result[:max_chars]
-
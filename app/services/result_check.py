@@ -0,0 +1,185 @@
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+from pydantic import ValidationError
+
+from app.schemas.analysis import AnalysisResult, Parameter
+from app.services.analytes import normalize_name, parse_number, parse_range, resolve, status_for
+from app.services.preprocess import iter_line_features
+
+# Name part of a report line: up to the first colon, cell separator or standalone number
+# (digits inside a word stay: "HbA1c", "Vitamin B12", "T3")
+LINE_NAME_PATTERN = re.compile(r"^([^:|\d\s][^:|]*?)(?=\s*[:|]|\s+[<>]?[-+]?\d|$)")
+
+
+class Score(NamedTuple):
+    valid: bool
+    # Share of the report's result lines that produced a parameter
+    coverage: float
+    # Share of parameters whose value is in the report and whose status fits its range
+    consistency: float
+
+    @property
+    def value(self) -> float:
+        return min(self.coverage, self.consistency) if self.valid else 0.0
+
+
+INVALID = Score(False, 0.0, 0.0)
+
+
+def result_lines(text: str) -> List[str]:
+    """Lines the compressor kept because they look like a result with a value"""
+    return [f.text for f in iter_line_features(text) if f.is_candidate and f.numbers > 0]
+
+
+def _line_name(line: str) -> str:
+    m = LINE_NAME_PATTERN.match(line)
+    return normalize_name(m.group(1)) if m else ""
+
+
+def _same_name(a: str, b: str) -> bool:
+    """
+    Normalized names for the same test: equal, or one's words a contiguous run
+    of the other's ("hemoglobin" / "hemoglobin hb"). Whole words only, so
+    "hb" is not "hba1c" and "ldl" is not "vldl"; and never two different
+    knowledge base analytes.
+    """
+    if not a or not b:
+        return False
+    if a == b:
+        return True
+    short, long_ = sorted((a.split(), b.split()), key=len)
+    if not any(long_[i:i + len(short)] == short for i in range(len(long_) - len(short) + 1)):
+        return False
+    analyte_a, analyte_b = resolve(a), resolve(b)
+    return analyte_a is None or analyte_b is None or analyte_a.name == analyte_b.name
+
+
+def _param_keys(result: AnalysisResult):
+    names, analytes = set(), set()
+    for p in result.parameters:
+        name = normalize_name(p.name)
+        if name:
+            names.add(name)
+        analyte = resolve(p.name)
+        if analyte is not None:
+            analytes.add(analyte.name)
+    return names, analytes
+
+
+def unmatched_lines(result: AnalysisResult, lines: List[str]) -> List[str]:
+    """Result lines that no parameter accounts for, by name or knowledge base analyte"""
+    names, analytes = _param_keys(result)
+    missing = []
+    for line in lines:
+        key = _line_name(line)
+        if not key:
+            continue
+        if key in names or any(_same_name(key, n) for n in names):
+            continue
+        analyte = resolve(key)
+        if analyte is not None and analyte.name in analytes:
+            continue
+        missing.append(line)
+    return missing
+
+
+def source_lines(params: List[Parameter], lines: List[str]) -> List[Optional[int]]:
+    """
+    Index of the report line each parameter came from. Lines are ranked by
+    name match (same name, then same analyte or one name's words within the
+    other's), ties broken by the line containing the value; a line matching
+    only by value comes last. None when nothing matches.
+    """
+    keys = [_line_name(line) for line in lines]
+    analytes = [resolve(key) if key else None for key in keys]
+    found = []
+    for param in params:
+        name = normalize_name(param.name)
+        analyte = resolve(param.name)
+        value = (param.value or "").strip()
+        best, best_rank = None, 6
+        for i, key in enumerate(keys):
+            if key and key == name:
+                name_rank = 0
+            elif _same_name(key, name) or \
+                    (analyte is not None and analytes[i] is not None and analytes[i].name == analyte.name):
+                name_rank = 1
+            else:
+                name_rank = 2
+            has_value = bool(value) and value in lines[i]
+            if name_rank == 2 and not has_value:
+                continue
+            rank = 2 * name_rank + (0 if has_value else 1)
+            if rank < best_rank:
+                best, best_rank = i, rank
+        found.append(best)
+    return found
+
+
+def _consistent(param, flat_text: str) -> bool:
+    value = parse_number(param.value)
+    if value is None:
+        return True
+    # The number must come from the report, not from the model
+    if param.value.replace(",", "").strip() not in flat_text and f"{value:g}" not in flat_text:
+        return False
+    report_range = parse_range(param.normal_range)
+    return report_range is None or param.status == status_for(value, *report_range)
+
+
+def score_result(result: Optional[AnalysisResult], text: str, lines: Optional[List[str]] = None) -> Score:
+    """Deterministic quality score of a model answer against the text it was given"""
+    if result is None:
+        return INVALID
+    if lines is None:
+        lines = result_lines(text)
+    coverage = 1.0 if not lines else 1 - len(unmatched_lines(result, lines)) / len(lines)
+    flat_text = text.replace(",", "")
+    numeric = [p for p in result.parameters if parse_number(p.value) is not None]
+    if not numeric:
+        consistency = 0.0 if lines else 1.0
+    else:
+        consistency = sum(_consistent(p, flat_text) for p in numeric) / len(numeric)
+    return Score(True, coverage, consistency)
+
+
+# ========================
+# Repair support
+# ========================
+
+def usable(param: Parameter) -> bool:
+    """A parameter worth keeping: it names something and carries a value"""
+    return bool(param.name.strip()) and bool((param.value or "").strip())
+
+
+def validate_items(items: list) -> Tuple[List[Parameter], int]:
+    """Parameters from raw JSON items that validate on their own, and how many did not"""
+    params, rejected = [], 0
+    for item in items:
+        try:
+            param = Parameter.model_validate(item)
+        except ValidationError:
+            rejected += 1
+            continue
+        if usable(param):
+            params.append(param)
+        else:
+            rejected += 1
+    return params, rejected
+
+
+def merge_parameters(result: AnalysisResult, extra: List[Parameter]) -> AnalysisResult:
+    """result plus the extra parameters it does not already have (by name or analyte)"""
+    names, analytes = _param_keys(result)
+    merged = list(result.parameters)
+    for param in extra:
+        name = normalize_name(param.name)
+        analyte = resolve(param.name)
+        if name in names or (analyte is not None and analyte.name in analytes):
+            continue
+        names.add(name)
+        if analyte is not None:
+            analytes.add(analyte.name)
+        merged.append(param)
+    return result.model_copy(update={"parameters": merged})
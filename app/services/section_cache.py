@@ -0,0 +1,177 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.schemas.analysis import Parameter
+from app.services import llm_client
+from app.utils.metrics import record_cache
+
+logger = logging.getLogger("section_cache")
+
+# ========================
+# Configuration
+# ========================
+
+# Empty disables the cache
+SECTION_CACHE_PATH = os.getenv("SECTION_CACHE_PATH", "")
+SECTION_CACHE_MAX_ENTRIES = int(os.getenv("SECTION_CACHE_MAX_ENTRIES", "100000"))
+# Average and maximum lines per section
+SECTION_TARGET_LINES = int(os.getenv("SECTION_TARGET_LINES", "4"))
+SECTION_MAX_LINES = 12
+# Evict down to this fraction of the limit so eviction runs stay rare
+EVICT_TO_FRACTION = 0.9
+
+WHITESPACE = re.compile(r"\s+")
+
+_conn = None
+_lock = threading.Lock()
+# Entries in the table as seen by this process; None until first counted
+_entries = None
+
+# ========================
+# Sections
+# ========================
+
+def split_sections(text: str) -> List[str]:
+    """
+    Compressed report text cut into groups of normalized lines. A group ends
+    after a line whose hash is 0 mod SECTION_TARGET_LINES, so boundaries
+    depend only on the lines themselves: an edited line changes its own
+    section (and at most the next one), never the rest of the report.
+    """
+    sections, current = [], []
+    for raw in text.splitlines():
+        line = WHITESPACE.sub(" ", raw).strip()
+        if not line:
+            continue
+        current.append(line)
+        if zlib.crc32(line.encode()) % SECTION_TARGET_LINES == 0 or len(current) >= SECTION_MAX_LINES:
+            sections.append("\n".join(current))
+            current = []
+    if current:
+        sections.append("\n".join(current))
+    return sections
+
+
+def section_key(section: str) -> str:
+    """Section hash salted with the models and prompt that produced its parameters"""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(llm_client.answer_version().encode())
+    h.update(b"\0")
+    h.update(section.encode())
+    return h.hexdigest()
+
+# ========================
+# Connection
+# ========================
+
+def _open(path: str) -> sqlite3.Connection:
+    if path != ":memory:":
+        Path(path).parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sections (
+            key TEXT PRIMARY KEY,
+            params TEXT NOT NULL,
+            used REAL NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sections_used ON sections (used)")
+    return conn
+
+
+def _connection() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        _conn = _open(SECTION_CACHE_PATH)
+    return _conn
+
+
+def reset_connection(path: Optional[str] = None):
+    """Reopen on another database file; used by tests"""
+    global _conn, _entries, SECTION_CACHE_PATH
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+        _entries = None
+        if path is not None:
+            SECTION_CACHE_PATH = path
+
+# ========================
+# Cache
+# ========================
+
+def enabled() -> bool:
+    return bool(SECTION_CACHE_PATH)
+
+
+def get_many(keys: List[str]) -> Dict[str, List[Parameter]]:
+    """Cached parameters by key for the keys present; hits refresh their LRU time"""
+    found = {}
+    try:
+        with _lock:
+            conn = _connection()
+            for key in keys:
+                row = conn.execute("SELECT params FROM sections WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    found[key] = [Parameter.model_validate(p) for p in json.loads(row[0])]
+            if found:
+                now = time.time()
+                conn.executemany("UPDATE sections SET used = ? WHERE key = ?", [(now, k) for k in found])
+    except (sqlite3.Error, ValueError) as e:
+        logger.warning("Section cache lookup failed: %s", e)
+        found = {}
+    for key in keys:
+        record_cache("section", key in found)
+    return found
+
+
+def put_many(entries: Dict[str, List[Parameter]]):
+    global _entries
+    if not entries:
+        return
+    now = time.time()
+    rows = [(key, json.dumps([p.model_dump() for p in params]), now) for key, params in entries.items()]
+    try:
+        with _lock:
+            conn = _connection()
+            conn.executemany("INSERT OR REPLACE INTO sections (key, params, used) VALUES (?, ?, ?)", rows)
+            if _entries is None:
+                _entries = conn.execute("SELECT COUNT(*) FROM sections").fetchone()[0]
+            else:
+                _entries += len(rows)
+            if _entries > SECTION_CACHE_MAX_ENTRIES:
+                _entries = _evict(conn, int(SECTION_CACHE_MAX_ENTRIES * EVICT_TO_FRACTION))
+    except sqlite3.Error as e:
+        logger.warning("Failed to write section cache entries: %s", e)
+
+
+def _evict(conn: sqlite3.Connection, target: int) -> int:
+    """Delete least recently used sections down to target entries; returns the new count"""
+    total = conn.execute("SELECT COUNT(*) FROM sections").fetchone()[0]
+    if total > target:
+        conn.execute(
+            "DELETE FROM sections WHERE key IN (SELECT key FROM sections ORDER BY used LIMIT ?)",
+            (total - target,),
+        )
+        logger.info("Evicted %s section cache entries, %s left", total - target, target)
+        total = target
+    return total
+
+
+def clear():
+    global _entries
+    with _lock:
+        _connection().execute("DELETE FROM sections")
+        _entries = 0
@@ -0,0 +1,139 @@
+import os
+import struct
+import threading
+import time
+import zlib
+
+# Record header: payload length + CRC32 of the payload
+HEADER = struct.Struct(">II")
+
+
+class Spool:
+    """
+    Append-only file of length-prefixed records.
+
+    Writers append and fsync in batches (every `fsync_every` records or
+    `fsync_interval` seconds, whichever comes first). A reader drains records
+    from a committed offset that is kept in a side file, and the spool is
+    truncated once everything has been drained. A torn record at the tail
+    (crash mid-append) is cut off when the spool is reopened.
+    """
+
+    def __init__(self, path: str, fsync_every: int = 64, fsync_interval: float = 1.0):
+        self.path = path
+        self.offset_path = path + ".offset"
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._fh = open(path, "ab")
+        self._read_offset = self._load_offset()
+        if self._read_offset > os.path.getsize(path):
+            # Crashed between truncating and storing the offset
+            self._read_offset = 0
+        self._recover()
+
+    # ------------------------
+    # Writing
+    # ------------------------
+
+    def append(self, record: bytes):
+        with self._lock:
+            self._fh.write(HEADER.pack(len(record), zlib.crc32(record)) + record)
+            self._unsynced += 1
+            if (self._unsynced >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync()
+
+    def flush(self):
+        """Force pending appends to disk (called periodically by the drainer)"""
+        with self._lock:
+            if self._unsynced:
+                self._sync()
+
+    def _sync(self):
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    # ------------------------
+    # Draining
+    # ------------------------
+
+    def pending(self) -> bool:
+        with self._lock:
+            self._fh.flush()
+            return os.path.getsize(self.path) > self._read_offset
+
+    def read_batch(self, max_records: int = 500):
+        """Return (records, next_offset) starting at the committed offset"""
+        with self._lock:
+            self._fh.flush()
+            records = []
+            offset = self._read_offset
+            for record, end in self._scan(self._read_offset):
+                records.append(record)
+                offset = end
+                if len(records) >= max_records:
+                    break
+            return records, offset
+
+    def _scan(self, offset: int):
+        """Yield (record, end_offset) for every intact record from `offset`"""
+        with open(self.path, "rb") as fh:
+            fh.seek(offset)
+            while True:
+                header = fh.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    return
+                length, crc = HEADER.unpack(header)
+                record = fh.read(length)
+                if len(record) < length or zlib.crc32(record) != crc:
+                    return
+                offset += HEADER.size + length
+                yield record, offset
+
+    def commit(self, offset: int):
+        """Mark everything before `offset` as replayed; compact when fully drained"""
+        with self._lock:
+            self._fh.flush()
+            if offset >= os.path.getsize(self.path):
+                self._fh.truncate(0)
+                self._fh.seek(0)
+                os.fsync(self._fh.fileno())
+                offset = 0
+            self._read_offset = offset
+            self._store_offset(offset)
+
+    def close(self):
+        self.flush()
+        self._fh.close()
+
+    def _recover(self):
+        """Cut a torn tail so new appends are not stuck behind it"""
+        end = self._read_offset
+        for _, end in self._scan(self._read_offset):
+            pass
+        if end < os.path.getsize(self.path):
+            self._fh.truncate(end)
+            os.fsync(self._fh.fileno())
+
+    def _load_offset(self) -> int:
+        try:
+            with open(self.offset_path) as fh:
+                return int(fh.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _store_offset(self, offset: int):
+        tmp = self.offset_path + ".tmp"
+        with open(tmp, "w") as fh:
+            fh.write(str(offset))
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self.offset_path)
@@ -0,0 +1,222 @@
+import re
+from typing import List, NamedTuple, Optional
+
+from app.schemas.analysis import AnalysisResult, Parameter
+from app.services.analytes import normalize_result, parse_number, parse_range, resolve
+from app.services.preprocess import iter_line_features
+
+# ========================
+# Configuration
+# ========================
+
+# Words whose tops differ by less than this (pt) are on the same line; pdfplumber's default
+LINE_TOLERANCE = 3.0
+# A horizontal gap wider than this fraction of the word height starts a new cell
+CELL_GAP_RATIO = 0.6
+# Fewest result rows for a grid to count as a table
+MIN_TABLE_ROWS = 3
+
+COLUMNS = ("name", "value", "unit", "range")
+HEADER_WORDS = {
+    "name": frozenset({"test", "tests", "parameter", "parameters", "investigation", "analyte", "description", "examination"}),
+    "value": frozenset({"result", "results", "value", "observed", "observation"}),
+    "unit": frozenset({"unit", "units", "uom"}),
+    "range": frozenset({"reference", "range", "ref", "normal", "biological", "interval", "limits"}),
+}
+CELL_SEPARATOR = " | "
+
+VALUE_PATTERN = re.compile(r"^[<>]?\s*[-+]?\d[\d,]*(?:\.\d+)?")
+# Abnormal-value flags printed next to results
+FLAGS = frozenset({"h", "l", "hh", "ll", "*", "high", "low", "(h)", "(l)"})
+
+
+class Cell(NamedTuple):
+    text: str
+    x0: float
+    x1: float
+
+
+class TableRow(NamedTuple):
+    name: str
+    value: str
+    unit: str
+    range: str
+
+    def to_line(self) -> str:
+        return CELL_SEPARATOR.join(self)
+
+# ========================
+# Geometry
+# ========================
+
+def group_lines(words) -> List[list]:
+    """pdfplumber words -> lines (top to bottom), each sorted left to right"""
+    lines = []
+    for word in sorted(words, key=lambda w: (w["top"], w["x0"])):
+        if lines and abs(word["top"] - lines[-1][0]["top"]) <= LINE_TOLERANCE:
+            lines[-1].append(word)
+        else:
+            lines.append([word])
+    return [sorted(line, key=lambda w: w["x0"]) for line in lines]
+
+
+def split_cells(line) -> List[Cell]:
+    """Join words into cells; wide gaps separate columns"""
+    cells = []
+    text, x0, x1 = [line[0]["text"]], line[0]["x0"], line[0]["x1"]
+    for word in line[1:]:
+        height = word["bottom"] - word["top"]
+        if word["x0"] - x1 > CELL_GAP_RATIO * height:
+            cells.append(Cell(" ".join(text), x0, x1))
+            text, x0 = [], word["x0"]
+        text.append(word["text"])
+        x1 = word["x1"]
+    cells.append(Cell(" ".join(text), x0, x1))
+    return cells
+
+
+def _header_columns(cells: List[Cell]):
+    """Column name -> header cell when the line looks like a results table header"""
+    columns = {}
+    for cell in cells:
+        words = set(cell.text.lower().replace(".", " ").replace(":", " ").split())
+        for column, keywords in HEADER_WORDS.items():
+            if column not in columns and words & keywords:
+                columns[column] = cell
+                break
+    if "name" in columns and "value" in columns and len(columns) >= 3:
+        return columns
+    return None
+
+
+def _assign(cells: List[Cell], spans) -> dict:
+    """Put each cell in the header column it overlaps most (column spans run to the next header)"""
+    row = {}
+    for cell in cells:
+        best, best_overlap = None, 0.0
+        for column, (left, right) in spans.items():
+            overlap = min(cell.x1, right) - max(cell.x0, left)
+            if overlap > best_overlap:
+                best, best_overlap = column, overlap
+        if best is not None:
+            row[best] = f"{row[best]} {cell.text}" if best in row else cell.text
+    return row
+
+
+def _column_spans(header):
+    ordered = sorted(header.items(), key=lambda item: item[1].x0)
+    spans = {}
+    for i, (column, cell) in enumerate(ordered):
+        # Numbers are often right-aligned under their header: extend left to the previous header's end
+        left = ordered[i - 1][1].x1 if i else float("-inf")
+        right = ordered[i + 1][1].x0 if i + 1 < len(ordered) else float("inf")
+        spans[column] = (left, right)
+    return spans
+
+
+def _positional(cells: List[Cell]) -> dict:
+    """Headerless grid: columns by position; a lone third cell is a range if it has digits"""
+    texts = [c.text for c in cells]
+    if len(texts) == 4:
+        return dict(zip(COLUMNS, texts))
+    if len(texts) == 3:
+        third = "range" if any(ch.isdigit() for ch in texts[2]) else "unit"
+        return {"name": texts[0], "value": texts[1], third: texts[2]}
+    return {}
+
+
+def make_row(cells: dict) -> Optional[TableRow]:
+    """Normalized row when the cells hold a name and a numeric result; flags and units split off the value"""
+    name = cells.get("name", "").strip()
+    value = cells.get("value", "").strip()
+    m = VALUE_PATTERN.match(value)
+    if not name or not m or any(ch.isdigit() for ch in name[:1]):
+        return None
+    rest = [w for w in value[m.end():].split() if w.lower() not in FLAGS]
+    unit = cells.get("unit", "").strip() or " ".join(rest)
+    return TableRow(name, m.group(0).replace(" ", ""), unit, cells.get("range", "").strip())
+
+
+def page_to_text(page) -> str:
+    """
+    Page text with result grids rewritten as 'name | value | unit | range'
+    rows. Other lines are words joined with spaces, like extract_text().
+    """
+    lines = group_lines(page.extract_words())
+    out = []
+    spans = None
+    pending = []  # headerless candidate rows: (line text, row)
+    for line in lines:
+        cells = split_cells(line)
+        text = " ".join(w["text"] for w in line)
+        header = _header_columns(cells)
+        if header is not None:
+            spans = _column_spans(header)
+            out.extend(_flush(pending))
+            pending = []
+            continue
+        if spans is not None:
+            row = make_row(_assign(cells, spans))
+            out.append(row.to_line() if row is not None else text)
+            continue
+        row = make_row(_positional(cells)) if len(cells) >= 3 else None
+        if row is not None:
+            pending.append((text, row))
+        else:
+            out.extend(_flush(pending))
+            pending = []
+            out.append(text)
+    out.extend(_flush(pending))
+    return "\n".join(out)
+
+
+def _flush(pending) -> List[str]:
+    """A run of headerless rows is a table only if it is long enough"""
+    if len(pending) >= MIN_TABLE_ROWS:
+        return [row.to_line() for _, row in pending]
+    return [text for text, _ in pending]
+
+# ========================
+# Table-only results
+# ========================
+
+def parse_table_line(line: str) -> Optional[TableRow]:
+    parts = line.split(CELL_SEPARATOR)
+    if len(parts) != len(COLUMNS):
+        return None
+    return TableRow(*(p.strip() for p in parts))
+
+
+def _status_computable(row: TableRow) -> bool:
+    if parse_range(row.range) is not None:
+        return True
+    analyte = resolve(row.name)
+    return analyte is not None and (analyte.low is not None or analyte.high is not None)
+
+
+def table_result(text: str) -> Optional[AnalysisResult]:
+    """
+    Build the result straight from table rows when the LLM has nothing to
+    add: every parameter-looking line is a row with a numeric value whose
+    status follows from its range or the analyte's default range.
+    """
+    rows = []
+    for features in iter_line_features(text):
+        # "Label: value (low - high)" with an unknown name or unit still needs the LLM
+        looks_like_result = features.is_candidate or (features.has_colon and features.numbers >= 3)
+        if not looks_like_result:
+            continue
+        row = parse_table_line(features.text)
+        if row is None or parse_number(row.value) is None or not _status_computable(row):
+            return None
+        rows.append(row)
+    if len(rows) < MIN_TABLE_ROWS:
+        return None
+    result = AnalysisResult(
+        summary={"abnormal_count": 0, "risk_level": "low"},
+        parameters=[
+            Parameter(name=r.name, value=r.value, unit=r.unit, normal_range=r.range)
+            for r in rows
+        ],
+    )
+    return normalize_result(result)
@@ -0,0 +1,181 @@
+import io
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("warmup")
+
+# ========================
+# Configuration
+# ========================
+
+# Set to 0 to skip model preloading (e.g. when Ollama is warmed elsewhere)
+WARMUP_MODEL = os.getenv("WARMUP_MODEL", "1") not in ("", "0")
+# Steps whose failure keeps /ready at 503; other failures only mark it "degraded"
+READY_REQUIRED_STEPS = frozenset(s.strip() for s in os.getenv("READY_REQUIRED_STEPS", "model").split(",") if s.strip())
+# A failed required step is retried in the background at most this often, driven by /ready probes
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "30"))
+
+SAMPLE_REPORT = "Hemoglobin: 13.5 g/dL (12.0 - 15.5)\nWBC Count: 7200 /uL (4000 - 11000)"
+SAMPLE_OUTPUT = (
+    '{"summary":{"abnormal_count":0,"risk_level":"low"},"parameters":['
+    '{"name":"Hemoglobin","value":"13.5","unit":"g/dL","normal_range":"12.0 - 15.5","status":"normal"}]}'
+)
+
+_ready = threading.Event()
+_steps = {}
+_step_functions = {}
+_retry_lock = threading.Lock()
+_last_retry = 0.0
+
+# ========================
+# Steps
+# ========================
+
+def _tiny_pdf(text: str) -> bytes:
+    """One-page PDF with a line of Helvetica text, built without reportlab"""
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+    ]
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (i, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def warm_pdf():
+    """Imports pdfplumber/pdfminer and fills their font and codec caches"""
+    from app.services.pdf_parser import extract_text_from_pdf_bytes
+
+    text = extract_text_from_pdf_bytes(_tiny_pdf("Hemoglobin 13.5 g/dL"))
+    if "Hemoglobin" not in text:
+        raise RuntimeError(f"unexpected warmup extraction: {text!r}")
+
+
+def warm_ocr():
+    """
+    Loads PIL's image plugins and runs tesseract once, so its binary and
+    language data are in the page cache before the first scan arrives.
+    """
+    import pytesseract
+    from PIL import Image
+
+    Image.init()
+    pytesseract.get_tesseract_version()
+    pytesseract.image_to_string(Image.new("L", (64, 32), 255))
+
+
+def warm_text_pipeline():
+    """First calls through preprocessing, analyte lookup and the schema fast path"""
+    from app.services.analytes import normalize_result
+    from app.services.pipeline import parse_analysis
+    from app.services.preprocess import compress_report_text
+
+    compress_report_text(SAMPLE_REPORT)
+    normalize_result(parse_analysis(SAMPLE_OUTPUT)).model_dump_json()
+
+
+def warm_model():
+    from app.services.llm_client import FAST_MODEL, MODEL, warmup_model
+
+    for model in filter(None, (FAST_MODEL, MODEL)):
+        if not warmup_model(model):
+            raise RuntimeError(f"model preload failed: {model}")
+
+
+STEPS = (
+    ("pdf", warm_pdf),
+    ("ocr", warm_ocr),
+    ("text_pipeline", warm_text_pipeline),
+    ("model", warm_model),
+)
+
+# ========================
+# Runner
+# ========================
+
+def _run_step(name: str, step):
+    s0 = time.perf_counter()
+    try:
+        step()
+        _steps[name] = {"ok": True, "ms": round((time.perf_counter() - s0) * 1000, 1)}
+    except Exception as e:
+        _steps[name] = {"ok": False, "ms": round((time.perf_counter() - s0) * 1000, 1), "error": str(e)}
+        logger.warning("Warmup step %s failed: %s", name, e)
+
+
+def run_warmup(steps=STEPS):
+    """
+    Run every step once, record its outcome and mark warmup done. A failing
+    step in READY_REQUIRED_STEPS keeps /ready at 503 until a retry succeeds;
+    any other failure is reported but does not hold traffic back.
+    """
+    t0 = time.perf_counter()
+    for name, step in steps:
+        if name == "model" and not WARMUP_MODEL:
+            _steps[name] = {"ok": True, "skipped": True, "ms": 0.0}
+            continue
+        _step_functions[name] = step
+        _run_step(name, step)
+    _ready.set()
+    logger.info("Warmup completed in %.0f ms", (time.perf_counter() - t0) * 1000)
+
+
+def _failing_required() -> list:
+    return [name for name in READY_REQUIRED_STEPS if not _steps.get(name, {"ok": True})["ok"]]
+
+
+def _retry(names: list):
+    global _last_retry
+    # One retry at a time, and not more often than WARMUP_RETRY_SECONDS
+    if time.monotonic() - _last_retry < WARMUP_RETRY_SECONDS or not _retry_lock.acquire(blocking=False):
+        return
+
+    def run():
+        global _last_retry
+        try:
+            for name in names:
+                _run_step(name, _step_functions[name])
+        finally:
+            _last_retry = time.monotonic()
+            _retry_lock.release()
+
+    _last_retry = time.monotonic()
+    threading.Thread(target=run, name="warmup-retry", daemon=True).start()
+
+
+def is_ready() -> bool:
+    """Warmup has run and no required step is failing; a failing one is retried in the background"""
+    if not _ready.is_set():
+        return False
+    failing = _failing_required()
+    if failing:
+        _retry(failing)
+    return not failing
+
+
+def status() -> dict:
+    if not _ready.is_set():
+        state = "starting"
+    elif _failing_required():
+        state = "unavailable"
+    elif all(s["ok"] for s in _steps.values()):
+        state = "ready"
+    else:
+        state = "degraded"
+    return {"status": state, "steps": dict(_steps)}
@@ -0,0 +1,46 @@
+"""
+Shared admin token check for /admin, /history, /body-metrics, X-Profile and high-priority
+admission, and the trusted-proxy check for caller-supplied client ids.
+Fails closed: with no ADMIN_TOKEN or TRUSTED_PROXIES configured nothing is
+authorized or trusted.
+"""
+import hmac
+import ipaddress
+import os
+from typing import Optional
+
+from fastapi import HTTPException
+
+# Required as X-Admin-Token for /admin, /history, /body-metrics and high priority, and as the X-Profile value
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Comma-separated addresses or CIDR ranges of proxies allowed to name the client in X-Client-Id
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(p.strip(), strict=False) for p in os.getenv("TRUSTED_PROXIES", "").split(",") if p.strip()
+]
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """Constant-time comparison against ADMIN_TOKEN; always False when none is set"""
+    if not ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def require_admin(token: Optional[str]):
+    """403 unless `token` is the admin token; endpoints behind it are off while ADMIN_TOKEN is unset"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled: ADMIN_TOKEN is not set")
+    if not is_admin(token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+def is_trusted_proxy(host: Optional[str]) -> bool:
+    """The peer address is in TRUSTED_PROXIES; False for anything unparsable"""
+    if not TRUSTED_PROXIES or not host:
+        return False
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
@@ -0,0 +1,152 @@
+"""
+Counting semaphore shared by every process on the host, with a FIFO queue.
+
+Slots are lock files held with flock(), so the kernel frees a slot when its
+holder exits or crashes. Waiters register in a queue file (guarded by its
+own lock) and take a free slot only when they are at its head; entries of
+dead processes are dropped whenever the queue is read.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: callers fall back to no host-wide limit
+    fcntl = None
+
+# Seconds between checks while waiting for a slot
+POLL_SECONDS = 0.02
+
+_counter = 0
+_counter_lock = threading.Lock()
+
+
+class SlotTimeout(Exception):
+    """No slot became free within the wait limit"""
+
+
+def available() -> bool:
+    return fcntl is not None
+
+
+def _token() -> str:
+    global _counter
+    with _counter_lock:
+        _counter += 1
+        return f"{os.getpid()} {threading.get_ident()}-{_counter}"
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@contextmanager
+def _locked(path: Path):
+    with open(path, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class HostSemaphore:
+    def __init__(self, directory: str, slots: int):
+        self.directory = Path(directory)
+        self.slots = slots
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock_path = self.directory / "queue.lock"
+        self._queue_path = self.directory / "queue"
+
+    def _read_queue(self) -> List[str]:
+        try:
+            lines = self._queue_path.read_text().splitlines()
+        except FileNotFoundError:
+            return []
+        return [line for line in lines if line and _alive(int(line.split(" ", 1)[0]))]
+
+    def _write_queue(self, entries: List[str]):
+        tmp = self._queue_path.with_suffix(f".tmp{os.getpid()}")
+        tmp.write_text("".join(f"{e}\n" for e in entries))
+        os.replace(tmp, self._queue_path)
+
+    def _free_slots(self) -> List[int]:
+        """Descriptors of the slots nobody holds, each now locked by us"""
+        held = []
+        for i in range(self.slots):
+            fd = os.open(self.directory / f"slot-{i}", os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                held.append(fd)
+            except BlockingIOError:
+                os.close(fd)
+        return held
+
+    def _try_take(self, token: str) -> Optional[int]:
+        with _locked(self._lock_path):
+            queue = self._read_queue()
+            if token not in queue:
+                queue.append(token)
+            elif queue.index(token) >= self.slots:
+                # Too far back for any slot: no need to probe them
+                return None
+            free = self._free_slots()
+            position = queue.index(token)
+            taken = None
+            # Strict FIFO: the first len(free) waiters get the free slots
+            if position < len(free):
+                taken = free.pop(0)
+                queue.remove(token)
+            for fd in free:
+                os.close(fd)
+            self._write_queue(queue)
+            return taken
+
+    def _leave(self, token: str):
+        with _locked(self._lock_path):
+            queue = self._read_queue()
+            if token in queue:
+                queue.remove(token)
+            self._write_queue(queue)
+
+    def acquire(self, timeout: Optional[float] = None) -> int:
+        """Wait in line for a slot; returns its handle for release(). Raises SlotTimeout after `timeout` seconds"""
+        token = _token()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            while True:
+                fd = self._try_take(token)
+                if fd is not None:
+                    return fd
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise SlotTimeout(f"no slot free in {self.directory} after {timeout:.0f}s")
+                time.sleep(POLL_SECONDS)
+        except BaseException:
+            self._leave(token)
+            raise
+
+    def release(self, fd: int):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    @contextmanager
+    def hold(self, timeout: Optional[float] = None):
+        fd = self.acquire(timeout)
+        try:
+            yield
+        finally:
+            self.release(fd)
+
+    def waiting(self) -> int:
+        with _locked(self._lock_path):
+            return len(self._read_queue())
@@ -46,3 +46,27 @@ def parse_json_safe(s: str):
 
     # If all else fails, raise the original error
     raise ValueError(f"Could not parse JSON from LLM output. First 500 chars: {s[:500]}")
+
+
+def salvage_array_items(s: str, key: str) -> list:
+    """
+    Complete items of the JSON array under `key`, even when the document
+    around them is truncated or broken: decoding stops at the first item
+    that does not parse.
+    """
+    m = re.search(r'"%s"\s*:\s*\[' % re.escape(key), s)
+    if not m:
+        return []
+    decoder = json.JSONDecoder()
+    items = []
+    pos = m.end()
+    while True:
+        while pos < len(s) and s[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(s) or s[pos] == "]":
+            return items
+        try:
+            item, pos = decoder.raw_decode(s, pos)
+        except json.JSONDecodeError:
+            return items
+        items.append(item)
@@ -0,0 +1,199 @@
+"""
+Non-blocking, structured logging.
+
+Callers only put records on an in-memory queue (QueueHandler); one listener
+thread formats them and does the I/O, so a slow disk or container stdout
+never stalls the event loop, a pipeline thread or the MQTT loop. When the
+queue is full, records are dropped and counted rather than waited on.
+Every record carries the id of the request (or MQTT message) it belongs to.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from app.utils.metrics import LOG_RECORDS_DROPPED
+
+# ========================
+# Configuration
+# ========================
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" (one object per line) or "text"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Verbose payload logs (model output, MQTT messages): at most this many per minute
+# and kind, each cut to LOG_PAYLOAD_CHARS; 0 turns them off
+LOG_PAYLOADS_PER_MINUTE = float(os.getenv("LOG_PAYLOADS_PER_MINUTE", "6"))
+LOG_PAYLOAD_CHARS = int(os.getenv("LOG_PAYLOAD_CHARS", "2000"))
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s [%(name)s] [%(request_id)s] %(message)s"
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_STANDARD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id"}
+
+_request_id: ContextVar[str] = ContextVar("request_id", default="-")
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# ========================
+# Request id
+# ========================
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def set_request_id(request_id: str):
+    """Tag every record logged from this context (and tasks/threads copied from it)"""
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+def get_request_id() -> str:
+    return _request_id.get()
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        return True
+
+# ========================
+# Handlers and formatters
+# ========================
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Only %-merges the message in the calling thread (exceptions are rendered
+    there too, while the traceback is alive); everything else happens in the
+    listener. A full queue drops the record instead of blocking.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # At shutdown, wait for room rather than lose the stop signal
+        self.queue.put(self._sentinel)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def setup_logging(stream=None):
+    """
+    Route the root logger through the queue; idempotent. The listener thread
+    writes to `stream` (stderr by default).
+    """
+    global _listener
+    if _listener is not None:
+        return
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+    queue_handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    queue_handler.addFilter(RequestIdFilter())
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+    _listener = _Listener(queue_handler.queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush what is queued and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+# ========================
+# Payload sampling
+# ========================
+
+class _Budget:
+    """Token bucket refilled at LOG_PAYLOADS_PER_MINUTE"""
+
+    def __init__(self):
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.skipped = 0
+
+
+_budgets: Dict[str, _Budget] = {}
+_budgets_lock = threading.Lock()
+
+
+def _take(kind: str):
+    """(allowed, payloads skipped since the last allowed one)"""
+    if LOG_PAYLOADS_PER_MINUTE <= 0:
+        return False, 0
+    with _budgets_lock:
+        budget = _budgets.setdefault(kind, _Budget())
+        now = time.monotonic()
+        budget.tokens = min(1.0, budget.tokens + (now - budget.updated) * LOG_PAYLOADS_PER_MINUTE / 60)
+        budget.updated = now
+        if budget.tokens < 1.0:
+            budget.skipped += 1
+            return False, 0
+        budget.tokens -= 1.0
+        skipped, budget.skipped = budget.skipped, 0
+        return True, skipped
+
+
+def log_payload(logger: logging.Logger, level: int, kind: str, payload):
+    """
+    Log a verbose payload, rate limited per kind and truncated. Nothing is
+    formatted when the level is off or the budget is spent.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    allowed, skipped = _take(kind)
+    if not allowed:
+        return
+    text = payload if isinstance(payload, str) else str(payload)
+    if len(text) > LOG_PAYLOAD_CHARS:
+        text = text[:LOG_PAYLOAD_CHARS] + f"... [{len(text) - LOG_PAYLOAD_CHARS} more chars]"
+    logger.log(level, "%s payload: %s", kind, text, extra={"payload_kind": kind, "payloads_skipped": skipped})
@@ -0,0 +1,133 @@
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+# Latency buckets from sub-millisecond regex work up to multi-minute LLM calls
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120, 300)
+
+# ========================
+# API pipeline
+# ========================
+
+STAGE_SECONDS = Histogram(
+    "analyze_stage_seconds", "Time spent in each /analyze pipeline stage",
+    ["stage"], buckets=STAGE_BUCKETS,
+)
+EXTRACT_SECONDS = Histogram(
+    "extract_document_seconds", "Text extraction time per document",
+    ["engine"], buckets=STAGE_BUCKETS,
+)
+EXTRACT_PAGE_SECONDS = Histogram(
+    "extract_page_seconds", "Text extraction time per page",
+    ["engine"], buckets=STAGE_BUCKETS,
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds", "HTTP request latency",
+    ["method", "route", "status"], buckets=STAGE_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+ANALYZE_IN_FLIGHT = Gauge("analyze_in_flight", "/analyze requests currently in the pipeline")
+ANALYZE_RESULTS = Counter("analyze_results_total", "Analysis results by how they were produced", ["source"])
+ADMISSION_DECISIONS = Counter("admission_decisions_total", "Admission control decisions", ["priority", "decision"])
+ADMISSION_QUEUE_DEPTH = Gauge("admission_queue_depth", "Admitted requests waiting for an LLM slot")
+ADMISSION_WAIT_SECONDS = Histogram(
+    "admission_wait_seconds", "Time from admission to an LLM slot",
+    ["priority"], buckets=STAGE_BUCKETS,
+)
+
+# ========================
+# LLM
+# ========================
+
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_seconds", "Wall-clock time of Ollama generate calls",
+    ["model"], buckets=STAGE_BUCKETS,
+)
+LLM_IN_FLIGHT = Gauge("llm_requests_in_flight", "Ollama calls currently outstanding")
+LLM_HOST_SLOT_WAIT_SECONDS = Histogram(
+    "llm_host_slot_wait_seconds", "Wait for a host-wide Ollama slot shared by worker processes",
+    ["model"], buckets=STAGE_BUCKETS,
+)
+LLM_FAILURES = Counter("llm_failures_total", "Failed Ollama calls", ["model"])
+OLLAMA_DURATION_SECONDS = Histogram(
+    "ollama_duration_seconds", "Durations reported by Ollama itself",
+    ["model", "phase"], buckets=STAGE_BUCKETS,
+)
+OLLAMA_TOKENS = Counter("ollama_tokens_total", "Tokens processed by Ollama", ["model", "kind"])
+LLM_TIER_SECONDS = Histogram(
+    "llm_tier_seconds", "LLM stage time per cascade tier (single when the cascade is off)",
+    ["tier"], buckets=STAGE_BUCKETS,
+)
+LLM_TIER_RESULTS = Counter("llm_tier_results_total", "Answers accepted from each cascade tier", ["tier"])
+CASCADE_ESCALATIONS = Counter(
+    "llm_cascade_escalations_total", "Fast-tier answers re-run on the large model", ["reason"],
+)
+LLM_REPAIRS = Counter("llm_repairs_total", "Follow-up prompts for missed or invalid lines", ["outcome"])
+LLM_REPAIR_LINES = Histogram(
+    "llm_repair_lines", "Report lines per repair prompt", buckets=(1, 2, 3, 5, 8, 13, 21, 34),
+)
+CASCADE_SCORE = Histogram(
+    "llm_cascade_score", "Quality score of fast-tier answers",
+    buckets=(0.1, 0.25, 0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 1.0),
+)
+
+# ========================
+# Caches
+# ========================
+
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups", ["cache", "result"])
+
+# ========================
+# Logging
+# ========================
+
+LOG_RECORDS_DROPPED = Counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+
+# ========================
+# MQTT consumer
+# ========================
+
+MQTT_STAGE_SECONDS = Histogram(
+    "mqtt_stage_seconds", "Time spent in each MQTT ingestion stage",
+    ["stage"], buckets=STAGE_BUCKETS,
+)
+MQTT_MESSAGES = Counter("mqtt_messages_total", "MQTT messages by outcome", ["source", "result"])
+MQTT_SPOOLED = Counter("mqtt_spooled_total", "Measurements appended to the offline spool")
+
+
+@contextmanager
+def timed(histogram, *labels):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(*labels).observe(time.perf_counter() - t0)
+
+
+def stage_timer(stage: str):
+    """Time a block as one /analyze pipeline stage"""
+    return timed(STAGE_SECONDS, stage)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def render_latest():
+    """Prometheus text exposition; aggregates worker processes in multiprocess mode"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
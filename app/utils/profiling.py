@@ -0,0 +1,190 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from app.utils import auth
+
+# ========================
+# Configuration
+# ========================
+
+# Fraction of requests profiled automatically (0 = only on explicit request)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+
+PROFILE_HEADER = "x-profile"
+
+# ========================
+# Sampling profiler
+# ========================
+
+_current: ContextVar[Optional["ProfileSession"]] = ContextVar("profile_session", default=None)
+_finished = OrderedDict()
+_finished_lock = threading.Lock()
+
+
+class ProfileSession:
+    """Samples the stacks of the threads serving one request"""
+
+    def __init__(self, name: str, interval: float = PROFILE_INTERVAL_SECONDS, session_id: Optional[str] = None):
+        # The request id when started from a request, so logs and profile line up
+        self.id = session_id or uuid.uuid4().hex[:16]
+        self.name = name
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = time.time()
+        self.duration = 0.0
+        self._threads = {threading.get_ident()}
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._run, name=f"profiler-{self.id}", daemon=True)
+
+    def start(self):
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+        self.duration = time.time() - self.started_at
+
+    def add_thread(self, ident: int):
+        self._threads.add(ident)
+
+    def remove_thread(self, ident: int):
+        self._threads.discard(ident)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in list(self._threads):
+                frame = frames.get(ident)
+                if frame is not None and not _is_idle(frame):
+                    self.stacks[_collapse(frame)] += 1
+                    self.samples += 1
+
+
+def _is_idle(frame) -> bool:
+    """Event loop parked in select(): nothing to attribute to the request"""
+    return frame.f_code.co_name == "select" and frame.f_code.co_filename.endswith("selectors.py")
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        names.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def should_profile(headers) -> bool:
+    """Cheap check done for every request; no work unless profiling is requested"""
+    requested = headers.get(PROFILE_HEADER)
+    if requested is not None:
+        # The header value is the admin token; ignored when none is configured
+        return auth.is_admin(requested)
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def start(name: str, session_id: Optional[str] = None) -> ProfileSession:
+    session = ProfileSession(name, session_id=session_id).start()
+    _current.set(session)
+    return session
+
+
+def finish(session: ProfileSession):
+    session.stop()
+    with _finished_lock:
+        _finished[session.id] = session
+        while len(_finished) > PROFILE_KEEP:
+            _finished.popitem(last=False)
+
+
+@contextmanager
+def attach_current_thread():
+    """
+    Include the calling worker thread in the active request profile.
+    Sync route handlers run in a threadpool; the profile session follows
+    them there through the copied context. No-op when not profiling.
+    """
+    session = _current.get()
+    if session is None:
+        yield
+        return
+    ident = threading.get_ident()
+    session.add_thread(ident)
+    try:
+        yield
+    finally:
+        session.remove_thread(ident)
+
+# ========================
+# Stored profiles
+# ========================
+
+def list_profiles():
+    with _finished_lock:
+        sessions = list(_finished.values())
+    return [
+        {
+            "id": s.id,
+            "name": s.name,
+            "started_at": s.started_at,
+            "duration_ms": round(s.duration * 1000, 1),
+            "samples": s.samples,
+        }
+        for s in reversed(sessions)
+    ]
+
+
+def get_profile(profile_id: str) -> Optional[ProfileSession]:
+    with _finished_lock:
+        return _finished.get(profile_id)
+
+
+def to_collapsed(session: ProfileSession) -> str:
+    """Brendan Gregg collapsed-stack format (flamegraph.pl, speedscope, inferno)"""
+    return "".join(f"{stack} {count}\n" for stack, count in session.stacks.most_common())
+
+
+def to_speedscope(session: ProfileSession) -> str:
+    frames, index = [], {}
+    samples, weights = [], []
+    interval_ms = session.interval * 1000
+    for stack, count in session.stacks.most_common():
+        ids = []
+        for name in stack.split(";"):
+            if name not in index:
+                index[name] = len(frames)
+                frames.append({"name": name})
+            ids.append(index[name])
+        samples.append(ids)
+        weights.append(count * interval_ms)
+    return json.dumps({
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": session.name,
+        "exporter": "bloodreport-profiler",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": session.name,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights,
+        }],
+    })
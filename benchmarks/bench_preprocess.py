@@ -0,0 +1,83 @@
+"""
+Micro-benchmark: single-pass line classifier vs the previous compress_report_text.
+
+    python -m benchmarks.bench_preprocess --pages 50
+"""
+import argparse
+import random
+import re
+import timeit
+
+from app.services.preprocess import PARAM_HINTS, compress_report_text
+from generate_reports import synthetic_report
+
+LEGACY_UNIT_PATTERN = re.compile(r"\b(%|mg/dl|g/dl|mmol/l|10\^\d+/u?l|10\^\d+/?l|g/l|ng/ml|pg/ml|fl|u/l|iu/l|k/u?l|m/u?l|cells/u?l)\b", re.I)
+LEGACY_NUMBER_PATTERN = re.compile(r"[-+]?\b\d+(?:\.\d+)?\b")
+
+
+def legacy_compress_report_text(text: str, max_chars: int = 3000) -> str:
+    """compress_report_text before the single-pass classifier, kept for comparison"""
+    lines = [l.strip() for l in text.splitlines()]
+    keep = []
+    for l in lines:
+        if not l:
+            continue
+        lower = l.lower()
+        has_number = bool(LEGACY_NUMBER_PATTERN.search(lower))
+        has_unit = bool(LEGACY_UNIT_PATTERN.search(lower))
+        has_hint = any(h in lower for h in PARAM_HINTS)
+        if (has_number and has_unit) or has_hint:
+            keep.append(l)
+    if len(keep) < 10:
+        keep.extend([l for l in lines if ":" in l])
+    seen = set()
+    filtered = []
+    for l in keep:
+        if l not in seen:
+            seen.add(l)
+            filtered.append(l)
+    result = "\n".join(filtered)
+    if len(result) <= max_chars:
+        return result
+    return result[:max_chars]
+
+
+NOISE = [
+    "This report is electronically generated and does not require a signature.",
+    "Please correlate clinically. Sample collected at the health centre.",
+    "Page footer: ABC Diagnostics, 42 Lab Street, Phone 555-0199",
+    "Method: automated analyser; results verified by the pathologist on duty",
+    "Note: values may vary with age, gender and medications",
+]
+
+
+def ocr_like_text(pages: int, seed: int = 0) -> str:
+    """Report pages interleaved with the boilerplate OCR typically picks up"""
+    rng = random.Random(seed)
+    parts = []
+    for page in range(pages):
+        content, _ = synthetic_report(n_params=20, seed=seed + page)
+        lines = content.splitlines()
+        for _ in range(40):
+            lines.insert(rng.randrange(len(lines) + 1), rng.choice(NOISE))
+        parts.append("\n".join(lines))
+    return "\n".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--max-chars", type=int, default=1_000_000, help="large default so both do all the work")
+    args = parser.parse_args()
+
+    text = ocr_like_text(args.pages)
+    n_lines = text.count("\n") + 1
+    for name, fn in (("legacy", legacy_compress_report_text), ("classifier", compress_report_text)):
+        best = min(timeit.repeat(lambda: fn(text, args.max_chars), number=1, repeat=args.repeat))
+        kept = fn(text, args.max_chars).count("\n") + 1
+        print(f"{name:>10}: {best * 1000:8.2f} ms for {n_lines} lines ({best / n_lines * 1e6:.2f} us/line), kept {kept}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Micro-benchmark: /analyze output path, previous vs pydantic-core fast path.
+
+legacy: parse_json_safe -> value cleanup -> AnalysisResult(**parsed)
+        -> JSONResponse(model_dump()) -> response_model re-validation
+fast:   AnalysisResult.model_validate_json -> model_dump_json -> Response
+
+    python -m benchmarks.bench_serialization --params 100
+"""
+import argparse
+import json
+import timeit
+
+from fastapi.responses import JSONResponse, Response
+
+from app.schemas.analysis import AnalysisResult
+from app.services.pipeline import parse_analysis
+from app.utils.json_safe import parse_json_safe
+from generate_reports import synthetic_report
+
+
+def llm_like_output(n_params: int) -> str:
+    _, labels = synthetic_report(n_params=n_params, n_pages=1, seed=0)
+    parameters = [
+        {**label, "risk": None, "explanation": f"{label['name']} is {label['status']}"}
+        for label in labels
+    ]
+    abnormal = sum(1 for p in parameters if p["status"] != "normal")
+    return json.dumps({
+        "summary": {"abnormal_count": abnormal, "risk_level": "high" if abnormal >= 6 else "medium"},
+        "parameters": parameters,
+    })
+
+
+def legacy_path(llm_output: str) -> bytes:
+    parsed = parse_json_safe(llm_output)
+    for param in parsed.get("parameters", []):
+        if "value" not in param or param["value"] is None:
+            param["value"] = ""
+        elif not isinstance(param["value"], str):
+            param["value"] = str(param["value"])
+    result = AnalysisResult(**parsed)
+    content = result.model_dump()
+    # FastAPI validated dict returns against response_model before encoding
+    AnalysisResult.model_validate(content)
+    return JSONResponse(content=content).body
+
+
+def fast_path(llm_output: str) -> bytes:
+    result = parse_analysis(llm_output)
+    return Response(content=result.model_dump_json(), media_type="application/json").body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--params", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    output = llm_like_output(args.params)
+    assert json.loads(legacy_path(output))["parameters"] == json.loads(fast_path(output))["parameters"]
+    for name, fn in (("legacy", legacy_path), ("fast", fast_path)):
+        best = min(timeit.repeat(lambda: fn(output), number=1, repeat=args.repeat))
+        print(f"{name:>6}: {best * 1e6:9.1f} us for {args.params} parameters ({len(output)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+Speed-vs-accuracy evaluation over gold-labeled reports.
+
+Renders synthetic reports from generate_reports.py (line and table layouts)
+plus the sample_reports fixtures, then runs every combination of the grid
+options through the pipeline against the fake Ollama (or a real one with
+--ollama-url). Each configuration runs in a fresh worker process, since the
+model, token limits and PDF engine are read at import time; the extraction,
+section and near-duplicate caches are off so every run does the full work.
+
+Per configuration it reports parameter precision/recall (a parameter counts
+when its name and value match a label), the labels missed most often,
+latency and Ollama token counts, and picks the fastest configuration that
+meets --min-recall and --min-precision.
+
+    python -m benchmarks.eval_grid --docs 8 --max-chars 1500,3000 \\
+        --num-predict 120,2000 --num-ctx 2048 --engine pdfplumber,pymupdf
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from benchmarks.fake_ollama import LINE_PATTERN, FakeOllama, _status
+from benchmarks.run_bench import ROOT, _git_commit, percentile
+
+GRID_OPTIONS = ("model", "max_chars", "num_predict", "num_ctx", "engine")
+
+# ========================
+# Corpus
+# ========================
+
+def fixture_labels(content: str):
+    """Gold labels of a hand-written fixture: its "Name: value unit (range)" lines"""
+    labels = []
+    for line in content.splitlines():
+        m = LINE_PATTERN.match(line.strip())
+        if m:
+            fields = {k: v.strip() for k, v in m.groupdict().items()}
+            labels.append({
+                "name": fields["name"], "value": fields["value"], "unit": fields["unit"],
+                "normal_range": fields["range"], "status": _status(fields["value"], fields["range"]),
+            })
+    return labels
+
+
+def build_corpus(out_dir: Path, docs: int, params: int, pages: int, fixtures: bool, seed: int = 0):
+    """Synthetic PDFs alternating line and table layout, plus the fixtures; writes corpus.json"""
+    from generate_reports import SAMPLE_REPORTS, create_pdf, synthetic_report
+
+    corpus = []
+    # create_pdf announces every file it writes; keep stdout for the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(docs):
+            layout = "table" if i % 2 else "lines"
+            content, labels = synthetic_report(n_params=params, n_pages=pages, seed=seed + i, layout=layout)
+            path = create_pdf(f"synthetic_{i:04d}_{layout}.pdf", content, out_dir)
+            corpus.append({"file": path.name, "labels": labels})
+        if fixtures:
+            for report in SAMPLE_REPORTS:
+                path = create_pdf(report["filename"], report["content"], out_dir)
+                corpus.append({"file": path.name, "labels": fixture_labels(report["content"])})
+    (out_dir / "corpus.json").write_text(json.dumps(corpus))
+    return corpus
+
+# ========================
+# Scoring
+# ========================
+
+def _same_value(a: str, b: str) -> bool:
+    from app.services.analytes import parse_number
+
+    x, y = parse_number(a), parse_number(b)
+    if x is None or y is None:
+        return (a or "").strip() == (b or "").strip()
+    return abs(x - y) < 1e-9
+
+
+def match(labels, params):
+    """(true positives, matched with the right status, names of the labels no parameter matched)"""
+    from app.services.analytes import normalize_name
+
+    unused = list(params)
+    tp, status_ok, missed = 0, 0, []
+    for label in labels:
+        name = normalize_name(label["name"])
+        found = next((p for p in unused if normalize_name(p["name"]) == name
+                      and _same_value(p.get("value"), label["value"])), None)
+        if found is None:
+            missed.append(label["name"])
+            continue
+        unused.remove(found)
+        tp += 1
+        status_ok += found.get("status") == label["status"]
+    return tp, status_ok, missed
+
+
+def score(docs):
+    """Precision/recall over every parameter of every document"""
+    tp = status_ok = predicted = expected = 0
+    missed = Counter()
+    for doc in docs:
+        doc_tp, doc_status, doc_missed = match(doc["labels"], doc["params"])
+        tp += doc_tp
+        status_ok += doc_status
+        predicted += len(doc["params"])
+        expected += len(doc["labels"])
+        missed.update(doc_missed)
+    precision = tp / predicted if predicted else 0.0
+    recall = tp / expected if expected else 0.0
+    return {
+        "precision": round(precision, 4),
+        "recall": round(recall, 4),
+        "f1": round(2 * precision * recall / (precision + recall), 4) if precision + recall else 0.0,
+        "status_accuracy": round(status_ok / tp, 4) if tp else 0.0,
+        "most_missed": dict(missed.most_common(5)),
+    }
+
+# ========================
+# Worker: one configuration
+# ========================
+
+def run_worker(config: dict, corpus_dir: Path):
+    """Analyze the corpus with this configuration; prints one JSON line of raw results"""
+    from app.services import llm_client, pipeline
+    from app.utils.metrics import OLLAMA_TOKENS
+
+    # Not an environment setting: patched where extract_stage reads it
+    pipeline.COMPRESS_MAX_CHARS = config["max_chars"]
+    corpus = json.loads((corpus_dir / "corpus.json").read_text())
+    docs, latencies, errors = [], [], []
+    tokens_before = {k: OLLAMA_TOKENS.labels(llm_client.MODEL, k)._value.get() for k in ("prompt", "eval")}
+    for item in corpus:
+        content = (corpus_dir / item["file"]).read_bytes()
+        t0 = time.perf_counter()
+        try:
+            result = pipeline.analyze_document("pdf", content, client="eval")
+            params = [p.model_dump() for p in result.parameters]
+        except pipeline.AnalysisError as e:
+            errors.append(f"{item['file']}: {e.status_code} {e.detail[:120]}")
+            params = []
+        latencies.append((time.perf_counter() - t0) * 1000)
+        docs.append({"labels": item["labels"], "params": params})
+    tokens = {k: OLLAMA_TOKENS.labels(llm_client.MODEL, k)._value.get() - v for k, v in tokens_before.items()}
+    print(json.dumps({"docs": docs, "latencies_ms": latencies, "errors": errors, "ollama_tokens": tokens}))
+
+
+def _worker_env(config: dict, ollama_url: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "OLLAMA_API_URL": ollama_url,
+        "OLLAMA_MODEL": config["model"],
+        "OLLAMA_NUM_PREDICT": str(config["num_predict"]),
+        "OLLAMA_NUM_CTX": str(config["num_ctx"]),
+        "PDF_ENGINE": config["engine"],
+        # Every configuration does the full work
+        "EXTRACT_CACHE_DIR": "",
+        "SECTION_CACHE_PATH": "",
+        "NEAR_DUP_INDEX_PATH": "",
+        "ADMISSION_MAX_WAIT_SECONDS": "0",
+        "PYTHONPATH": str(ROOT),
+    })
+    return env
+
+
+def run_config(config: dict, corpus_dir: Path, ollama_url: str) -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmarks.eval_grid", "--worker", json.dumps(config), "--corpus-dir", str(corpus_dir)],
+        env=_worker_env(config, ollama_url), cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        return {"config": config, "failed": proc.stderr.strip().splitlines()[-1:]}
+    raw = json.loads(proc.stdout.strip().splitlines()[-1])
+    latencies = sorted(raw["latencies_ms"])
+    return {
+        "config": config,
+        "documents": len(raw["docs"]),
+        "errors": len(raw["errors"]),
+        "error_samples": raw["errors"][:3],
+        **score(raw["docs"]),
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "mean": round(statistics.fmean(latencies), 3) if latencies else None,
+        },
+        "ollama_tokens": raw["ollama_tokens"],
+    }
+
+
+def choose(results, min_recall: float, min_precision: float):
+    """Fastest configuration (mean latency) meeting the quality bar, or None"""
+    passing = [
+        r for r in results
+        if "failed" not in r and r["recall"] >= min_recall and r["precision"] >= min_precision
+    ]
+    return min(passing, key=lambda r: r["latency_ms"]["mean"], default=None)
+
+
+def _grid(args):
+    values = {
+        "model": args.model.split(","),
+        "max_chars": [int(v) for v in args.max_chars.split(",")],
+        "num_predict": [int(v) for v in args.num_predict.split(",")],
+        "num_ctx": [int(v) for v in args.num_ctx.split(",")],
+        "engine": args.engine.split(","),
+    }
+    return [dict(zip(GRID_OPTIONS, combo)) for combo in itertools.product(*(values[o] for o in GRID_OPTIONS))]
+
+
+def _fake_models(specs):
+    """"name:token_rate:recall" profiles for the fake server"""
+    models = {}
+    for spec in specs or []:
+        name, token_rate, recall = spec.rsplit(":", 2)
+        models[name] = {"token_rate": float(token_rate), "recall": float(recall)}
+    return models
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precision/recall vs latency over a grid of pipeline settings")
+    parser.add_argument("--docs", type=int, default=8, help="synthetic PDFs in the corpus")
+    parser.add_argument("--params", type=int, default=24, help="lab parameters per synthetic report")
+    parser.add_argument("--pages", type=int, default=1, help="pages per synthetic report")
+    parser.add_argument("--no-fixtures", action="store_true", help="leave out the sample_reports fixtures")
+    parser.add_argument("--model", default=os.getenv("OLLAMA_MODEL", "mistral"), help="comma-separated models")
+    parser.add_argument("--max-chars", default="3000", help="comma-separated compression budgets")
+    parser.add_argument("--num-predict", default="120,2000", help="comma-separated generation limits")
+    parser.add_argument("--num-ctx", default="2048", help="comma-separated context sizes")
+    parser.add_argument("--engine", default="pdfplumber,pymupdf", help="comma-separated PDF engines")
+    parser.add_argument("--min-recall", type=float, default=0.95, help="quality bar for the recommendation")
+    parser.add_argument("--min-precision", type=float, default=0.95, help="quality bar for the recommendation")
+    parser.add_argument("--ollama-url", help="evaluate against this Ollama instead of the fake one")
+    parser.add_argument("--token-rate", type=float, default=400.0, help="fake generated tokens per second")
+    parser.add_argument("--prompt-rate", type=float, default=4000.0, help="fake prompt tokens per second")
+    parser.add_argument("--fake-model", action="append", metavar="NAME:TOKEN_RATE:RECALL",
+                        help="per-model profile for the fake server (repeatable)")
+    parser.add_argument("--corpus-dir", help="keep the generated corpus here instead of a temp dir")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(json.loads(args.worker), Path(args.corpus_dir))
+        return
+
+    fake = None
+    if not args.ollama_url:
+        fake = FakeOllama(token_rate=args.token_rate, prompt_rate=args.prompt_rate,
+                          models=_fake_models(args.fake_model)).start()
+    ollama_url = args.ollama_url or fake.url
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = Path(args.corpus_dir or tmp)
+        corpus_dir.mkdir(parents=True, exist_ok=True)
+        corpus = build_corpus(corpus_dir, args.docs, args.params, args.pages, not args.no_fixtures)
+        results = []
+        for config in _grid(args):
+            result = run_config(config, corpus_dir, ollama_url)
+            results.append(result)
+            print(f"{config}: " + (f"failed {result['failed']}" if "failed" in result else
+                                   f"P={result['precision']:.3f} R={result['recall']:.3f} "
+                                   f"mean={result['latency_ms']['mean']:.0f} ms"), file=sys.stderr)
+    if fake is not None:
+        fake.stop()
+
+    best = choose(results, args.min_recall, args.min_precision)
+    report = {
+        "commit": _git_commit(),
+        "corpus": {"documents": len(corpus), "labels": sum(len(c["labels"]) for c in corpus)},
+        "quality_bar": {"min_recall": args.min_recall, "min_precision": args.min_precision},
+        "recommended": best["config"] if best else None,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Local stand-in for the Ollama HTTP API used by benchmarks.
+
+Answers POST /api/generate by pulling "Name: value unit (range)" and
+"name | value | unit | range" lines out of the report section of the prompt
+and returning them as the analysis JSON. Latency follows a token-rate model
+(prompt tokens / prompt_rate + generated tokens / token_rate), generation is
+cut off at `num_predict` tokens like the real model, a prompt longer than
+`num_ctx` tokens loses its beginning as Ollama truncates it, and at most
+`parallel` requests are processed at once, mirroring OLLAMA_NUM_PARALLEL.
+Per-model overrides (`models`) give a model its own token rate and a recall
+below 1, which drops that share of the parameters like a weaker model would.
+
+Run standalone:
+    python -m benchmarks.fake_ollama --port 11435 --token-rate 40
+
+In-process tests use start_for_tests(), which also points llm_client at the
+server and isolates the report caches.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHARS_PER_TOKEN = 4
+
+LINE_PATTERN = re.compile(
+    r"^(?P<name>[A-Za-z][^:|]*?)\s*:\s*(?P<value>[-+]?\d[\d,]*(?:\.\d+)?)\s*(?P<unit>[^\s(]*)\s*\((?P<range>[^)]*)\)"
+)
+TABLE_PATTERN = re.compile(r"^(?P<name>[^|]+)\|(?P<value>[^|]+)\|(?P<unit>[^|]*)\|(?P<range>[^|]*)$")
+
+
+def _status(value: str, normal_range: str) -> str:
+    try:
+        v = float(value.replace(",", ""))
+        nums = [float(n.replace(",", "")) for n in re.findall(r"\d[\d,]*(?:\.\d+)?", normal_range)]
+    except ValueError:
+        return "normal"
+    if "<" in normal_range and nums:
+        return "high" if v >= nums[0] else "normal"
+    if ">" in normal_range and nums:
+        return "low" if v <= nums[0] else "normal"
+    if len(nums) >= 2:
+        return "low" if v < nums[0] else "high" if v > nums[1] else "normal"
+    return "normal"
+
+
+def _report_section(prompt: str) -> str:
+    parts = prompt.split("---\n")
+    return parts[1] if len(parts) >= 3 else prompt
+
+
+def fake_analysis(prompt: str, recall: float = 1.0) -> str:
+    # Same prompt, same dropped parameters
+    rng = random.Random(prompt)
+    params = []
+    for line in _report_section(prompt).splitlines():
+        line = line.strip()
+        m = LINE_PATTERN.match(line) or TABLE_PATTERN.match(line)
+        if not m:
+            continue
+        if recall < 1.0 and rng.random() >= recall:
+            continue
+        fields = {k: v.strip() for k, v in m.groupdict().items()}
+        params.append({
+            "name": fields["name"],
+            "value": fields["value"],
+            "unit": fields["unit"],
+            "normal_range": fields["range"],
+            "status": _status(fields["value"], fields["range"]),
+            "risk": None,
+            "explanation": None,
+        })
+    abnormal = sum(1 for p in params if p["status"] != "normal")
+    risk = "low" if abnormal == 0 else "medium" if abnormal <= 5 else "high"
+    return json.dumps({"summary": {"abnormal_count": abnormal, "risk_level": risk}, "parameters": params})
+
+
+class FakeOllama:
+    def __init__(self, host="127.0.0.1", port=0, token_rate=40.0, prompt_rate=400.0,
+                 load_seconds=0.0, parallel=1, models=None):
+        self.token_rate = token_rate
+        self.prompt_rate = prompt_rate
+        # model name -> {"token_rate", "prompt_rate", "recall"} overrides
+        self.models = models or {}
+        self.load_seconds = load_seconds
+        self._slots = threading.Semaphore(parallel)
+        self._loaded = set()
+        self.requests = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def generate(self, body: dict) -> dict:
+        model = body.get("model", "")
+        options = body.get("options") or {}
+        prompt = body.get("prompt", "")
+        num_predict = int(options.get("num_predict", 128))
+        num_ctx = int(options.get("num_ctx", 2048))
+        if len(prompt) > num_ctx * CHARS_PER_TOKEN:
+            prompt = prompt[-num_ctx * CHARS_PER_TOKEN:]
+        profile = self.models.get(model, {})
+        token_rate = profile.get("token_rate", self.token_rate)
+        prompt_rate = profile.get("prompt_rate", self.prompt_rate)
+
+        output = fake_analysis(prompt, profile.get("recall", 1.0))
+        eval_count = -(-len(output) // CHARS_PER_TOKEN)
+        if num_predict >= 0 and eval_count > num_predict:
+            output = output[: num_predict * CHARS_PER_TOKEN]
+            eval_count = num_predict
+        prompt_eval_count = -(-len(prompt) // CHARS_PER_TOKEN)
+
+        with self._slots:
+            self.requests += 1
+            load = 0.0
+            if model not in self._loaded:
+                load = self.load_seconds
+                self._loaded.add(model)
+            prompt_eval = prompt_eval_count / prompt_rate
+            eval_ = eval_count / token_rate
+            time.sleep(load + prompt_eval + eval_)
+
+        return {
+            "model": model,
+            "response": output,
+            "done": True,
+            "total_duration": int((load + prompt_eval + eval_) * 1e9),
+            "load_duration": int(load * 1e9),
+            "prompt_eval_count": prompt_eval_count,
+            "prompt_eval_duration": int(prompt_eval * 1e9),
+            "eval_count": eval_count,
+            "eval_duration": int(eval_ * 1e9),
+        }
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send(200, {"models": [{"name": m} for m in sorted(fake._loaded)]})
+                else:
+                    self._send(404, {"error": "not found"})
+
+            def do_POST(self):
+                if self.path != "/api/generate":
+                    self._send(404, {"error": "not found"})
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    self._send(400, {"error": "invalid JSON"})
+                    return
+                self._send(200, fake.generate(body))
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def start_for_tests(caches=(), num_predict=4000, **options) -> FakeOllama:
+    """
+    Start a fake server and point llm_client at it. The report caches named in
+    `caches` ("sections", "near_duplicates", "extraction") get files in a
+    fresh temp dir, fake.cache_dir; the rest are switched off, so no test
+    sees results another one stored.
+    """
+    fake = FakeOllama(**options).start()
+    # llm_client reads these at import time...
+    os.environ["OLLAMA_API_URL"] = fake.url
+    os.environ["OLLAMA_NUM_PREDICT"] = str(num_predict)
+    from app.services import extraction_cache, llm_client, near_duplicates, section_cache
+
+    # ...and may already have been imported
+    llm_client.OLLAMA_API_URL = fake.url
+    llm_client.OLLAMA_NUM_PREDICT = num_predict
+
+    fake.cache_dir = tempfile.mkdtemp(prefix="fake-ollama-")
+
+    def cache_path(name: str, filename: str) -> str:
+        return os.path.join(fake.cache_dir, filename) if name in caches else ""
+
+    section_cache.reset_connection(cache_path("sections", "sections.sqlite3"))
+    near_duplicates.reset_connection(cache_path("near_duplicates", "near_duplicates.sqlite3"))
+    extraction_cache.EXTRACT_CACHE_DIR = cache_path("extraction", "extracted")
+    return fake
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--token-rate", type=float, default=40.0, help="generated tokens per second")
+    parser.add_argument("--prompt-rate", type=float, default=400.0, help="prompt tokens per second")
+    parser.add_argument("--load-seconds", type=float, default=0.0, help="one-time model load delay")
+    parser.add_argument("--parallel", type=int, default=1, help="requests processed concurrently")
+    args = parser.parse_args()
+
+    fake = FakeOllama(args.host, args.port, args.token_rate, args.prompt_rate, args.load_seconds, args.parallel)
+    print(f"Fake Ollama listening on {fake.url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
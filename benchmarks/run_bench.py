@@ -0,0 +1,267 @@
+"""
+End-to-end /analyze benchmark.
+
+Builds a synthetic corpus with generate_reports.py, starts a fake Ollama
+server and the API in-process, then drives POST /analyze at each requested
+concurrency level. Prints (and optionally writes) a JSON report with
+p50/p95/p99 latency, throughput and the per-stage breakdown taken from the
+pipeline's Prometheus histograms, so runs can be compared across commits.
+
+    python -m benchmarks.run_bench --docs 20 --pages 2 --params 24 \\
+        --concurrency 1,4,8 --requests 40 --token-rate 60 --output bench.json
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import socket
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import requests
+
+from benchmarks.fake_ollama import FakeOllama
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def build_corpus(out_dir: Path, docs: int, images: int, pages: int, params: int, seed: int = 0):
+    from generate_reports import create_image, create_pdf, synthetic_report
+
+    corpus = []
+    for i in range(docs + images):
+        content, labels = synthetic_report(n_params=params, n_pages=pages, seed=seed + i)
+        if i < docs:
+            path = create_pdf(f"synthetic_{i:04d}.pdf", content, out_dir)
+        else:
+            path = create_image(f"synthetic_{i:04d}.png", content, out_dir)
+        corpus.append({"path": path, "labels": labels})
+    return corpus
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_api(port: int):
+    import uvicorn
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="api", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    # Measure steady state: wait until the lifespan warmup has finished
+    url = f"http://127.0.0.1:{port}/ready"
+    while requests.get(url, timeout=5).status_code != 200:
+        time.sleep(0.1)
+    return server
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile"""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return round(sorted_values[k], 3)
+
+
+def _stage_snapshot():
+    """Current (sum, count) of every per-stage and Ollama histogram"""
+    from prometheus_client import REGISTRY
+
+    snapshot = {}
+    for metric in REGISTRY.collect():
+        if metric.name not in ("analyze_stage_seconds", "ollama_duration_seconds", "ollama_tokens",
+                               "llm_tier_seconds", "llm_cascade_escalations"):
+            continue
+        for sample in metric.samples:
+            if sample.name.endswith("_sum") or sample.name.endswith("_count") or sample.name.endswith("_total"):
+                key = (sample.name, tuple(sorted(sample.labels.items())))
+                snapshot[key] = sample.value
+    return snapshot
+
+
+def _stage_breakdown(before, after):
+    sums, counts, tokens, escalations = {}, {}, {}, {}
+    for (name, labels), value in after.items():
+        delta = value - before.get((name, labels), 0.0)
+        labels = dict(labels)
+        if name == "analyze_stage_seconds_sum":
+            sums[labels["stage"]] = delta
+        elif name == "analyze_stage_seconds_count":
+            counts[labels["stage"]] = delta
+        elif name == "ollama_duration_seconds_sum":
+            sums[f"ollama_{labels['phase']}"] = sums.get(f"ollama_{labels['phase']}", 0.0) + delta
+        elif name == "ollama_duration_seconds_count":
+            counts[f"ollama_{labels['phase']}"] = counts.get(f"ollama_{labels['phase']}", 0.0) + delta
+        elif name == "ollama_tokens_total":
+            tokens[labels["kind"]] = tokens.get(labels["kind"], 0.0) + delta
+        elif name == "llm_tier_seconds_sum":
+            sums[f"tier_{labels['tier']}"] = delta
+        elif name == "llm_tier_seconds_count":
+            counts[f"tier_{labels['tier']}"] = delta
+        elif name == "llm_cascade_escalations_total" and delta:
+            escalations[labels["reason"]] = delta
+    stages = {
+        stage: {"mean_ms": round(sums[stage] / counts[stage] * 1000, 3), "count": int(counts[stage])}
+        for stage in sums if counts.get(stage)
+    }
+    cascade = None
+    if counts.get("tier_fast"):
+        cascade = {
+            "escalations": escalations,
+            "escalation_rate": round(sum(escalations.values()) / counts["tier_fast"], 3),
+        }
+    return stages, tokens, cascade
+
+
+def run_level(api_url: str, corpus, concurrency: int, n_requests: int, slo: float = 40.0, clients: int = 1):
+    def one(i):
+        item = corpus[i % len(corpus)]
+        path = item["path"]
+        t0 = time.perf_counter()
+        shed = False
+        try:
+            with open(path, "rb") as fh:
+                resp = requests.post(f"{api_url}/analyze", files={"file": (path.name, fh.read())},
+                                     headers={"X-Client-Id": f"bench-{i % clients}"}, timeout=600)
+            ok = resp.status_code == 200
+            shed = resp.status_code == 429
+            error = None if ok or shed else f"{resp.status_code}: {resp.text[:200]}"
+        except Exception as e:
+            ok, error = False, str(e)
+        return time.perf_counter() - t0, ok, error, shed
+
+    before = _stage_snapshot()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(n_requests)))
+    wall = time.perf_counter() - t0
+    stages, tokens, cascade = _stage_breakdown(before, _stage_snapshot())
+
+    latencies = sorted(r[0] * 1000 for r in results if r[1])
+    errors = [r[2] for r in results if r[2]]
+    # Goodput: answers that arrived within the latency objective
+    good = sum(1 for ms in latencies if ms <= slo * 1000)
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "ok": len(latencies),
+        "shed": sum(1 for r in results if r[3]),
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:3],
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 3) if wall else None,
+        "goodput_rps": round(good / wall, 3) if wall else None,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": round(statistics.fmean(latencies), 3) if latencies else None,
+        },
+        "stages": stages,
+        "ollama_tokens": tokens,
+        "cascade": cascade,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the /analyze pipeline against a fake Ollama")
+    parser.add_argument("--docs", type=int, default=10, help="synthetic PDFs in the corpus")
+    parser.add_argument("--images", type=int, default=0, help="synthetic PNG scans in the corpus (needs tesseract)")
+    parser.add_argument("--pages", type=int, default=1, help="pages per PDF")
+    parser.add_argument("--params", type=int, default=16, help="lab parameters per report")
+    parser.add_argument("--concurrency", default="1,4", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=20, help="requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed requests before the first level")
+    parser.add_argument("--token-rate", type=float, default=40.0, help="fake generated tokens per second")
+    parser.add_argument("--prompt-rate", type=float, default=400.0, help="fake prompt tokens per second")
+    parser.add_argument("--parallel", type=int, default=1, help="fake OLLAMA_NUM_PARALLEL")
+    parser.add_argument("--num-predict", type=int, help="override OLLAMA_NUM_PREDICT for the API under test")
+    parser.add_argument("--fast-model", help="enable the cascade with this fake fast model")
+    parser.add_argument("--fast-token-rate", type=float, default=200.0, help="fast model generated tokens per second")
+    parser.add_argument("--fast-recall", type=float, default=0.95, help="share of parameters the fast model finds")
+    parser.add_argument("--slo", type=float, default=40.0, help="latency objective (s) counted as goodput")
+    parser.add_argument("--clients", type=int, default=1, help="distinct X-Client-Id values to spread requests over")
+    parser.add_argument("--max-wait", type=float, help="override ADMISSION_MAX_WAIT_SECONDS (0 disables shedding)")
+    parser.add_argument("--with-caches", action="store_true",
+                        help="enable the extraction, section and near-duplicate caches (in a temp dir)")
+    parser.add_argument("--corpus-dir", help="keep the generated corpus here instead of a temp dir")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    models = {}
+    if args.fast_model:
+        models[args.fast_model] = {"token_rate": args.fast_token_rate, "recall": args.fast_recall}
+    fake = FakeOllama(token_rate=args.token_rate, prompt_rate=args.prompt_rate, parallel=args.parallel,
+                      models=models).start()
+    # llm_client reads its configuration at import time
+    os.environ["OLLAMA_API_URL"] = fake.url
+    if args.fast_model:
+        os.environ["OLLAMA_FAST_MODEL"] = args.fast_model
+    if args.num_predict is not None:
+        os.environ["OLLAMA_NUM_PREDICT"] = str(args.num_predict)
+    if args.max_wait is not None:
+        os.environ["ADMISSION_MAX_WAIT_SECONDS"] = str(args.max_wait)
+    # Load clients all connect from loopback: let X-Client-Id tell them apart
+    os.environ["TRUSTED_PROXIES"] = "127.0.0.1"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Off by default, so repeated documents do the full work and runs compare
+        # across commits; --with-caches measures the cached path from a cold start
+        cache_dir = Path(tmp) / "cache"
+        os.environ.update({
+            "EXTRACT_CACHE_DIR": str(cache_dir / "extract") if args.with_caches else "",
+            "SECTION_CACHE_PATH": str(cache_dir / "sections.sqlite3") if args.with_caches else "",
+            "NEAR_DUP_INDEX_PATH": str(cache_dir / "near_duplicates.sqlite3") if args.with_caches else "",
+        })
+        corpus_dir = Path(args.corpus_dir or tmp)
+        corpus = build_corpus(corpus_dir, args.docs, args.images, args.pages, args.params)
+
+        server = start_api(_free_port())
+        logging.getLogger().setLevel(logging.WARNING)
+        api_url = f"http://127.0.0.1:{server.config.port}"
+
+        if args.warmup:
+            run_level(api_url, corpus, 1, args.warmup)
+
+        levels = [
+            run_level(api_url, corpus, int(c), args.requests, args.slo, args.clients)
+            for c in args.concurrency.split(",") if c.strip()
+        ]
+
+        server.should_exit = True
+    fake.stop()
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": vars(args),
+        "levels": levels,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text)
+
+
+if __name__ == "__main__":
+    main()
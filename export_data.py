@@ -0,0 +1,51 @@
+"""
+Bulk export of body metrics (Postgres) or stored analysis results (history
+SQLite) to Parquet or Arrow IPC, in constant memory.
+
+    python export_data.py body_metrics -o features.parquet \\
+        --columns measured_at,weight_kg,bmi --start 2025-01-01 --end 2026-01-01
+    python export_data.py analysis -o results.arrows --patient-id p1
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from app.services import export
+
+
+def _format_for(path: str) -> str:
+    suffix = Path(path).suffix.lower()
+    return "arrow" if suffix in (".arrow", ".arrows", ".ipc") else "parquet"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export body metrics or analysis results as Parquet/Arrow")
+    parser.add_argument("source", choices=list(export.SOURCES))
+    parser.add_argument("-o", "--output", required=True, help="output file; .arrow/.arrows/.ipc write Arrow IPC")
+    parser.add_argument("--format", choices=export.EXPORT_FORMATS, help="overrides the output suffix")
+    parser.add_argument("--columns", help="comma-separated columns (default: all)")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="inclusive, ISO date or datetime (UTC if naive)")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="exclusive, ISO date or datetime (UTC if naive)")
+    parser.add_argument("--user-id", help="body_metrics only")
+    parser.add_argument("--patient-id", help="analysis only")
+    parser.add_argument("--batch-rows", type=int, default=export.EXPORT_BATCH_ROWS, help="rows per record batch")
+    args = parser.parse_args()
+
+    columns = [c.strip() for c in args.columns.split(",") if c.strip()] if args.columns else None
+    try:
+        query = export.build_query(args.source, columns, args.start, args.end,
+                                   {"user_id": args.user_id, "patient_id": args.patient_id})
+    except ValueError as e:
+        parser.error(str(e))
+
+    fmt = args.format or _format_for(args.output)
+    t0 = time.perf_counter()
+    rows = export.write(export.iter_batches(query, args.batch_rows), query.schema, args.output, fmt)
+    print(f"{rows} rows, {len(query.schema)} columns -> {args.output} ({fmt}, "
+          f"{time.perf_counter() - t0:.1f} s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,17 @@
+import random
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Table
 from pathlib import Path
 
 OUTPUT_DIR = Path("sample_reports")
-OUTPUT_DIR.mkdir(exist_ok=True)
+
+# Marker line in report content that starts a new PDF page
+PAGE_BREAK = "\f"
+
+# Cell separator: consecutive lines containing it are laid out as a table
+CELL_SEPARATOR = " | "
+TABLE_HEADER = "Test | Result | Unit | Reference Range"
 
 styles = getSampleStyleSheet()
 
@@ -102,20 +109,131 @@ Borderline fasting glucose levels.
 ]
 
 
-def create_pdf(filename: str, text: str):
-    filepath = OUTPUT_DIR / filename
+# (name, unit, reference low, reference high) used for synthetic reports
+ANALYTE_TEMPLATES = [
+    ("Hemoglobin", "g/dL", 12.0, 17.0),
+    ("RBC Count", "million/uL", 4.2, 5.9),
+    ("WBC Count", "/uL", 4000, 11000),
+    ("Platelet Count", "/uL", 150000, 450000),
+    ("Hematocrit", "%", 36.0, 50.0),
+    ("MCV", "fL", 80, 100),
+    ("MCH", "pg", 27, 33),
+    ("MCHC", "g/dL", 32, 36),
+    ("RDW", "%", 11.5, 14.5),
+    ("Neutrophils", "%", 40, 75),
+    ("Lymphocytes", "%", 20, 45),
+    ("Monocytes", "%", 2, 10),
+    ("Eosinophils", "%", 1, 6),
+    ("Blood Sugar (Fasting)", "mg/dL", 70, 100),
+    ("HbA1c", "%", 4.0, 5.6),
+    ("Total Cholesterol", "mg/dL", 125, 200),
+    ("HDL Cholesterol", "mg/dL", 40, 60),
+    ("LDL Cholesterol", "mg/dL", 50, 130),
+    ("Triglycerides", "mg/dL", 50, 150),
+    ("Serum Creatinine", "mg/dL", 0.7, 1.3),
+    ("Urea", "mg/dL", 15, 40),
+    ("Total Bilirubin", "mg/dL", 0.3, 1.2),
+    ("SGPT (ALT)", "U/L", 7, 56),
+    ("SGOT (AST)", "U/L", 10, 40),
+    ("Alkaline Phosphatase", "U/L", 44, 147),
+    ("Sodium", "mmol/L", 135, 145),
+    ("Potassium", "mmol/L", 3.5, 5.1),
+    ("Calcium", "mg/dL", 8.5, 10.5),
+    ("Vitamin B12", "pg/mL", 200, 900),
+    ("Vitamin D", "ng/mL", 30, 100),
+    ("TSH", "uIU/mL", 0.4, 4.0),
+    ("Ferritin", "ng/mL", 20, 250),
+]
+
+
+def _format_number(x: float, like: float) -> str:
+    if float(like).is_integer() and like >= 100:
+        return str(int(round(x)))
+    return f"{x:.1f}"
+
+
+def synthetic_report(n_params: int = 12, n_pages: int = 1, seed: int = 0, layout: str = "lines"):
+    """
+    Build report content with `n_params` results spread over `n_pages` pages.
+    layout "lines" writes "Name: value unit (range)", "table" a column grid.
+    Returns (content, labels) where labels are the expected parameters.
+    """
+    rng = random.Random(seed)
+    lines = [
+        f"Patient Name: Synthetic Patient {seed}",
+        f"Age: {rng.randint(18, 80)}",
+        f"Report ID: SYN-{seed:05d}",
+        "",
+    ]
+    labels = []
+    per_page = max(1, -(-n_params // n_pages))
+    for i in range(n_params):
+        if i and i % per_page == 0:
+            lines.append(PAGE_BREAK)
+        if layout == "table" and i % per_page == 0:
+            lines.append(TABLE_HEADER)
+        name, unit, low, high = ANALYTE_TEMPLATES[i % len(ANALYTE_TEMPLATES)]
+        if i >= len(ANALYTE_TEMPLATES):
+            name = f"{name} (repeat {i // len(ANALYTE_TEMPLATES)})"
+        span = high - low
+        value_s = _format_number(rng.uniform(low - 0.3 * span, high + 0.3 * span), high)
+        value = float(value_s)
+        status = "low" if value < low else "high" if value > high else "normal"
+        range_s = f"{_format_number(low, high)} - {_format_number(high, high)}"
+        if layout == "table":
+            lines.append(CELL_SEPARATOR.join((name, value_s, unit, range_s)))
+        else:
+            lines.append(f"{name}: {value_s} {unit} ({range_s})")
+        labels.append({"name": name, "value": value_s, "unit": unit, "normal_range": range_s, "status": status})
+    lines += ["", "Remarks: Synthetic report for benchmarking."]
+    return "\n".join(lines), labels
+
+
+def create_pdf(filename: str, text: str, output_dir: Path = OUTPUT_DIR):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    filepath = output_dir / filename
     doc = SimpleDocTemplate(str(filepath), pagesize=A4)  # Convert to string
 
     story = []
+    table_rows = []
     for line in text.strip().split("\n"):
-        if line.strip() == "":
+        if CELL_SEPARATOR in line:
+            table_rows.append(line.split(CELL_SEPARATOR))
+            continue
+        if table_rows:
+            story.append(Table(table_rows, hAlign="LEFT"))
+            table_rows = []
+        if line == PAGE_BREAK:
+            story.append(PageBreak())
+        elif line.strip() == "":
             story.append(Spacer(1, 12))
         else:
             story.append(Paragraph(line.replace("&", "&amp;"), styles["Normal"]))
             story.append(Spacer(1, 6))
+    if table_rows:
+        story.append(Table(table_rows, hAlign="LEFT"))
 
     doc.build(story)
     print(f"Generated: {filepath}")
+    return filepath
+
+
+def create_image(filename: str, text: str, output_dir: Path = OUTPUT_DIR):
+    """Render report content as a plain scanned-looking PNG/JPG (one page)"""
+    from PIL import Image, ImageDraw
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    filepath = output_dir / filename
+    lines = [l for l in text.strip().split("\n") if l != PAGE_BREAK]
+    img = Image.new("L", (1240, 40 + 28 * len(lines)), color=255)
+    draw = ImageDraw.Draw(img)
+    for i, line in enumerate(lines):
+        # Table rows: one fixed-width column per cell
+        for j, cell in enumerate(line.split(CELL_SEPARATOR)):
+            draw.text((40 + 300 * j, 20 + 28 * i), cell, fill=0)
+    img.save(filepath)
+    print(f"Generated: {filepath}")
+    return filepath
 
 
 def main():
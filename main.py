@@ -1,17 +1,38 @@
+import asyncio
 import logging
+import re
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from app.routers.analyze import router as analyze_router
+from app.routers.body_metrics import router as body_metrics_router
+from app.routers.admin import router as admin_router
+from app.routers.history import router as history_router
+from app.services import warmup
+from app.utils import logging_setup, profiling
+from app.utils.metrics import HTTP_REQUEST_SECONDS, REQUESTS_IN_FLIGHT, render_latest
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s [%(name)s] %(message)s",
-)
+# Logging goes through a queue drained by one thread (LOG_LEVEL, LOG_FORMAT)
+logging_setup.setup_logging()
 logger = logging.getLogger("api")
 
-app = FastAPI()
+# Client-supplied X-Request-Id values are kept only if they look like ids
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up off the event loop so /health answers while the model loads;
+    # /ready turns 200 once every step has run
+    logging_setup.setup_logging()
+    task = asyncio.create_task(asyncio.to_thread(warmup.run_warmup))
+    yield
+    if not task.done():
+        task.cancel()
+    logging_setup.stop_logging()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS to allow Streamlit frontend
 app.add_middleware(
@@ -25,19 +46,48 @@ app.add_middleware(
 # Request/Response logging middleware
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    logger.info(f"Incoming request {request.method} {request.url}")
+    t0 = time.perf_counter()
+    request_id = request.headers.get("x-request-id", "")
+    if not REQUEST_ID_PATTERN.match(request_id):
+        request_id = logging_setup.new_request_id()
+    # Every record logged while serving the request, in any stage or thread, carries this id
+    token = logging_setup.set_request_id(request_id)
+    # Opt-in sampling profiler (X-Profile header or PROFILE_SAMPLE_RATE)
+    session = None
+    if profiling.should_profile(request.headers):
+        session = profiling.start(f"{request.method} {request.url.path}", session_id=request_id)
+    REQUESTS_IN_FLIGHT.inc()
     try:
         response = await call_next(request)
     except Exception as e:
-        logger.exception(f"Unhandled exception for {request.method} {request.url}: {e}")
-        return JSONResponse(status_code=500, content={"detail": "Internal Server Error"})
-    logger.info(f"Response status {response.status_code} for {request.method} {request.url}")
+        logger.exception("Unhandled exception for %s %s: %s", request.method, request.url.path, e)
+        response = JSONResponse(status_code=500, content={"detail": "Internal Server Error"})
+    finally:
+        REQUESTS_IN_FLIGHT.dec()
+        if session is not None:
+            profiling.finish(session)
+    response.headers["X-Request-Id"] = request_id
+    if session is not None:
+        response.headers["X-Profile-Id"] = session.id
+    elapsed = time.perf_counter() - t0
+    # Label by route template, not raw path, to keep cardinality bounded
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.labels(
+        request.method, route.path if route else "unmatched", str(response.status_code)
+    ).observe(elapsed)
+    # One line per request, formatted and written by the log thread
+    logger.info(
+        "%s %s %s %.1f ms", request.method, request.url.path, response.status_code, elapsed * 1000,
+        extra={"status": response.status_code, "duration_ms": round(elapsed * 1000, 1),
+               "profile_samples": session.samples if session is not None else None},
+    )
+    logging_setup.reset_request_id(token)
     return response
 
 # Global exception handler for HTTPException is handled by FastAPI; add fallback for generic exceptions
 @app.exception_handler(Exception)
 async def generic_exception_handler(request: Request, exc: Exception):
-    logger.exception(f"Exception on {request.method} {request.url}: {exc}")
+    logger.exception("Exception on %s %s: %s", request.method, request.url.path, exc)
     return JSONResponse(status_code=500, content={"detail": str(exc)})
 
 @app.get("/")
@@ -48,5 +98,24 @@ async def root():
 async def say_hello(name: str):
     return {"message": f"Hello {name}"}
 
+@app.get("/health", include_in_schema=False)
+async def health():
+    """Liveness: the process is serving requests"""
+    return {"status": "ok"}
+
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    """Readiness: extractors, schemas and the model have been warmed up"""
+    state = warmup.status()
+    return JSONResponse(status_code=200 if warmup.is_ready() else 503, content=state)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
+
 # Mount analyzer API
 app.include_router(analyze_router, prefix="", tags=["analyze"])
+app.include_router(body_metrics_router, prefix="", tags=["body-metrics"])
+app.include_router(history_router, prefix="", tags=["history"])
+app.include_router(admin_router, prefix="", tags=["admin"])
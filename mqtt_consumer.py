@@ -1,8 +1,24 @@
 import json
+import logging
+import os
+import hashlib
+import threading
+import time
 import psycopg2
-from datetime import datetime, date
+from collections import OrderedDict
+from datetime import datetime, date, timezone
 import uuid
 import paho.mqtt.client as mqtt
+from prometheus_client import start_http_server
+
+from app.services.body_metrics import (
+    DB_CONFIG, backfill_rollups, ensure_rollup_schema, rebuild_rollups, update_rollups,
+)
+from app.services.spool import Spool
+from app.utils import logging_setup
+from app.utils.metrics import MQTT_MESSAGES, MQTT_SPOOLED, MQTT_STAGE_SECONDS, record_cache, timed
+
+logger = logging.getLogger("mqtt")
 
 # =====================
 # CONFIG
@@ -10,30 +26,101 @@ import paho.mqtt.client as mqtt
 
 MQTT_BROKER = "127.0.0.1"
 MQTT_PORT = 1883
-MQTT_TOPIC = "#"
 
-DB_CONFIG = {
-    "host": "localhost",
-    "dbname": "healthdb",
-    "user": "healthuser",
-    "password": "healthpass",
-    "port": 5432
-}
+# Shared subscription group ("$share/<group>/<topic>"): run several consumer
+# instances with the same group and the broker load-balances between them.
+# Leave empty for a plain subscription.
+MQTT_SHARED_GROUP = os.getenv("MQTT_SHARED_GROUP", "")
+
+# Prometheus /metrics for the consumer (0 disables)
+MQTT_METRICS_PORT = int(os.getenv("MQTT_METRICS_PORT", "9108"))
+
+# Retained messages are stale broker state, not new measurements
+MQTT_DROP_RETAINED = True
+
+# BLE MAC of a Mi body composition scale relayed by OpenMQTTGateway (optional)
+MISCALE_MAC = os.getenv("MISCALE_MAC", "").replace(":", "").upper()
 
 DEFAULT_USER_ID = uuid.UUID("11111111-1111-1111-1111-111111111111")
 
 ACTIVITY_FACTOR = 1.4  # later replace with training-based model
 
+# Recently persisted measurements kept in memory so replayed history
+# (openScale resends everything on reconnect) is dropped without a DB round trip
+DEDUP_CACHE_SIZE = int(os.getenv("DEDUP_CACHE_SIZE", "10000"))
+
+# Measurements that could not be persisted (Postgres down) are appended here
+# and replayed in bulk once the database is reachable again
+SPOOL_PATH = os.getenv("MQTT_SPOOL_PATH", "spool/measurements.spool")
+SPOOL_DRAIN_INTERVAL = 5  # seconds
+SPOOL_DRAIN_BATCH = 500
+# Longest wait between drain attempts after unexpected errors (doubling from the interval)
+SPOOL_DRAIN_MAX_BACKOFF = 300  # seconds
+
+# Payloads without a timestamp (Mi scale) are identified by their content:
+# the same payload again within this window is a redelivery, not a new weigh-in
+DATELESS_DEDUP_SECONDS = int(os.getenv("MQTT_DATELESS_DEDUP_SECONDS", "600"))
+
 # =====================
 # HELPERS
 # =====================
 
 def parse_timestamp(ts):
-    return datetime.strptime(ts, "%Y-%m-%dT%H:%M%z") if ts else datetime.utcnow()
+    return datetime.strptime(ts, "%Y-%m-%dT%H:%M%z") if ts else datetime.now(timezone.utc)
+
+def measured_at(data):
+    """The payload's date, else when the message arrived (stamped by the handler, UTC)"""
+    if data.get("date"):
+        return parse_timestamp(data["date"])
+    if data.get("received_at"):
+        return datetime.fromisoformat(data["received_at"])
+    return datetime.now(timezone.utc)
 
 def calculate_age(dob: date, at: datetime):
     return at.year - dob.year - ((at.month, at.day) < (dob.month, dob.day))
 
+def measurement_key(data, source):
+    """
+    Identity of a measurement: (user_id, measured_at, source), or the payload
+    hash in place of the time when the payload carries no date
+    """
+    if data.get("date"):
+        return (str(DEFAULT_USER_ID), parse_timestamp(data["date"]).isoformat(), source)
+    return (str(DEFAULT_USER_ID), "payload:" + payload_hash(data), source)
+
+def payload_hash(data):
+    """Hash of the measurement content; the arrival stamp is not part of it"""
+    content = {k: v for k, v in data.items() if k != "received_at"}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+# =====================
+# DEDUP CACHE
+# =====================
+
+_recent = OrderedDict()
+# Used from the paho network thread and the spool drainer
+_recent_lock = threading.Lock()
+
+def seen_recently(key, digest):
+    """True if this exact measurement was already persisted by this process"""
+    with _recent_lock:
+        entry = _recent.get(key)
+        hit = entry is not None and entry[0] == digest
+        if hit and key[1].startswith("payload:"):
+            # Content-keyed: only a redelivery within the window
+            hit = time.monotonic() - entry[1] < DATELESS_DEDUP_SECONDS
+        if hit:
+            _recent.move_to_end(key)
+    record_cache("mqtt_dedup", hit)
+    return hit
+
+def remember(key, digest):
+    with _recent_lock:
+        _recent[key] = (digest, time.monotonic())
+        _recent.move_to_end(key)
+        while len(_recent) > DEDUP_CACHE_SIZE:
+            _recent.popitem(last=False)
+
 # =====================
 # DATABASE
 # =====================
@@ -48,31 +135,115 @@ def get_user_profile(cur, user_id):
         raise Exception("User profile not found")
     return row
 
-def insert_raw(cur, data):
+def dedup_existing(cur):
+    """
+    Delete duplicates stored before the unique indexes existed, keeping the
+    newest row per measurement. Only runs while an index is still missing.
+    """
+    cur.execute("SELECT to_regclass('body_metrics_raw_measurement_uidx')")
+    if cur.fetchone()[0] is None:
+        cur.execute("""
+            DELETE FROM body_metrics_raw a USING body_metrics_raw b
+            WHERE a.user_id = b.user_id AND a.measured_at = b.measured_at
+              AND a.source = b.source AND a.id < b.id
+        """)
+        if cur.rowcount:
+            logger.warning("Removed %s duplicate raw measurements", cur.rowcount)
+    cur.execute("SELECT to_regclass('body_metrics_features_measurement_uidx')")
+    if cur.fetchone()[0] is None:
+        # No id column to order by: the later tuple is the later write
+        cur.execute("""
+            DELETE FROM body_metrics_features a USING body_metrics_features b
+            WHERE a.user_id = b.user_id AND a.measured_at = b.measured_at
+              AND a.ctid < b.ctid
+        """)
+        if cur.rowcount:
+            logger.warning("Removed %s duplicate feature rows; rebuilding rollups", cur.rowcount)
+            # Rollups counted the duplicates; backfill_rollups rebuilds an empty table
+            cur.execute("SELECT to_regclass('body_metrics_rollups')")
+            if cur.fetchone()[0] is not None:
+                cur.execute("DELETE FROM body_metrics_rollups")
+
+def ensure_schema(cur):
+    """Columns and unique indexes backing idempotent ingestion"""
     cur.execute("""
-        INSERT INTO body_metrics_raw (
-            user_id, weight_kg, fat_percent, muscle_percent,
-            water_percent, measured_at, source, raw_json
-        )
-        VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
-        RETURNING id
-    """, (
+        ALTER TABLE body_metrics_raw ADD COLUMN IF NOT EXISTS payload_hash TEXT
+    """)
+    dedup_existing(cur)
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS body_metrics_raw_measurement_uidx
+        ON body_metrics_raw (user_id, measured_at, source)
+    """)
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS body_metrics_features_measurement_uidx
+        ON body_metrics_features (user_id, measured_at)
+    """)
+
+RAW_COLUMNS = """
+    user_id, weight_kg, fat_percent, muscle_percent,
+    water_percent, measured_at, source, raw_json, payload_hash
+"""
+
+# An edit (/update topic) replaces the stored values; an exact replay matches
+# the stored payload_hash and changes nothing, so no row is returned
+UPSERT_RAW_SQL = f"""
+    INSERT INTO body_metrics_raw ({RAW_COLUMNS})
+    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
+    ON CONFLICT (user_id, measured_at, source) DO UPDATE SET
+        weight_kg = EXCLUDED.weight_kg,
+        fat_percent = EXCLUDED.fat_percent,
+        muscle_percent = EXCLUDED.muscle_percent,
+        water_percent = EXCLUDED.water_percent,
+        raw_json = EXCLUDED.raw_json,
+        payload_hash = EXCLUDED.payload_hash
+    WHERE body_metrics_raw.payload_hash IS DISTINCT FROM EXCLUDED.payload_hash
+    RETURNING id, (xmax = 0) AS inserted
+"""
+
+# Dateless payloads: skipped when the same content arrived within the window
+INSERT_DATELESS_RAW_SQL = f"""
+    INSERT INTO body_metrics_raw ({RAW_COLUMNS})
+    SELECT %s,%s,%s,%s,%s,%s,%s,%s,%s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM body_metrics_raw
+        WHERE user_id = %s AND source = %s AND payload_hash = %s
+          AND measured_at BETWEEN %s - make_interval(secs => %s) AND %s + make_interval(secs => %s)
+    )
+    ON CONFLICT (user_id, measured_at, source) DO NOTHING
+    RETURNING id, true AS inserted
+"""
+
+def insert_raw(cur, data, source="openscale", digest=None):
+    """
+    Store a raw measurement. Returns (id, inserted): inserted is False when an
+    edit replaced the stored values; None if nothing changed (a replay).
+    """
+    at = measured_at(data)
+    params = (
         str(DEFAULT_USER_ID),
         data.get("weight"),
         data.get("fat"),
         data.get("muscle"),
         data.get("water"),
-        parse_timestamp(data.get("date")),
-        "openscale",
-        json.dumps(data)
-    ))
-    return cur.fetchone()[0]
+        at,
+        source,
+        json.dumps(data),
+        digest
+    )
+    if data.get("date"):
+        cur.execute(UPSERT_RAW_SQL, params)
+    else:
+        window = DATELESS_DEDUP_SECONDS
+        cur.execute(INSERT_DATELESS_RAW_SQL, params + (
+            str(DEFAULT_USER_ID), source, digest, at, window, at, window,
+        ))
+    row = cur.fetchone()
+    return (row[0], row[1]) if row else None
 
 def compute_features(raw, profile):
     height_cm, sex, dob = profile
     height_m = height_cm / 100
-    measured_at = parse_timestamp(raw.get("date"))
-    age = calculate_age(dob, measured_at)
+    age = calculate_age(dob, measured_at(raw))
 
     weight = raw.get("weight")
     fat_pct = raw.get("fat")
@@ -91,8 +262,25 @@ def compute_features(raw, profile):
 
     return bmi, bmr, tdee, fat_mass, lean_mass
 
-def insert_features(cur, data, profile, features):
+def insert_features(cur, data, profile, features, replace=False):
+    """
+    replace: overwrite the stored row (the raw measurement was edited).
+    Returns False when a row for this time already existed and was kept.
+    """
     bmi, bmr, tdee, fat_mass, lean_mass = features
+    if replace:
+        conflict = """DO UPDATE SET
+            weight_kg = EXCLUDED.weight_kg,
+            fat_percent = EXCLUDED.fat_percent,
+            muscle_percent = EXCLUDED.muscle_percent,
+            water_percent = EXCLUDED.water_percent,
+            bmi = EXCLUDED.bmi,
+            bmr = EXCLUDED.bmr,
+            tdee = EXCLUDED.tdee,
+            fat_mass_kg = EXCLUDED.fat_mass_kg,
+            lean_mass_kg = EXCLUDED.lean_mass_kg"""
+    else:
+        conflict = "DO NOTHING"
 
     cur.execute("""
         INSERT INTO body_metrics_features (
@@ -109,9 +297,11 @@ def insert_features(cur, data, profile, features):
             lean_mass_kg
         )
         VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+        ON CONFLICT (user_id, measured_at) """ + conflict + """
+        RETURNING 1
     """, (
         str(DEFAULT_USER_ID),
-        parse_timestamp(data.get("date")),
+        measured_at(data),
         data.get("weight"),
         data.get("fat"),
         data.get("muscle"),
@@ -122,49 +312,285 @@ def insert_features(cur, data, profile, features):
         fat_mass,
         lean_mass
     ))
+    return cur.fetchone() is not None
 
-def on_connect(client, userdata, flags, reason_code, properties):
-    print("Connected to MQTT broker")
-    client.subscribe(MQTT_TOPIC)
+# =====================
+# PARSERS
+# =====================
 
+def parse_openscale(payload: bytes):
+    """openScale sync publishes the measurement as flat JSON"""
+    return json.loads(payload)
+
+def parse_miscale(payload: bytes):
+    """Mi body composition scale via OpenMQTTGateway (BTtoMQTT)"""
+    data = json.loads(payload)
+    if not data.get("weight"):
+        # Intermediate (non-stabilized) readings
+        return None
+    return {
+        "weight": data.get("weight"),
+        "fat": data.get("fat"),
+        "muscle": data.get("muscle"),
+        "water": data.get("water"),
+        "date": None,
+    }
 
-def on_message(client, userdata, msg):
-    try:
-        payload = msg.payload.decode()
-        data = json.loads(payload)
-
-        print("Received:", data)
+# =====================
+# ROUTING
+# =====================
 
+# Topic filter -> (source, parser). Only these filters are subscribed, so the
+# broker never forwards unrelated traffic and anything else is dropped before
+# any decode work.
+ROUTES = [
+    {"topic": "openScaleSync/measurements/insert", "source": "openscale", "parser": parse_openscale},
+    {"topic": "openScaleSync/measurements/update", "source": "openscale", "parser": parse_openscale},
+]
+
+if MISCALE_MAC:
+    ROUTES.append({"topic": f"home/+/BTtoMQTT/{MISCALE_MAC}", "source": "miscale", "parser": parse_miscale})
+
+def subscription_topic(topic: str) -> str:
+    if MQTT_SHARED_GROUP:
+        return f"$share/{MQTT_SHARED_GROUP}/{topic}"
+    return topic
+
+def store_measurement(cur, data, source, digest):
+    """Insert or update raw + features + rollups; returns False for duplicates"""
+    raw = insert_raw(cur, data, source, digest)
+    if raw is None:
+        return False
+    _, inserted = raw
+
+    if data.get("weight") is not None and data.get("fat") is not None:
+        profile = get_user_profile(cur, DEFAULT_USER_ID)
+        features = compute_features(data, profile)
+        written = insert_features(cur, data, profile, features, replace=not inserted)
+        at = measured_at(data)
+        if not inserted:
+            # Sums can take a delta but min/max cannot: recount the buckets
+            rebuild_rollups(cur, DEFAULT_USER_ID, at)
+        elif written:
+            bmi, bmr, tdee, fat_mass, lean_mass = features
+            update_rollups(cur, DEFAULT_USER_ID, at, {
+                "weight_kg": data["weight"],
+                "fat_percent": data["fat"],
+                "bmi": bmi,
+                "tdee": tdee,
+            })
+        # else: another source already stored this time and its row was counted
+
+    return True
+
+def persist_measurement(data, source):
+    """Store raw + features; returns False if the measurement was a duplicate"""
+    key = measurement_key(data, source)
+    digest = payload_hash(data)
+    if seen_recently(key, digest):
+        return False
+
+    with timed(MQTT_STAGE_SECONDS, "db_connect"):
         conn = psycopg2.connect(**DB_CONFIG)
+    try:
         cur = conn.cursor()
+        with timed(MQTT_STAGE_SECONDS, "persist"):
+            inserted = store_measurement(cur, data, source, digest)
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
 
-        insert_raw(cur, data)
+    remember(key, digest)
+    return inserted
 
-        profile = get_user_profile(cur, DEFAULT_USER_ID)
-        features = compute_features(data, profile)
+# =====================
+# OFFLINE SPOOL
+# =====================
 
-        insert_features(cur, data, profile, features)
+spool = None
 
-        print("TOPIC:", msg.topic)
-        print("RAW:", msg.payload.decode())
+# Cleared while Postgres is unreachable: new messages go straight to the spool
+# instead of waiting on a connect timeout each
+db_available = threading.Event()
+db_available.set()
 
-        conn.commit()
-        cur.close()
+schema_ready = False
+
+def spool_measurement(data, source):
+    with timed(MQTT_STAGE_SECONDS, "spool_append"):
+        spool.append(json.dumps({"source": source, "data": data}).encode())
+    MQTT_SPOOLED.inc()
+    MQTT_MESSAGES.labels(source, "spooled").inc()
+
+def replay_spool():
+    """Replay spooled measurements in bulk, one transaction per batch"""
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        while True:
+            records, offset = spool.read_batch(SPOOL_DRAIN_BATCH)
+            if not records:
+                break
+            t0 = time.perf_counter()
+
+            cur = conn.cursor()
+            stored = []
+            for record in records:
+                try:
+                    item = json.loads(record)
+                    data, source = item["data"], item["source"]
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.error("Dropping unreadable spooled record: %s", e)
+                    continue
+                key, digest = measurement_key(data, source), payload_hash(data)
+                if seen_recently(key, digest):
+                    continue
+                cur.execute("SAVEPOINT spooled")
+                try:
+                    store_measurement(cur, data, source, digest)
+                except psycopg2.OperationalError:
+                    raise
+                except Exception as e:
+                    # Bad record: skip it rather than block the spool forever
+                    cur.execute("ROLLBACK TO SAVEPOINT spooled")
+                    logger.error("Dropping spooled measurement: %s", e)
+                    continue
+                stored.append((key, digest))
+            conn.commit()
+            cur.close()
+
+            for key, digest in stored:
+                remember(key, digest)
+            spool.commit(offset)
+            MQTT_STAGE_SECONDS.labels("spool_replay_batch").observe(time.perf_counter() - t0)
+            logger.info("Replayed %s spooled measurements", len(records))
+    finally:
         conn.close()
 
-        print("Saved raw + features")
+def drain_spool():
+    spool.flush()
+    if spool.pending():
+        if not schema_ready:
+            init_db()
+        replay_spool()
+    if not spool.pending():
+        db_available.set()
+
+def drain_spool_forever():
+    # Never exits: a dead drainer would leave db_available cleared and
+    # every later message spooled for good
+    delay = SPOOL_DRAIN_INTERVAL
+    while True:
+        time.sleep(delay)
+        try:
+            drain_spool()
+        except psycopg2.OperationalError as e:
+            logger.warning("Database still unavailable: %s", e)
+            delay = SPOOL_DRAIN_INTERVAL
+        except Exception as e:
+            delay = min(delay * 2, SPOOL_DRAIN_MAX_BACKOFF)
+            logger.exception("Spool drain failed, retrying in %s s: %s", delay, e)
+        else:
+            delay = SPOOL_DRAIN_INTERVAL
+
+def make_route_handler(route):
+    source = route["source"]
+    parser = route["parser"]
+
+    def handle(client, userdata, msg):
+        if MQTT_DROP_RETAINED and msg.retain:
+            MQTT_MESSAGES.labels(source, "retained").inc()
+            return
+        # Logs of one message share an id, like the records of one API request
+        token = logging_setup.set_request_id(logging_setup.new_request_id())
+        try:
+            with timed(MQTT_STAGE_SECONDS, "decode"):
+                data = parser(msg.payload)
+            if data is None:
+                MQTT_MESSAGES.labels(source, "ignored").inc()
+                return
+            if not data.get("date"):
+                # Kept through the spool, so a replay stores the arrival time
+                data["received_at"] = datetime.now(timezone.utc).isoformat()
+
+            logger.debug("Message on %s", msg.topic)
+            logging_setup.log_payload(logger, logging.INFO, source, data)
+
+            if not db_available.is_set():
+                spool_measurement(data, source)
+                return
+
+            try:
+                saved = persist_measurement(data, source)
+            except psycopg2.OperationalError as e:
+                logger.warning("Database unavailable, spooling: %s", e)
+                db_available.clear()
+                spool_measurement(data, source)
+                return
+
+            if saved:
+                MQTT_MESSAGES.labels(source, "saved").inc()
+                logger.debug("Saved raw + features")
+            else:
+                MQTT_MESSAGES.labels(source, "duplicate").inc()
+                logger.debug("Duplicate measurement, skipped")
+
+        except Exception as e:
+            MQTT_MESSAGES.labels(source, "error").inc()
+            logger.exception("Failed to handle %s message: %s", source, e)
+        finally:
+            logging_setup.reset_request_id(token)
+
+    return handle
+
+def on_connect(client, userdata, flags, reason_code, properties):
+    logger.info("Connected to MQTT broker")
+    client.subscribe([(subscription_topic(r["topic"]), 1) for r in ROUTES])
+
 
-    except Exception as e:
-        print("ERROR:", e)
+def on_message(client, userdata, msg):
+    # Only reached by topics without a route handler: drop without decoding
+    pass
 
 # =====================
 # MAIN
 # =====================
 
+def init_db():
+    global schema_ready
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        cur = conn.cursor()
+        ensure_schema(cur)
+        ensure_rollup_schema(cur)
+        backfill_rollups(cur)
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    schema_ready = True
+
 def start_mqtt():
+    global spool
+    # Log I/O happens on the listener thread, never in the paho network loop
+    logging_setup.setup_logging()
+    if MQTT_METRICS_PORT:
+        start_http_server(MQTT_METRICS_PORT)
+
+    spool = Spool(SPOOL_PATH)
+    try:
+        init_db()
+    except psycopg2.OperationalError as e:
+        logger.warning("Database unavailable at startup, spooling until it is back: %s", e)
+        db_available.clear()
+
+    threading.Thread(target=drain_spool_forever, name="spool-drainer", daemon=True).start()
+
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
     client.on_connect = on_connect
     client.on_message = on_message
+    for route in ROUTES:
+        client.message_callback_add(route["topic"], make_route_handler(route))
 
     client.connect(MQTT_BROKER, MQTT_PORT, 60)
     client.loop_forever()
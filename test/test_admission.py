@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Test admission control: cost estimates, fair-share order, priorities and load shedding"""
+
+import threading
+import time
+
+from app.services import admission
+from app.services.warmup import _tiny_pdf
+
+print("Testing admission control...")
+print("=" * 70)
+
+one = admission.upload_llm_seconds(1, 3000)
+many = admission.upload_llm_seconds(40, 3000)
+short = admission.text_llm_seconds("Hemoglobin: 13.5 g/dL (12.0 - 15.5)")
+if 0 < one < many and short < one:
+    print(f"✅ cost grows with pages and text ({short:.1f}s < {one:.1f}s < {many:.1f}s)")
+else:
+    print(f"❌ FAILED: costs {short}, {one}, {many}")
+
+if admission.page_count("pdf", _tiny_pdf("x")) == 1 and \
+        admission.extract_seconds("png", 1) > admission.extract_seconds("pdf", 1):
+    print("✅ scans cost more to extract than text PDFs")
+else:
+    print("❌ FAILED: extraction estimate")
+
+
+def hold(ticket, release):
+    with admission.slot(ticket, ticket.cost):
+        release.wait()
+
+
+def fill_slots(cost):
+    """Occupy every LLM slot until the returned event is set"""
+    release = threading.Event()
+    threads = []
+    for i in range(admission.LLM_CONCURRENCY):
+        ticket = admission.admit(f"busy-{i}", "normal", cost, max_wait=None)
+        t = threading.Thread(target=hold, args=(ticket, release))
+        t.start()
+        threads.append(t)
+    while len(admission._running) < admission.LLM_CONCURRENCY:
+        time.sleep(0.01)
+    return release, threads
+
+
+# Client "a" queues three requests before "b" and "c" arrive with one each
+release, threads = fill_slots(cost=1.0)
+order, workers = [], []
+tickets = [admission.admit(c, p, 1.0, max_wait=None)
+           for c, p in (("a", "normal"), ("a", "normal"), ("a", "normal"), ("b", "normal"), ("c", "low"), ("d", "high"))]
+
+
+def run(ticket):
+    with admission.slot(ticket, ticket.cost):
+        order.append(f"{ticket.client}/{ticket.priority}")
+
+
+for ticket in tickets:
+    t = threading.Thread(target=run, args=(ticket,))
+    t.start()
+    workers.append(t)
+time.sleep(0.1)
+release.set()
+for t in threads + workers:
+    t.join()
+if order[0] == "d/high" and order[-1] == "c/low" and order.index("b/normal") < 3:
+    print(f"✅ priority first, then fair share across clients ({', '.join(order)})")
+else:
+    print(f"❌ FAILED: served in order {order}")
+
+# Saturated queue: a new request's predicted wait is over the deadline
+release, threads = fill_slots(cost=100.0)
+try:
+    admission.admit("late", "normal", 1.0, max_wait=10)
+    print("❌ FAILED: overloaded request was admitted")
+except admission.Overloaded as e:
+    if e.wait > 10 and e.retry_after >= 1:
+        print(f"✅ overload is shed (predicted wait {e.wait:.0f}s, retry after {e.retry_after}s)")
+    else:
+        print(f"❌ FAILED: wait {e.wait} retry_after {e.retry_after}")
+
+ticket = admission.admit("batch", "low", 1.0, max_wait=None)
+admission.leave(ticket)
+if ticket not in admission._waiting:
+    print("✅ requests without a deadline queue instead of being shed")
+else:
+    print("❌ FAILED: ticket left in the queue")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from main import app  # noqa: E402
+
+response = TestClient(app).post("/analyze", files={"file": ("r.pdf", _tiny_pdf("Hemoglobin 13.5 g/dL"))})
+if response.status_code == 429 and int(response.headers.get("Retry-After", 0)) >= 1:
+    print(f"✅ /analyze answers 429 with Retry-After: {response.headers['Retry-After']}")
+else:
+    print(f"❌ FAILED: {response.status_code} {response.headers.get('Retry-After')}")
+release.set()
+for t in threads:
+    t.join()
+
+# X-Client-Id is only honoured from the admin or a trusted proxy
+import ipaddress  # noqa: E402
+
+from starlette.requests import Request  # noqa: E402
+
+from app.routers.analyze import _client_id  # noqa: E402
+from app.utils import auth  # noqa: E402
+
+
+def peer(host):
+    return Request({"type": "http", "client": (host, 50000), "headers": []})
+
+
+auth.ADMIN_TOKEN, auth.TRUSTED_PROXIES = "s3cret", [ipaddress.ip_network("10.0.0.0/8")]
+keys = [
+    _client_id(peer("203.0.113.7"), "someone-else", ""),
+    _client_id(peer("203.0.113.7"), "someone-else", "wrong"),
+    _client_id(peer("203.0.113.7"), "tenant-a", "s3cret"),
+    _client_id(peer("10.1.2.3"), "tenant-b", ""),
+    _client_id(peer("10.1.2.3"), None, ""),
+]
+auth.ADMIN_TOKEN, auth.TRUSTED_PROXIES = "", []
+if keys == ["203.0.113.7", "203.0.113.7", "tenant-a", "tenant-b", "10.1.2.3"]:
+    print("✅ X-Client-Id counts only from the admin or a trusted proxy; others are keyed by address")
+else:
+    print(f"❌ FAILED: client keys {keys}")
+
+calibration = admission._calibration
+admission._calibrate(actual=2.0, estimated=1.0 * calibration)
+if admission._calibration > calibration:
+    print("✅ slower calls than estimated raise the cost calibration")
+else:
+    print("❌ FAILED: calibration did not move")
+admission._calibration = calibration
+
+print("=" * 70)
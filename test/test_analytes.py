@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Test analyte name resolution, unit conversion and deterministic status"""
+
+from app.schemas.analysis import AnalysisResult
+from app.services.analytes import convert, normalize_result, parse_range, resolve
+
+print("Testing analyte resolution...")
+print("=" * 70)
+
+names = [
+    ("Hb", "Hemoglobin"),
+    ("Haemoglobin", "Hemoglobin"),
+    ("SGPT (ALT)", "ALT"),
+    ("SGOT", "AST"),
+    ("Serum Creatinine", "Creatinine"),
+    ("Vitamin D (25-OH)", "Vitamin D"),
+    ("Platelets", "Platelet Count"),
+    ("Total WBC Count", "WBC Count"),
+    ("Patient Name", None),
+]
+for name, expected in names:
+    analyte = resolve(name)
+    got = analyte.name if analyte else None
+    if got == expected:
+        print(f"✅ {name!r} -> {got}")
+    else:
+        print(f"❌ FAILED: {name!r} -> {got}, expected {expected}")
+
+print("\nTesting unit conversion and ranges...")
+print("=" * 70)
+
+checks = [
+    ("glucose 5.5 mmol/L -> mg/dL", round(convert(5.5, "mmol/L", resolve("glucose"))), 99),
+    ("WBC 13800 /cumm -> 10^3/uL", convert(13800, "/cumm", resolve("wbc")), 13.8),
+    ("platelets 1.32 x10^5/uL -> 10^3/uL", round(convert(1.32, "x10^5/uL", resolve("platelets")), 1), 132.0),
+    ("unknown unit", convert(1.0, "furlongs", resolve("hb")), None),
+    ("range '12.0 - 15.5'", parse_range("12.0 - 15.5"), (12.0, 15.5)),
+    ("range '4000-11000'", parse_range("4000-11000"), (4000.0, 11000.0)),
+    ("range '< 150'", parse_range("< 150"), (None, 150.0)),
+    ("range '> 40'", parse_range("> 40"), (40.0, None)),
+    ("range 'see note'", parse_range("see note"), None),
+]
+for description, got, expected in checks:
+    if got == expected:
+        print(f"✅ {description}")
+    else:
+        print(f"❌ FAILED: {description}: got {got}, expected {expected}")
+
+print("\nTesting deterministic status and summary...")
+print("=" * 70)
+
+result = normalize_result(AnalysisResult(**{
+    "summary": {"abnormal_count": 0, "risk_level": "low"},
+    "parameters": [
+        # Report range wins over the model's status
+        {"name": "Hemoglobin", "value": "9.6", "unit": "g/dL", "normal_range": "12.0 - 15.5", "status": "normal"},
+        # No report range: default range after converting mmol/L
+        {"name": "Fasting Blood Sugar", "value": "7.2", "unit": "mmol/L", "normal_range": "", "status": "normal"},
+        {"name": "HDL", "value": "52", "unit": "mg/dL", "normal_range": "> 40", "status": "low"},
+        # Unknown analyte without a range keeps the model's status
+        {"name": "Mystery Marker", "value": "3", "unit": "", "normal_range": "", "status": "high"},
+    ],
+}))
+statuses = [p.status for p in result.parameters]
+expected_statuses = ["low", "high", "normal", "high"]
+if statuses == expected_statuses:
+    print("✅ statuses computed from report and default ranges")
+else:
+    print(f"❌ FAILED: statuses {statuses}, expected {expected_statuses}")
+
+glucose = result.parameters[1]
+if glucose.canonical_name == "Fasting Glucose" and glucose.canonical_unit == "mg/dL" and round(glucose.canonical_value) == 130:
+    print("✅ canonical name, value and unit filled")
+else:
+    print(f"❌ FAILED: canonical fields {glucose}")
+
+if result.summary.abnormal_count == 3 and result.summary.risk_level == "medium":
+    print("✅ summary derived from statuses")
+else:
+    print(f"❌ FAILED: summary {result.summary}")
+
+print("=" * 70)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Test POST /analyze/batch against the fake Ollama server"""
+
+import io
+import json
+import os
+import tempfile
+import zipfile
+from pathlib import Path
+
+from benchmarks.fake_ollama import start_for_tests
+
+fake = start_for_tests(token_rate=5000, prompt_rate=50000, parallel=2)
+
+from fastapi.testclient import TestClient  # noqa: E402
+from generate_reports import create_pdf, synthetic_report  # noqa: E402
+from main import app  # noqa: E402
+
+print("Testing batch analysis...")
+print("=" * 70)
+
+out_dir = Path(tempfile.mkdtemp())
+pdfs = [create_pdf(f"batch_{i}.pdf", synthetic_report(n_params=6, seed=i)[0], out_dir) for i in range(3)]
+
+archive = io.BytesIO()
+with zipfile.ZipFile(archive, "w") as z:
+    z.write(pdfs[2], "patient/report.pdf")
+    z.writestr("patient/notes.txt", "not a report")
+    z.writestr("__MACOSX/patient/._report.pdf", "")
+
+files = [
+    ("files", (pdfs[0].name, pdfs[0].read_bytes())),
+    ("files", (pdfs[1].name, pdfs[1].read_bytes())),
+    ("files", ("patient.zip", archive.getvalue())),
+    ("files", ("virus.exe", b"MZ")),
+]
+response = TestClient(app).post("/analyze/batch", files=files)
+records = [json.loads(line) for line in response.text.splitlines()]
+by_name = {r["filename"]: r for r in records}
+
+if response.status_code == 200 and response.headers["content-type"].startswith("application/x-ndjson"):
+    print("✅ streams NDJSON")
+else:
+    print(f"❌ FAILED: {response.status_code} {response.headers.get('content-type')}")
+
+expected = {
+    pdfs[0].name: "ok",
+    pdfs[1].name: "ok",
+    "patient.zip/patient/report.pdf": "ok",
+    "patient.zip/patient/notes.txt": "error",
+    "virus.exe": "error",
+}
+if {name: r["status"] for name, r in by_name.items()} == expected:
+    print("✅ one record per file, zip unpacked, hidden entries skipped")
+else:
+    print(f"❌ FAILED: records {[(r['filename'], r['status']) for r in records]}")
+
+if all(len(by_name[n]["result"]["parameters"]) == 6 for n, s in expected.items() if s == "ok"):
+    print("✅ results carry the parsed parameters")
+else:
+    print("❌ FAILED: missing parameters in results")
+
+if by_name["virus.exe"]["status_code"] == 400 and "Invalid file type" in by_name["virus.exe"]["error"]:
+    print("✅ per-file errors reported without failing the batch")
+else:
+    print(f"❌ FAILED: error record {by_name['virus.exe']}")
+
+# Zip bombs: counted and sized from the directory, nothing inflated up front
+from app.services import pipeline  # noqa: E402
+
+bomb = io.BytesIO()
+with zipfile.ZipFile(bomb, "w", zipfile.ZIP_DEFLATED) as z:
+    for i in range(30):
+        z.writestr(f"page_{i}.pdf", b"\0" * (5 * 1024 * 1024))
+budget = pipeline.MAX_BATCH_BYTES
+pipeline.MAX_BATCH_BYTES = 100 * 1024 * 1024
+try:
+    pipeline.expand_uploads([("bomb.zip", bomb.getvalue())])
+    print(f"❌ FAILED: {len(bomb.getvalue())} byte zip of 150 MB accepted")
+except pipeline.AnalysisError as e:
+    if e.status_code == 413:
+        print(f"✅ {len(bomb.getvalue()) // 1024} KB zip declaring 150 MB rejected with 413 before inflating")
+    else:
+        print(f"❌ FAILED: {e.status_code} {e.detail}")
+pipeline.MAX_BATCH_BYTES = budget
+
+small = io.BytesIO()
+with zipfile.ZipFile(small, "w", zipfile.ZIP_DEFLATED) as z:
+    z.write(pdfs[0], "good.pdf")
+    z.writestr("broken.pdf", b"%PDF-1.4 " + os.urandom(4000))
+data = bytearray(small.getvalue())
+# Corrupt the compressed bytes of broken.pdf only
+offset = data.index(b"broken.pdf") + len("broken.pdf") + 100
+data[offset:offset + 64] = bytes(64)
+items = pipeline.expand_uploads([("mixed.zip", bytes(data))])
+outcomes = {}
+for item in items:
+    try:
+        pipeline._prepare(item)
+        outcomes[item.filename] = "ok"
+    except pipeline.AnalysisError as e:
+        outcomes[item.filename] = (e.status_code, e.detail.split(" ")[0])
+expected = {"mixed.zip/good.pdf": "ok", "mixed.zip/broken.pdf": (400, "Unreadable")}
+if all(item.content is None for item in items) and outcomes == expected:
+    print("✅ entries are inflated only when processed; a corrupt entry is that item's 400")
+else:
+    print(f"❌ FAILED: {outcomes}")
+
+fake.stop()
+print("=" * 70)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Test body-metric series resolution: level choice, rollup query and endpoint validation"""
+
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+from app.services import body_metrics
+from app.services.body_metrics import ROLLUP_METRICS, pick_level, query_series
+from app.utils import auth
+from main import app
+
+print("Testing body-metric series...")
+print("=" * 70)
+
+start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+spans = {1: "day", 92: "day", 93: "week", 730: "week", 731: "month", 3650: "month"}
+levels = {days: pick_level(start, start + timedelta(days=days)) for days in spans}
+if levels == spans:
+    print("✅ level picked from the span: day up to 92 days, week up to 2 years, then month")
+else:
+    print(f"❌ FAILED: {levels}")
+
+
+class RecordingCursor:
+    """Stands in for a psycopg2 cursor: records the query, returns canned rollup rows"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    def fetchall(self):
+        return self.rows
+
+
+bucket = datetime(2026, 1, 5, tzinfo=timezone.utc)
+# bucket_start, n, then avg/min/max per metric
+row = (bucket, 3) + tuple(v for i in range(len(ROLLUP_METRICS)) for v in (10.0 + i, 9.0 + i, 11.0 + i))
+cur = RecordingCursor([row])
+points = query_series(cur, "11111111-1111-1111-1111-111111111111", start, start + timedelta(days=200), "week")
+sql, params = cur.executed[0]
+if "FROM body_metrics_rollups" in sql and params[1:3] == ("week", "week") and params[3] == start \
+        and points[0]["count"] == 3 and points[0]["bmi"] == {"avg": 12.0, "min": 11.0, "max": 13.0}:
+    print("✅ series read from the chosen rollup level, one point per bucket")
+else:
+    print(f"❌ FAILED: {params} {points}")
+
+url = "/body-metrics/11111111-1111-1111-1111-111111111111/series"
+closed = TestClient(app).get(url, params={"start": "2026-01-01T00:00:00Z", "end": "2026-02-01T00:00:00Z"})
+auth.ADMIN_TOKEN = "s3cret"
+wrong = TestClient(app, headers={"X-Admin-Token": "nope"}).get(
+    url, params={"start": "2026-01-01T00:00:00Z", "end": "2026-02-01T00:00:00Z"})
+client = TestClient(app, headers={"X-Admin-Token": "s3cret"})
+bad_level = client.get(url, params={"start": "2026-01-01T00:00:00Z", "end": "2026-02-01T00:00:00Z", "level": "hour"})
+backwards = client.get(url, params={"start": "2026-02-01T00:00:00Z", "end": "2026-01-01T00:00:00Z"})
+# Nothing listens on port 1: the pool cannot connect
+body_metrics.DB_CONFIG["port"] = 1
+down = client.get(url, params={"start": "2026-01-01T00:00:00Z", "end": "2026-02-01T00:00:00Z"})
+auth.ADMIN_TOKEN = ""
+if closed.status_code == 403 and wrong.status_code == 403:
+    print("✅ series need the admin token")
+else:
+    print(f"❌ FAILED: without token {closed.status_code}, wrong token {wrong.status_code}")
+if bad_level.status_code == 400 and backwards.status_code == 400 and down.status_code == 503:
+    print("✅ invalid level and reversed range are 400, unreachable database 503")
+else:
+    print(f"❌ FAILED: {bad_level.status_code} {backwards.status_code} {down.status_code}")
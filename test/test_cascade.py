@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Test the fast/large model cascade against the fake Ollama server"""
+
+from benchmarks.fake_ollama import start_for_tests
+
+# "fast-good" finds every parameter, "fast-poor" about half of them
+fake = start_for_tests(token_rate=5000, prompt_rate=50000, parallel=2, models={
+    "fast-good": {"recall": 1.0},
+    "fast-poor": {"recall": 0.5},
+})
+
+from app.services import llm_client, pipeline  # noqa: E402
+from app.services.preprocess import compress_report_text  # noqa: E402
+from app.schemas.analysis import AnalysisResult  # noqa: E402
+from app.services.result_check import score_result, source_lines, unmatched_lines  # noqa: E402
+from app.utils.metrics import CASCADE_ESCALATIONS, LLM_TIER_RESULTS  # noqa: E402
+from generate_reports import synthetic_report  # noqa: E402
+
+print("Testing model cascade...")
+print("=" * 70)
+
+text = compress_report_text(synthetic_report(n_params=8, seed=3)[0])
+full = pipeline.parse_analysis(pipeline.analyze_text_with_llm(text))
+
+score = score_result(full, text)
+if score.valid and score.value == 1.0:
+    print("✅ complete answer scores 1.0")
+else:
+    print(f"❌ FAILED: complete answer scored {score}")
+
+partial = full.model_copy(update={"parameters": full.parameters[:4]})
+score = score_result(partial, text)
+if score.valid and 0.4 <= score.coverage <= 0.6 and score.consistency == 1.0:
+    print(f"✅ half the parameters gives coverage {score.coverage:.2f}")
+else:
+    print(f"❌ FAILED: partial answer scored {score}")
+
+invented = full.model_copy(update={"parameters": [
+    p.model_copy(update={"value": "987.6"}) for p in full.parameters
+]})
+if score_result(invented, text).consistency == 0.0:
+    print("✅ values missing from the report fail consistency")
+else:
+    print(f"❌ FAILED: invented values scored {score_result(invented, text)}")
+
+if not score_result(None, text).valid and score_result(None, text).value == 0.0:
+    print("✅ unparseable answer scores 0")
+else:
+    print("❌ FAILED: unparseable answer has a score")
+
+# Names match on whole words, not substrings
+lines = ["Hb 13.5 g/dL", "HbA1c 6.1 %", "LDL Cholesterol 120 mg/dL", "VLDL Cholesterol 25 mg/dL", "FT3 3.1 pg/mL"]
+answer = AnalysisResult(**{
+    "summary": {"abnormal_count": 0, "risk_level": "low"},
+    "parameters": [
+        {"name": "Haemoglobin", "value": "13.5", "unit": "g/dL", "normal_range": ""},
+        {"name": "LDL Cholesterol", "value": "120", "unit": "mg/dL", "normal_range": ""},
+        {"name": "T3", "value": "3.1", "unit": "pg/mL", "normal_range": ""},
+    ],
+})
+missing = unmatched_lines(answer, lines)
+if missing == lines[1:2] + lines[3:]:
+    print("✅ hb does not cover hba1c, ldl not vldl, t3 not ft3")
+else:
+    print(f"❌ FAILED: unmatched {missing}")
+if source_lines(answer.parameters[:2], lines) == [0, 2]:
+    print("✅ parameters trace back to their own lines")
+else:
+    print(f"❌ FAILED: source lines {source_lines(answer.parameters[:2], lines)}")
+
+
+def tier_count(tier):
+    return LLM_TIER_RESULTS.labels(tier)._value.get()
+
+
+def escalations(reason):
+    return CASCADE_ESCALATIONS.labels(reason)._value.get()
+
+
+pipeline.FAST_MODEL = "fast-good"
+before = tier_count("fast"), tier_count("large")
+output = pipeline.cascade(text)
+if (tier_count("fast"), tier_count("large")) == (before[0] + 1, before[1]) \
+        and len(pipeline.parse_analysis(output).parameters) == len(full.parameters):
+    print("✅ good fast answer is kept")
+else:
+    print("❌ FAILED: good fast answer was escalated")
+
+pipeline.FAST_MODEL = "fast-poor"
+before = tier_count("large"), escalations("coverage")
+output = pipeline.cascade(text)
+if (tier_count("large"), escalations("coverage")) == (before[0] + 1, before[1] + 1) \
+        and len(pipeline.parse_analysis(output).parameters) == len(full.parameters):
+    print("✅ low-coverage fast answer escalates to the large model")
+else:
+    print("❌ FAILED: poor fast answer was not escalated")
+
+# Fast model times out: the large model still answers
+fake.models["fast-slow"] = {"token_rate": 1.0}
+pipeline.FAST_MODEL = "fast-slow"
+timeout, llm_client.LLM_TIMEOUT_SECONDS = llm_client.LLM_TIMEOUT_SECONDS, 1
+before = escalations("error")
+try:
+    result = pipeline.result_stage(pipeline.llm_stage(text))
+    if escalations("error") == before + 1 and result.parameters:
+        print("✅ fast model failure escalates instead of failing the request")
+    else:
+        print("❌ FAILED: fast model failure was not counted as an escalation")
+except pipeline.AnalysisError as e:
+    print(f"❌ FAILED: {e.detail}")
+finally:
+    llm_client.LLM_TIMEOUT_SECONDS = timeout
+    fake.stop()
+
+print("=" * 70)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Test the speed-vs-accuracy evaluation harness on a tiny grid against the fake Ollama"""
+
+import os
+import tempfile
+from pathlib import Path
+
+from benchmarks.eval_grid import build_corpus, choose, fixture_labels, run_config, score
+from benchmarks.fake_ollama import FakeOllama
+
+print("Testing evaluation grid...")
+print("=" * 70)
+
+labels = fixture_labels("Patient Name: X\nHemoglobin: 9.6 g/dL (12.0 - 15.5)\nWBC Count: 6,500 /uL (4,000 - 11,000)")
+if [(l["name"], l["value"], l["status"]) for l in labels] == [("Hemoglobin", "9.6", "low"), ("WBC Count", "6,500", "normal")]:
+    print("✅ fixture labels parsed from result lines")
+else:
+    print(f"❌ FAILED: {labels}")
+
+params = [
+    {"name": "Hemoglobin", "value": "9.60", "status": "low"},
+    {"name": "Glucose", "value": "90", "status": "normal"},
+]
+s = score([{"labels": labels, "params": params}])
+if s["precision"] == 0.5 and s["recall"] == 0.5 and s["status_accuracy"] == 1.0 and s["most_missed"] == {"WBC Count": 1}:
+    print("✅ precision/recall count a parameter only when name and value match a label")
+else:
+    print(f"❌ FAILED: {s}")
+
+fast = {"config": {"num_predict": 40}, "recall": 0.4, "precision": 1.0, "latency_ms": {"mean": 100.0}}
+slow = {"config": {"num_predict": 2000}, "recall": 1.0, "precision": 1.0, "latency_ms": {"mean": 300.0}}
+if choose([fast, slow], 0.95, 0.95) is slow and choose([fast, slow], 0.3, 0.95) is fast:
+    print("✅ the fastest configuration meeting the quality bar is recommended")
+else:
+    print("❌ FAILED: recommendation")
+
+# Truncated answers must show up as lost recall, not be repaired away
+os.environ["LLM_REPAIR"] = "0"
+fake = FakeOllama(token_rate=20000, prompt_rate=200000).start()
+corpus_dir = Path(tempfile.mkdtemp())
+build_corpus(corpus_dir, docs=1, params=12, pages=1, fixtures=False)
+base = {"model": "mistral", "max_chars": 3000, "num_ctx": 2048, "engine": "pdfplumber"}
+short = run_config({**base, "num_predict": 150}, corpus_dir, fake.url)
+full = run_config({**base, "num_predict": 2000}, corpus_dir, fake.url)
+fake.stop()
+del os.environ["LLM_REPAIR"]
+if "failed" in short or "failed" in full:
+    print(f"❌ FAILED: worker error {short.get('failed')} {full.get('failed')}")
+elif full["recall"] == 1.0 and short["recall"] < full["recall"] and short["ollama_tokens"]["eval"] <= 150:
+    print(f"✅ num_predict=150 recall {short['recall']:.2f} vs {full['recall']:.2f} at 2000")
+else:
+    print(f"❌ FAILED: recall {short['recall']} vs {full['recall']}, tokens {short['ollama_tokens']}")
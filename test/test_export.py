@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Test columnar export: projection, time-range pushdown, bounded batches and the streaming endpoint"""
+
+import io
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi.testclient import TestClient
+
+from app.schemas.analysis import AnalysisResult
+from app.services import export, history_store
+from app.services.analytes import normalize_result
+from app.utils import auth
+from main import app
+
+tmp = Path(tempfile.mkdtemp())
+history_store.reset_connection(str(tmp / "history.sqlite3"))
+
+print("Testing columnar export...")
+print("=" * 70)
+
+
+def report(hemoglobin: str):
+    return normalize_result(AnalysisResult(**{
+        "summary": {"abnormal_count": 0, "risk_level": "low"},
+        "parameters": [
+            {"name": "Hb", "value": hemoglobin, "unit": "g/dL", "normal_range": "12.0 - 15.5"},
+            {"name": "Fasting Blood Sugar", "value": "5.0", "unit": "mmol/L", "normal_range": ""},
+        ],
+    }))
+
+
+for day in range(1, 11):
+    history_store.append_report("p1", date(2026, 1, day), report(f"{11 + day / 10:.1f}"), f"r{day}.pdf")
+history_store.append_report("p2", date(2026, 1, 5), report("14.0"))
+
+# Projection and time range go into the SQL, not a filter over fetched rows
+query = export.build_query("analysis", ["report_date", "value"], datetime(2026, 1, 3, 8), datetime(2026, 1, 7),
+                           {"patient_id": "p1"})
+select = query.sql.split(" FROM ")[0]
+if select == "SELECT m.report_date, m.value" and query.params == ["p1", "2026-01-04", "2026-01-07"]:
+    print("✅ only the requested columns are selected; the range is a WHERE predicate")
+else:
+    print(f"❌ FAILED: {query.sql} {query.params}")
+
+pg = export.build_query("body_metrics", ["measured_at", "bmi"], datetime(2026, 1, 1), None,
+                        {"user_id": "11111111-1111-1111-1111-111111111111"})
+if "measured_at >= %s" in pg.sql and pg.params[1] == datetime(2026, 1, 1, tzinfo=timezone.utc) \
+        and str(pg.schema.field("measured_at").type) == export.UTC_TIMESTAMP:
+    print("✅ body metrics: range pushed down as timestamptz, exported as UTC timestamps")
+else:
+    print(f"❌ FAILED: {pg.sql} {pg.params}")
+
+rejected = 0
+for bad in (lambda: export.build_query("analysis", ["value; DROP TABLE reports"]),
+            lambda: export.build_query("analysis", filters={"user_id": "x"}),
+            lambda: export.build_query("users")):
+    try:
+        bad()
+    except ValueError:
+        rejected += 1
+if rejected == 3:
+    print("✅ unknown columns, filters and sources are rejected")
+else:
+    print(f"❌ FAILED: {3 - rejected} invalid queries accepted")
+
+batches = list(export.iter_batches(query, batch_rows=2))
+rows = pa.Table.from_batches(batches, query.schema).to_pylist()
+if [b.num_rows for b in batches] == [2, 2, 2] \
+        and [(r["report_date"], r["value"]) for r in rows][::2] == [(date(2026, 1, d), 11 + d / 10) for d in (4, 5, 6)]:
+    print("✅ rows arrive in record batches of at most batch_rows")
+else:
+    print(f"❌ FAILED: {[b.num_rows for b in batches]} {rows}")
+
+# CLI: the output suffix picks the format
+out = tmp / "results.parquet"
+proc = subprocess.run([sys.executable, "export_data.py", "analysis", "-o", str(out), "--patient-id", "p1",
+                       "--columns", "report_date,analyte,value", "--batch-rows", "4"],
+                      cwd=Path(__file__).resolve().parent.parent, capture_output=True, text=True,
+                      env=dict(os.environ, HISTORY_DB_PATH=history_store.HISTORY_DB_PATH))
+if proc.returncode == 0 and out.exists():
+    parquet = pq.ParquetFile(out)
+    if parquet.metadata.num_rows == 20 and parquet.metadata.num_row_groups == 5 \
+            and parquet.schema_arrow.names == ["report_date", "analyte", "value"]:
+        print("✅ export_data.py writes Parquet with one row group per batch")
+    else:
+        print(f"❌ FAILED: {parquet.metadata}")
+else:
+    print(f"❌ FAILED: {proc.stderr}")
+
+# pyarrow stays out of API startup
+proc = subprocess.run([sys.executable, "-c", "import sys, main; print('pyarrow' in sys.modules)"],
+                      cwd=Path(__file__).resolve().parent.parent, capture_output=True, text=True)
+if proc.stdout.strip().splitlines()[-1:] == ["False"]:
+    print("✅ importing the API does not import pyarrow")
+else:
+    print(f"❌ FAILED: {proc.stdout[-200:]} {proc.stderr[-300:]}")
+
+# Endpoint: streamed Arrow IPC and Parquet
+closed = TestClient(app).get("/admin/export/body_metrics")
+auth.ADMIN_TOKEN = "s3cret"
+client = TestClient(app, headers={"X-Admin-Token": "s3cret"})
+arrow = client.get("/admin/export/analysis", params={"format": "arrow", "patient_id": "p2", "columns": "analyte,value"})
+parquet = client.get("/admin/export/analysis", params={"start": "2026-01-09T00:00:00Z"})
+bad = client.get("/admin/export/analysis", params={"columns": "nope"})
+auth.ADMIN_TOKEN = ""
+if closed.status_code == 403 and arrow.status_code == 200 and parquet.status_code == 200 \
+        and bad.status_code == 400:
+    streamed = pa.ipc.open_stream(arrow.content).read_all()
+    dates = pq.read_table(io.BytesIO(parquet.content)).column("report_date").to_pylist()
+    if streamed.num_rows == 2 and streamed.column_names == ["analyte", "value"] \
+            and arrow.headers["content-type"] == export.MEDIA_TYPES["arrow"] \
+            and sorted(set(dates)) == [date(2026, 1, 9), date(2026, 1, 10)]:
+        print("✅ /admin/export streams Arrow IPC and Parquet")
+    else:
+        print(f"❌ FAILED: {streamed.to_pylist()} {dates}")
+else:
+    print(f"❌ FAILED: status {closed.status_code} {arrow.status_code} {parquet.status_code} {bad.status_code}")
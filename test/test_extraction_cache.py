@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Test the on-disk per-page extraction cache"""
+
+import tempfile
+import time
+
+from app.services import extraction_cache
+from app.services.extract_text import extract_pages_from_upload
+from app.services.warmup import _tiny_pdf
+from app.utils.metrics import CACHE_REQUESTS
+
+extraction_cache.EXTRACT_CACHE_DIR = tempfile.mkdtemp()
+
+
+def cache_count(result):
+    return CACHE_REQUESTS.labels("extract", result)._value.get()
+
+
+print("Testing extraction cache...")
+print("=" * 70)
+
+pages = ["Hemoglobin: 9.6 g/dL (12.0 - 15.5)", "", "WBC Count: 13800 /uL (4000 - 11000) ünïcode"]
+if extraction_cache.decode_pages(extraction_cache.encode_pages(pages)) == pages:
+    print("✅ page encoding round-trips, including empty pages")
+else:
+    print("❌ FAILED: encode/decode round trip")
+
+pdf = _tiny_pdf("Hemoglobin 13.5 g/dL")
+hits, misses = cache_count("hit"), cache_count("miss")
+first = extract_pages_from_upload("pdf", pdf)
+second = extract_pages_from_upload("pdf", pdf)
+if first == second and cache_count("miss") == misses + 1 and cache_count("hit") == hits + 1:
+    print("✅ second extraction of the same document is a cache hit")
+else:
+    print(f"❌ FAILED: first={first} second={second}")
+
+if extraction_cache.cache_key(pdf, "pdfplumber-a") != extraction_cache.cache_key(pdf, "pdfplumber-b"):
+    print("✅ extractor version is part of the key")
+else:
+    print("❌ FAILED: version not in key")
+
+# Corrupt entry is dropped and treated as a miss
+key = extraction_cache.cache_key(b"doc", "v")
+extraction_cache.put(key, ["text"])
+extraction_cache._path(key).write_bytes(b"garbage")
+if extraction_cache.get(key) is None and not extraction_cache._path(key).exists():
+    print("✅ unreadable entries are dropped")
+else:
+    print("❌ FAILED: corrupt entry handling")
+
+# LRU eviction: touch the first entry so the second one is the oldest
+extraction_cache.clear()
+keys = [extraction_cache.cache_key(str(i).encode(), "v") for i in range(3)]
+for k in keys[:2]:
+    extraction_cache.put(k, ["x" * 2000])
+    time.sleep(0.02)
+extraction_cache.get(keys[0])
+size = extraction_cache._path(keys[0]).stat().st_size
+extraction_cache.EXTRACT_CACHE_MAX_BYTES = size * 2 + size // 2
+time.sleep(0.02)
+extraction_cache.put(keys[2], ["y" * 2000])
+remaining = [extraction_cache._path(k).exists() for k in keys]
+if remaining == [True, False, True]:
+    print("✅ least recently used entry evicted")
+else:
+    print(f"❌ FAILED: entries present after eviction {remaining}")
+
+print("=" * 70)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Test the SQLite report history: incremental deltas, series queries and the endpoints"""
+
+import tempfile
+import threading
+from datetime import date
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from app.schemas.analysis import AnalysisResult
+from app.services import history_store
+from app.services.analytes import normalize_result
+from app.utils import auth
+from main import app
+
+history_store.reset_connection(str(Path(tempfile.mkdtemp()) / "history.sqlite3"))
+
+
+def report(hemoglobin: str, glucose_mmol: str):
+    return normalize_result(AnalysisResult(**{
+        "summary": {"abnormal_count": 0, "risk_level": "low"},
+        "parameters": [
+            {"name": "Hb", "value": hemoglobin, "unit": "g/dL", "normal_range": "12.0 - 15.5"},
+            {"name": "Fasting Blood Sugar", "value": glucose_mmol, "unit": "mmol/L", "normal_range": ""},
+            {"name": "Remarks", "value": "see note", "unit": "", "normal_range": ""},
+        ],
+    }))
+
+
+print("Testing report history store...")
+print("=" * 70)
+
+history_store.append_report("p1", date(2026, 1, 10), report("11.0", "5.0"))
+history_store.append_report("p1", date(2026, 3, 10), report("12.5", "6.0"))
+# Arrives late: lands between the two stored reports
+history_store.append_report("p1", date(2026, 2, 10), report("11.5", "5.5"))
+history_store.append_report("p2", date(2026, 1, 10), report("14.0", "4.8"))
+
+series = history_store.query_series("p1", history_store.analyte_key("Haemoglobin"))
+values = [(p["report_date"], p["value"], p["delta"]) for p in series]
+expected = [("2026-01-10", 11.0, None), ("2026-02-10", 11.5, 0.5), ("2026-03-10", 12.5, 1.0)]
+if values == expected:
+    print("✅ series ordered by date, deltas fixed up for a backdated report")
+else:
+    print(f"❌ FAILED: series {values}")
+
+latest = {v["analyte"]: v for v in history_store.query_latest("p1")}
+hb = latest.get("hemoglobin")
+if set(latest) == {"hemoglobin", "fasting glucose"} and hb["value"] == 12.5 and hb["delta"] == 1.0:
+    print("✅ latest values keep the newest report and its delta")
+else:
+    print(f"❌ FAILED: latest {latest}")
+
+glucose = history_store.query_series("p1", history_store.analyte_key("glucose"))
+if [p["unit"] for p in glucose] == ["mg/dL"] * 3 and round(glucose[-1]["value"]) == 108:
+    print("✅ values stored in canonical units, synonyms share a series")
+else:
+    print(f"❌ FAILED: glucose series {glucose}")
+
+window = history_store.query_series("p1", "hemoglobin", start=date(2026, 2, 1), end=date(2026, 2, 28))
+if [p["report_date"] for p in window] == ["2026-02-10"]:
+    print("✅ date range filter")
+else:
+    print(f"❌ FAILED: window {window}")
+
+if len(history_store.query_series("p2", "hemoglobin")) == 1:
+    print("✅ patients are kept apart")
+else:
+    print("❌ FAILED: p2 series")
+
+
+
+def ferritin(value: str, unit: str):
+    return normalize_result(AnalysisResult(**{
+        "summary": {"abnormal_count": 0, "risk_level": "low"},
+        "parameters": [{"name": "Ferritin", "value": value, "unit": unit, "normal_range": ""}],
+    }))
+
+
+# "units" has no conversion: the value keeps its own unit in the ferritin series
+history_store.append_report("p3", date(2026, 1, 10), ferritin("30", "ng/mL"))
+history_store.append_report("p3", date(2026, 2, 10), ferritin("300", "units"))
+history_store.append_report("p3", date(2026, 3, 10), ferritin("50", "ng/mL"))
+history_store.append_report("p3", date(2026, 1, 20), ferritin("40", "ng/mL"))
+mixed = [(p["unit"], p["delta"]) for p in history_store.query_series("p3", "ferritin")]
+if mixed == [("ng/mL", None), ("ng/mL", 10.0), ("units", None), ("ng/mL", None)]:
+    print("✅ no delta between values in different units")
+else:
+    print(f"❌ FAILED: ferritin series {mixed}")
+
+# Reads neither wait for the writer lock nor reserve the database
+read = []
+with history_store._lock:
+    reader = threading.Thread(target=lambda: read.append(history_store.query_latest("p1")))
+    reader.start()
+    reader.join(timeout=5)
+if read and len(read[0]) == 2:
+    print("✅ queries run in a read transaction outside the writer lock")
+else:
+    print("❌ FAILED: query blocked on the writer lock")
+
+closed = TestClient(app).get("/history/p1/latest")
+auth.ADMIN_TOKEN = "s3cret"
+wrong = TestClient(app, headers={"X-Admin-Token": "nope"}).get("/history/p1/parameters/hb")
+client = TestClient(app, headers={"X-Admin-Token": "s3cret"})
+latest_response = client.get("/history/p1/latest")
+series_response = client.get("/history/p1/parameters/Haemoglobin")
+# Writing into a history needs the same trust: rejected before any analysis work
+anonymous_write = TestClient(app).post("/analyze", data={"patient_id": "p1"},
+                                       files={"file": ("r.txt", b"Hemoglobin 13.5 g/dL")})
+trusted_write = client.post("/analyze", data={"patient_id": "p1"}, files={"file": ("r.txt", b"Hemoglobin 13.5 g/dL")})
+auth.ADMIN_TOKEN = ""
+if anonymous_write.status_code == 403 and trusted_write.status_code == 400:
+    print("✅ /analyze accepts patient_id only from a trusted caller")
+else:
+    print(f"❌ FAILED: anonymous {anonymous_write.status_code}, with token {trusted_write.status_code}")
+if closed.status_code == 403 and wrong.status_code == 403 and latest_response.status_code == 200 \
+        and [p["value"] for p in series_response.json()["points"]] == [11.0, 11.5, 12.5]:
+    print("✅ /history needs the admin token")
+else:
+    print(f"❌ FAILED: {closed.status_code} {wrong.status_code} {latest_response.status_code} {series_response.text[:200]}")
+
+print("=" * 70)
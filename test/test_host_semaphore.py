@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Test the host-wide FIFO semaphore shared by worker processes"""
+
+import multiprocessing
+import os
+import signal
+import tempfile
+import time
+
+from app.services.llm_client import parse_host_slots
+from app.utils.host_semaphore import HostSemaphore, SlotTimeout
+
+DIRECTORY = tempfile.mkdtemp()
+
+
+def worker(name, directory, slots, hold, results):
+    semaphore = HostSemaphore(directory, slots)
+    with semaphore.hold():
+        results.put((name, "start", time.monotonic()))
+        time.sleep(hold)
+        results.put((name, "end", time.monotonic()))
+
+
+def crash_holding(directory, slots):
+    HostSemaphore(directory, slots).acquire()
+    os._exit(1)
+
+
+def wait_forever(directory, slots):
+    HostSemaphore(directory, slots).acquire()
+
+
+def wait_until(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+print("Testing host-wide semaphore...")
+print("=" * 70)
+
+if parse_host_slots("4") == {"": 4} and \
+        parse_host_slots("http://a:11434/=4, http://b:11434=2") == {"http://a:11434": 4, "http://b:11434": 2}:
+    print("✅ slot spec parses per backend")
+else:
+    print(f"❌ FAILED: {parse_host_slots('http://a:11434/=4, http://b:11434=2')}")
+
+ctx = multiprocessing.get_context("fork")
+semaphore = HostSemaphore(DIRECTORY, 2)
+results = ctx.Queue()
+
+# Main process holds both slots while four workers line up one after another
+held = [semaphore.acquire(), semaphore.acquire()]
+workers = []
+for i in range(4):
+    # Staggered hold times, so slots come free one at a time
+    p = ctx.Process(target=worker, args=(f"w{i}", DIRECTORY, 2, 0.2 + 0.1 * i, results))
+    p.start()
+    workers.append(p)
+    wait_until(lambda: semaphore.waiting() == i + 1)
+semaphore.release(held[0])
+wait_until(lambda: semaphore.waiting() == 3)
+semaphore.release(held[1])
+for p in workers:
+    p.join()
+events = sorted((results.get() for _ in range(8)), key=lambda e: e[2])
+starts = [name for name, kind, _ in events if kind == "start"]
+running, peak = 0, 0
+for _, kind, _ in events:
+    running += 1 if kind == "start" else -1
+    peak = max(peak, running)
+if starts == ["w0", "w1", "w2", "w3"]:
+    print("✅ slots are granted in arrival order across processes")
+else:
+    print(f"❌ FAILED: start order {starts}")
+if peak == 2:
+    print("✅ never more holders than slots")
+else:
+    print(f"❌ FAILED: {peak} concurrent holders")
+
+p = ctx.Process(target=crash_holding, args=(DIRECTORY, 1))
+p.start()
+p.join()
+try:
+    with HostSemaphore(DIRECTORY, 1).hold(timeout=2):
+        print("✅ slot of a crashed holder is freed by the kernel")
+except SlotTimeout:
+    print("❌ FAILED: crashed holder kept its slot")
+
+fd = semaphore.acquire()
+other = semaphore.acquire()
+p = ctx.Process(target=wait_forever, args=(DIRECTORY, 2))
+p.start()
+wait_until(lambda: semaphore.waiting() == 1)
+os.kill(p.pid, signal.SIGKILL)
+p.join()
+if semaphore.waiting() == 0:
+    print("✅ queue entries of dead processes are dropped")
+else:
+    print("❌ FAILED: dead waiter still queued")
+
+t0 = time.monotonic()
+try:
+    semaphore.acquire(timeout=0.3)
+    print("❌ FAILED: acquired a slot that was held")
+except SlotTimeout:
+    if semaphore.waiting() == 0 and time.monotonic() - t0 < 2:
+        print("✅ waiting times out and leaves the queue")
+    else:
+        print("❌ FAILED: timed-out waiter left behind")
+semaphore.release(fd)
+semaphore.release(other)
+
+print("=" * 70)
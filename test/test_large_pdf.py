@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Test lazy page extraction, early stop and the per-document extraction budgets"""
+
+import tempfile
+from pathlib import Path
+
+from app.services import extraction_cache, pdf_parser, pipeline
+from app.services.extract_text import open_upload_pages
+from app.services.preprocess import compress_report_pages, compress_report_text
+from app.utils.metrics import EXTRACT_PAGE_SECONDS
+from generate_reports import create_pdf, synthetic_report
+
+extraction_cache.EXTRACT_CACHE_DIR = tempfile.mkdtemp()
+
+print("Testing large PDF extraction...")
+print("=" * 70)
+
+text = synthetic_report(n_params=60, n_pages=6, seed=2)[0]
+pages = text.split("\f")
+for budget in (300, 3000, 100000):
+    if compress_report_pages(iter(pages), budget) != compress_report_text("\n".join(pages), budget):
+        print(f"❌ FAILED: incremental compression differs at max_chars={budget}")
+        break
+else:
+    print("✅ incremental compression matches compress_report_text")
+
+
+def consumed(limit):
+    """compress_report_pages over a page generator; returns how many pages it pulled"""
+    pulled = []
+
+    def gen():
+        for page in pages:
+            pulled.append(page)
+            yield page
+
+    compress_report_pages(gen(), limit)
+    return len(pulled)
+
+
+if consumed(300) < len(pages) and consumed(100000) == len(pages):
+    print("✅ compressor stops pulling pages once the budget is full")
+else:
+    print(f"❌ FAILED: pulled {consumed(300)} pages for a small budget")
+
+pdf = create_pdf("large.pdf", synthetic_report(n_params=600, n_pages=30, seed=4)[0], Path(tempfile.mkdtemp())).read_bytes()
+
+
+def pages_extracted():
+    return sum(b.get() for b in EXTRACT_PAGE_SECONDS.labels("pdfplumber")._buckets)
+
+
+with pdf_parser.open_pdf_pages(pdf) as stream:
+    first = next(stream.pages)
+    before = pages_extracted()
+if stream.count == 30 and "Hemoglobin" in first and pages_extracted() == before:
+    print("✅ leaving the block early skips the remaining pages")
+else:
+    print(f"❌ FAILED: {stream.count} pages, first page {first[:40]!r}")
+
+before = pages_extracted()
+extracted = pipeline.extract_stage("pdf", pdf)
+read = pages_extracted() - before
+if read < 30 and len(extracted.text) == pipeline.COMPRESS_MAX_CHARS:
+    print(f"✅ long document read only until the text budget filled ({read:.0f} of 30 pages)")
+else:
+    print(f"❌ FAILED: read {read} pages, {len(extracted.text)} chars")
+
+with open_upload_pages("pdf", pdf) as stream:
+    next(stream.pages)
+if not list(Path(extraction_cache.EXTRACT_CACHE_DIR).glob("*/*.pages")):
+    print("✅ partially read documents are not cached")
+else:
+    print("❌ FAILED: partial extraction was cached")
+
+with open_upload_pages("pdf", pdf) as stream:
+    full = list(stream.pages)
+with open_upload_pages("pdf", pdf) as stream:
+    before = pages_extracted()
+    again = list(stream.pages)
+if again == full and pages_extracted() == before:
+    print("✅ fully read documents are cached")
+else:
+    print("❌ FAILED: full extraction was not served from the cache")
+
+# Budgets: each one is the document's own, independent of other work in the process
+extraction_cache.EXTRACT_CACHE_DIR = ""
+limits = (pdf_parser.EXTRACT_MAX_PAGES, pdf_parser.EXTRACT_MAX_PAGE_OBJECTS, pdf_parser.EXTRACT_MAX_CHARS)
+
+
+def too_large(**budget):
+    """Message of the DocumentTooLarge raised by a full read under `budget`, or None"""
+    for name, value in budget.items():
+        setattr(pdf_parser, name, value)
+    try:
+        with pdf_parser.open_pdf_pages(pdf) as stream:
+            # Unrelated allocation while the document is read does not count against it
+            for _ in stream.pages:
+                hog = b"x" * (64 * 1024 * 1024)
+                del hog
+        return None
+    except pdf_parser.DocumentTooLarge as e:
+        return str(e)
+    finally:
+        pdf_parser.EXTRACT_MAX_PAGES, pdf_parser.EXTRACT_MAX_PAGE_OBJECTS, pdf_parser.EXTRACT_MAX_CHARS = limits
+
+
+pages_message = too_large(EXTRACT_MAX_PAGES=10)
+objects_message = too_large(EXTRACT_MAX_PAGE_OBJECTS=100)
+chars_message = too_large(EXTRACT_MAX_CHARS=5000)
+if too_large() is None and "30 pages" in (pages_message or "") and "page 1 " in (objects_message or "") \
+        and "characters" in (chars_message or ""):
+    print(f"✅ page, per-page object and text budgets stop extraction ({objects_message})")
+else:
+    print(f"❌ FAILED: {pages_message} / {objects_message} / {chars_message}")
+
+pdf_parser.EXTRACT_MAX_CHARS = 1
+try:
+    pipeline.extract_stage("pdf", pdf)
+    print("❌ FAILED: extract_stage ignored the budget")
+except pipeline.AnalysisError as e:
+    if e.status_code == 413:
+        print("✅ an exceeded budget maps to 413")
+    else:
+        print(f"❌ FAILED: status {e.status_code}")
+finally:
+    pdf_parser.EXTRACT_MAX_CHARS = limits[2]
+
+print("=" * 70)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Test queued JSON logging: request ids, non-blocking writes, drops and payload sampling"""
+
+import io
+import json
+import logging
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from app.utils import logging_setup
+from app.utils.metrics import LOG_RECORDS_DROPPED
+from main import app
+
+print("Testing structured logging...")
+print("=" * 70)
+
+logger = logging.getLogger("test_logging")
+
+
+def capture(stream):
+    logging_setup.stop_logging()
+    logging_setup.setup_logging(stream)
+
+
+def records(buf):
+    logging_setup.stop_logging()
+    return [json.loads(line) for line in buf.getvalue().splitlines() if line.startswith("{")]
+
+
+# Request id reaches records logged from other threads of the same context
+buf = io.StringIO()
+capture(buf)
+token = logging_setup.set_request_id("req-1")
+logger.info("value %s of %d", "x", 3, extra={"stage": "llm"})
+worker = threading.Thread(target=lambda: logger.warning("from worker"))
+worker.start()
+worker.join()
+logging_setup.reset_request_id(token)
+try:
+    raise ValueError("boom")
+except ValueError:
+    logger.exception("failed")
+out = records(buf)
+first = next(r for r in out if r["msg"] == "value x of 3")
+failed = next(r for r in out if r["msg"] == "failed")
+if first["request_id"] == "req-1" and first["stage"] == "llm" and first["level"] == "INFO" \
+        and "ValueError: boom" in failed["exc"] and failed["request_id"] == "-":
+    print("✅ JSON records carry the request id, extra fields and tracebacks")
+else:
+    print(f"❌ FAILED: {out}")
+
+
+class SlowStream(io.StringIO):
+    """A stdout that takes 50 ms per write, like a stalled container log pipe"""
+
+    def write(self, s):
+        time.sleep(0.05)
+        return super().write(s)
+
+
+slow = SlowStream()
+capture(slow)
+t0 = time.perf_counter()
+for i in range(20):
+    logger.info("record %d", i)
+caller_ms = (time.perf_counter() - t0) * 1000
+written = len(records(slow))
+if caller_ms < 100 and written == 20:
+    print(f"✅ 20 records to a 50 ms/write stream cost the caller {caller_ms:.1f} ms")
+else:
+    print(f"❌ FAILED: caller blocked {caller_ms:.1f} ms, {written} records written")
+
+# A full queue drops instead of blocking
+size = logging_setup.LOG_QUEUE_SIZE
+logging_setup.LOG_QUEUE_SIZE = 5
+slow = SlowStream()
+capture(slow)
+before = LOG_RECORDS_DROPPED._value.get()
+t0 = time.perf_counter()
+for i in range(50):
+    logger.info("burst %d", i)
+caller_ms = (time.perf_counter() - t0) * 1000
+dropped = LOG_RECORDS_DROPPED._value.get() - before
+records(slow)
+logging_setup.LOG_QUEUE_SIZE = size
+if dropped > 0 and caller_ms < 100:
+    print(f"✅ full queue dropped {dropped:.0f} of 50 records without blocking ({caller_ms:.1f} ms)")
+else:
+    print(f"❌ FAILED: {dropped} dropped, caller blocked {caller_ms:.1f} ms")
+
+# Payloads: rate limited per kind and truncated
+buf = io.StringIO()
+capture(buf)
+rate, chars = logging_setup.LOG_PAYLOADS_PER_MINUTE, logging_setup.LOG_PAYLOAD_CHARS
+logging_setup.LOG_PAYLOADS_PER_MINUTE, logging_setup.LOG_PAYLOAD_CHARS = 1, 100
+for _ in range(5):
+    logging_setup.log_payload(logger, logging.INFO, "test_payload", "x" * 500)
+logging_setup.log_payload(logger, logging.DEBUG, "test_debug", "y" * 500)
+logging_setup.LOG_PAYLOADS_PER_MINUTE, logging_setup.LOG_PAYLOAD_CHARS = rate, chars
+payloads = [r for r in records(buf) if r.get("payload_kind")]
+if len(payloads) == 1 and "[400 more chars]" in payloads[0]["msg"] and len(payloads[0]["msg"]) < 200:
+    print("✅ payload logs are sampled (1 of 5 per minute), truncated, and skipped below the level")
+else:
+    print(f"❌ FAILED: {payloads}")
+
+# API: one line per request, id echoed back (client id kept, junk replaced)
+buf = io.StringIO()
+capture(buf)
+client = TestClient(app)
+kept = client.get("/health", headers={"X-Request-Id": "abc-123"}).headers.get("x-request-id")
+replaced = client.get("/health", headers={"X-Request-Id": "bad id\n"}).headers.get("x-request-id")
+lines = [r for r in records(buf) if r["logger"] == "api"]
+if kept == "abc-123" and replaced not in ("", "bad id\n") and len(replaced) == 16 \
+        and [r["request_id"] for r in lines] == [kept, replaced] and lines[0]["status"] == 200:
+    print("✅ each request logs one line tagged with its X-Request-Id")
+else:
+    print(f"❌ FAILED: {kept} {replaced} {lines}")
+
+logging_setup.setup_logging()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Test /metrics: per-stage latency histograms, route labels and the in-flight gauges"""
+
+import re
+import threading
+import time
+
+from benchmarks.fake_ollama import start_for_tests
+
+# Slow generation keeps one request in the pipeline long enough to observe it
+fake = start_for_tests(token_rate=200, prompt_rate=50000)
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.services import llm_client  # noqa: E402
+from app.services.warmup import _tiny_pdf  # noqa: E402
+from main import app  # noqa: E402
+
+client = TestClient(app)
+
+
+def sample(text: str, name: str, **labels) -> float:
+    """Value of one exposition line, or -1 when it is missing"""
+    wanted = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    pattern = rf"^{re.escape(name)}{{{re.escape(wanted)}}} (\S+)$" if labels else rf"^{re.escape(name)} (\S+)$"
+    m = re.search(pattern, text, re.M)
+    return float(m.group(1)) if m else -1
+
+
+print("Testing Prometheus metrics...")
+print("=" * 70)
+
+responses = []
+request = threading.Thread(target=lambda: responses.append(
+    client.post("/analyze", files={"file": ("r.pdf", _tiny_pdf("Hemoglobin: 13.5 g/dL (12.0 - 15.5)"))})
+))
+request.start()
+during = 0.0
+deadline = time.monotonic() + 10
+while request.is_alive() and time.monotonic() < deadline:
+    during = max(during, sample(client.get("/metrics").text, "analyze_in_flight"))
+    time.sleep(0.02)
+request.join()
+
+body = client.get("/metrics").text
+if responses and responses[0].status_code == 200:
+    print("✅ /analyze succeeded against the fake model")
+else:
+    print(f"❌ FAILED: {responses[0].status_code if responses else 'no response'}")
+
+stages = ("upload_read", "extract", "compress", "prompt_build", "llm", "validate", "normalize", "serialize")
+missing = [s for s in stages if sample(body, "analyze_stage_seconds_count", stage=s) < 1]
+if not missing and sample(body, "analyze_stage_seconds_bucket", le="+Inf", stage="llm") >= 1:
+    print(f"✅ analyze_stage_seconds has a histogram per stage ({', '.join(stages)})")
+else:
+    print(f"❌ FAILED: stages without observations: {missing}")
+
+if sample(body, "http_request_seconds_count", method="POST", route="/analyze", status="200") >= 1 \
+        and sample(body, "extract_page_seconds_count", engine="pdfplumber") >= 1 \
+        and sample(body, "llm_request_seconds_count", model=llm_client.MODEL) >= 1:
+    print("✅ request, page extraction and LLM histograms carry route, engine and model labels")
+else:
+    print("❌ FAILED: labelled histograms missing")
+
+client.get("/history/nobody/parameters/hb")
+if sample(client.get("/metrics").text, "http_request_seconds_count",
+          method="GET", route="/history/{patient_id}/parameters/{analyte}", status="403") >= 1:
+    print("✅ routes are labelled by template, not raw path")
+else:
+    print("❌ FAILED: route template label")
+
+if during == 1 and sample(body, "analyze_in_flight") == 0 and sample(body, "http_requests_in_flight") >= 1:
+    print("✅ in-flight gauges rise during a request and fall after it")
+else:
+    print(f"❌ FAILED: analyze_in_flight {during} during, {sample(body, 'analyze_in_flight')} after")
+
+fake.stop()
+print("=" * 70)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Test replayed MQTT measurements are dropped by the in-memory dedup cache"""
+
+import mqtt_consumer
+from mqtt_consumer import measurement_key, payload_hash, seen_recently, remember
+
+measurement = {"weight": 72.4, "fat": 21.3, "muscle": 38.0, "water": 55.1, "date": "2026-01-12T07:30+0100"}
+
+print("Testing MQTT dedup cache...")
+print("=" * 70)
+
+try:
+    key = measurement_key(measurement, "openscale")
+    digest = payload_hash(measurement)
+
+    assert not seen_recently(key, digest), "fresh measurement reported as seen"
+    remember(key, digest)
+    assert seen_recently(key, digest), "replayed measurement not detected"
+    print("✅ Replayed measurement detected")
+
+    edited = dict(measurement, weight=72.5)
+    assert not seen_recently(key, payload_hash(edited)), "edited payload treated as replay"
+    print("✅ Edited payload goes through to the database check")
+
+    assert measurement_key(measurement, "miscale") != key, "source not part of the key"
+    print("✅ Source is part of the measurement key")
+
+    mqtt_consumer.DEDUP_CACHE_SIZE = 3
+    for minute in range(10):
+        m = dict(measurement, date=f"2026-01-12T08:{minute:02d}+0100")
+        remember(measurement_key(m, "openscale"), payload_hash(m))
+    assert len(mqtt_consumer._recent) == 3, f"cache grew to {len(mqtt_consumer._recent)}"
+    print("✅ Cache stays bounded")
+
+    # Mi scale payloads have no date: identified by content, stamped with the arrival time
+    reading = {"weight": 70.1, "fat": 20.0, "muscle": None, "water": None, "date": None}
+    first = dict(reading, received_at="2026-01-12T07:30:00.123456+00:00")
+    redelivered = dict(reading, received_at="2026-01-12T07:30:04.000000+00:00")
+    assert measurement_key(first, "miscale") == measurement_key(redelivered, "miscale"), "redelivery has a new key"
+    assert payload_hash(first) == payload_hash(redelivered), "arrival stamp part of the hash"
+    at = mqtt_consumer.measured_at(first)
+    assert at.tzinfo is not None and at.isoformat() == first["received_at"], at
+    assert mqtt_consumer.parse_timestamp(None).tzinfo is not None, "fallback time is naive"
+    print("✅ Dateless payloads keep one key across redeliveries and get UTC timestamps")
+
+    key = measurement_key(first, "miscale")
+    remember(key, payload_hash(first))
+    assert seen_recently(key, payload_hash(redelivered)), "redelivery within the window not detected"
+    mqtt_consumer.DATELESS_DEDUP_SECONDS = 0
+    assert not seen_recently(key, payload_hash(redelivered)), "same reading later treated as replay"
+    mqtt_consumer.DATELESS_DEDUP_SECONDS = 600
+    print("✅ Same dateless reading only counts as a replay within the window")
+except AssertionError as e:
+    print(f"❌ FAILED: {e}")
+
+# Network thread and spool drainer share the cache
+import threading  # noqa: E402
+
+errors = []
+mqtt_consumer.DEDUP_CACHE_SIZE = 50
+
+
+def hammer(worker):
+    try:
+        for i in range(20000):
+            key = ("u", str(i % 80), "openscale")
+            if not seen_recently(key, str(worker)):
+                remember(key, str(worker))
+    except Exception as e:
+        errors.append(e)
+
+
+threads = [threading.Thread(target=hammer, args=(w,)) for w in range(4)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+if not errors and len(mqtt_consumer._recent) <= 50:
+    print("✅ Cache is safe to use from several threads")
+else:
+    print(f"❌ FAILED: {errors[:1]} size {len(mqtt_consumer._recent)}")
+
+# The drainer survives unexpected errors and backs off instead of dying
+import tempfile  # noqa: E402
+import time  # noqa: E402
+
+from app.services.spool import Spool  # noqa: E402
+
+mqtt_consumer.spool = Spool(tempfile.mkdtemp() + "/measurements.spool")
+mqtt_consumer.spool.append(b"{}")
+mqtt_consumer.schema_ready = True
+mqtt_consumer.SPOOL_DRAIN_INTERVAL = 0.01
+mqtt_consumer.db_available.clear()
+calls = []
+
+
+def flaky_replay():
+    calls.append(time.monotonic())
+    if len(calls) == 1:
+        raise KeyError("boom")
+    records, offset = mqtt_consumer.spool.read_batch()
+    mqtt_consumer.spool.commit(offset)
+
+
+mqtt_consumer.replay_spool = flaky_replay
+threading.Thread(target=mqtt_consumer.drain_spool_forever, daemon=True).start()
+if mqtt_consumer.db_available.wait(5) and len(calls) == 2 and calls[1] - calls[0] >= 0.02:
+    print("✅ Drainer logs a failed replay, backs off and retries")
+else:
+    print(f"❌ FAILED: {len(calls)} replay attempts, db_available={mqtt_consumer.db_available.is_set()}")
+
+print("=" * 70)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Test near-duplicate detection: SimHash, dHash, multi-index lookup and the value check"""
+
+import io
+
+from PIL import Image, ImageDraw
+
+from benchmarks.fake_ollama import start_for_tests
+
+# Only the near-duplicate index: every miss here must reach the LLM
+fake = start_for_tests(caches=("near_duplicates",), token_rate=5000, prompt_rate=50000)
+
+from app.services import admission, llm_client, near_duplicates, pipeline  # noqa: E402
+from app.services.preprocess import compress_report_text  # noqa: E402
+from app.utils.metrics import OLLAMA_TOKENS  # noqa: E402
+from generate_reports import synthetic_report  # noqa: E402
+
+print("Testing near-duplicate detection...")
+print("=" * 70)
+
+report, labels = synthetic_report(n_params=20, seed=21)
+# Same report from another system: different header, spacing and footer
+reexported = report.replace("Patient Name:", "Patient:").replace(": ", ":  ") + "\nPrinted by LabSys v2"
+target = labels[3]
+amended = report.replace(f": {target['value']} ", ": 999.9 ", 1)
+other, _ = synthetic_report(n_params=20, seed=99)
+
+text, text_re, text_amended, text_other = (compress_report_text(r) for r in (report, reexported, amended, other))
+d_near = near_duplicates.hamming(near_duplicates.simhash(text), near_duplicates.simhash(text_re))
+d_far = near_duplicates.hamming(near_duplicates.simhash(text), near_duplicates.simhash(text_other))
+if d_near <= near_duplicates.NEAR_DUP_TEXT_DISTANCE < d_far:
+    print(f"✅ SimHash: re-export at distance {d_near}, another report at {d_far}")
+else:
+    print(f"❌ FAILED: re-export at distance {d_near}, another report at {d_far}")
+
+if near_duplicates.value_digest(text) == near_duplicates.value_digest(text_re) \
+        and near_duplicates.value_digest(text) != near_duplicates.value_digest(text_amended):
+    print("✅ value check matches the re-export and rejects the amended report")
+else:
+    print("❌ FAILED: value digests")
+
+# Changes the numbers do not show: a qualitative result flips, a unit changes
+with_urine = report + "\nUrine Glucose: Negative\nUrine Protein: Trace"
+flipped = with_urine.replace("Urine Glucose: Negative", "Urine Glucose: Positive")
+unit_changed = report.replace("mg/dL", "mmol/L", 1)
+text_urine, text_flipped, text_unit = (compress_report_text(r) for r in (with_urine, flipped, unit_changed))
+if "mg/dL" in report and near_duplicates.value_digest(text_urine) != near_duplicates.value_digest(text_flipped) \
+        and near_duplicates.value_digest(text) != near_duplicates.value_digest(text_unit):
+    print("✅ value check rejects a flipped qualitative result and a changed unit")
+else:
+    print("❌ FAILED: qualitative flip or unit change shares the digest")
+
+
+def photo(brightness: int, quality: int, lines) -> bytes:
+    img = Image.new("L", (600, 800), brightness)
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((40, 40, 560, 120), fill=brightness - 120)
+    for i, line in enumerate(lines):
+        draw.text((60, 160 + i * 28), line, fill=0)
+        draw.rectangle((380, 160 + i * 28, 380 + len(line) * 4, 172 + i * 28), fill=brightness - 60 - 4 * i)
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=quality)
+    return out.getvalue()
+
+
+lines = report.splitlines()[:20]
+first_photo = near_duplicates.image_hash(photo(235, 90, lines))
+second_photo = near_duplicates.image_hash(photo(225, 60, lines))
+other_photo = near_duplicates.image_hash(photo(235, 90, other.splitlines()[5:12]))
+d_near = near_duplicates.hamming(first_photo, second_photo)
+d_far = near_duplicates.hamming(first_photo, other_photo)
+if d_near <= near_duplicates.NEAR_DUP_IMAGE_DISTANCE < d_far:
+    print(f"✅ dHash: second photo at distance {d_near}, another page at {d_far}")
+else:
+    print(f"❌ FAILED: second photo at distance {d_near}, another page at {d_far}")
+
+# Multi-index hashing finds every hash within the radius through an exact chunk
+h = near_duplicates.simhash(text)
+radius = near_duplicates.NEAR_DUP_TEXT_DISTANCE
+flipped = h ^ (1 << 0) ^ (1 << 21) ^ (1 << 42)
+shared = [a == b for a, b in zip(near_duplicates._chunks(h, radius + 1), near_duplicates._chunks(flipped, radius + 1))]
+if any(shared) and near_duplicates._unsigned(near_duplicates._signed(h)) == h:
+    print(f"✅ {radius} flipped bits leave {sum(shared)} of {radius + 1} chunks exact")
+else:
+    print("❌ FAILED: no exact chunk within the radius")
+
+
+def prompt_tokens():
+    return OLLAMA_TOKENS.labels(llm_client.MODEL, "prompt")._value.get()
+
+
+def analyze(text):
+    ticket = admission.admit("test", "normal", 1.0)
+    t0 = prompt_tokens()
+    result = pipeline.analyze_extracted(pipeline.Extracted(text), ticket)
+    return result, prompt_tokens() - t0
+
+
+first, first_tokens = analyze(text)
+again, again_tokens = analyze(text_re)
+if first_tokens > 0 and again_tokens == 0 and again.model_dump() == first.model_dump():
+    print("✅ re-exported report reuses the stored result without an LLM call")
+else:
+    print(f"❌ FAILED: {first_tokens} then {again_tokens} prompt tokens")
+
+changed, changed_tokens = analyze(text_amended)
+values = {p.name: p.value for p in changed.parameters}
+if changed_tokens > 0 and values.get(target["name"]) == "999.9":
+    print("✅ amended report is analyzed again")
+else:
+    print(f"❌ FAILED: {changed_tokens} prompt tokens, {target['name']}={values.get(target['name'])}")
+
+fake.stop()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""Test the single-pass line classifier behind compress_report_text"""
+
+from app.services.preprocess import classify_line, compress_report_text
+
+print("Testing line classifier...")
+print("=" * 70)
+
+cases = [
+    # (line, expected is_candidate, description)
+    ("Hemoglobin: 9.6 g/dL (12.0 - 15.5)", True, "value with unit and hint"),
+    ("Platelets: 1.32 x10^5/uL (1.5 - 4.5)", True, "plural hint and 10^n unit"),
+    ("Triglycerides: 310 mg/dL (< 150)", True, "plural of a singular hint"),
+    ("SGPT (ALT): 86 U/L (7 - 56)", True, "hint inside brackets"),
+    ("HbA1c: 7.8 % (4.0 - 5.6)", True, "percent unit after a space"),
+    ("Vitamin D", True, "multi-word hint"),
+    ("Sample collected at the health centre", False, "'alt' inside 'health' is not a hint"),
+    ("Results are fast to process", False, "'ast' inside 'fast' is not a hint"),
+    ("Report Date: 12-Jan-2026", False, "number without unit or hint"),
+]
+
+for line, expected, description in cases:
+    features = classify_line(line)
+    if features.is_candidate == expected:
+        print(f"✅ {description}")
+    else:
+        print(f"❌ FAILED: {description}: {line!r} -> {features}")
+
+text = """
+Patient Name: Anita Verma
+Hemoglobin: 9.6 g/dL (12.0 - 15.5)
+Hemoglobin: 9.6 g/dL (12.0 - 15.5)
+Please correlate clinically at the health centre.
+WBC Count: 13800 /uL (4000 - 11000)
+"""
+compressed = compress_report_text(text)
+expected = "Hemoglobin: 9.6 g/dL (12.0 - 15.5)\nWBC Count: 13800 /uL (4000 - 11000)\nPatient Name: Anita Verma"
+if compressed == expected:
+    print("✅ compress_report_text dedups and appends label: value fallback lines")
+else:
+    print(f"❌ FAILED: compress_report_text returned {compressed!r}")
+
+print("=" * 70)
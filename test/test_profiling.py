@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Test the admin token: fail-closed /admin, X-Profile triggering and high-priority admission"""
+
+from fastapi.testclient import TestClient
+
+from app.utils import auth, profiling
+from main import app
+
+print("Testing admin token and profiling triggers...")
+print("=" * 70)
+
+client = TestClient(app)
+
+# No token configured: everything admin is refused, X-Profile is ignored
+auth.ADMIN_TOKEN = ""
+listed = client.get("/admin/profiles", headers={"X-Admin-Token": ""})
+profiled = client.get("/health", headers={"X-Profile": "1"})
+high = client.post("/analyze", files={"file": ("a.txt", b"x")}, headers={"X-Priority": "high"})
+if listed.status_code == 403 and "x-profile-id" not in profiled.headers and high.status_code == 403:
+    print("✅ without ADMIN_TOKEN: /admin is 403, X-Profile ignored, high priority refused")
+else:
+    print(f"❌ FAILED: /admin {listed.status_code}, profile {profiled.headers.get('x-profile-id')}, "
+          f"high {high.status_code}")
+
+auth.ADMIN_TOKEN = "s3cret"
+checks = {
+    "right token": auth.is_admin("s3cret"),
+    "wrong token": not auth.is_admin("s3cre"),
+    "empty token": not auth.is_admin(""),
+    "missing token": not auth.is_admin(None),
+    "X-Profile with token": profiling.should_profile({"x-profile": "s3cret"}),
+    "X-Profile other value": not profiling.should_profile({"x-profile": "1"}),
+    "no header": not profiling.should_profile({}),
+}
+failed = [name for name, ok in checks.items() if not ok]
+if not failed:
+    print("✅ token comparison and X-Profile trigger accept only the configured token")
+else:
+    print(f"❌ FAILED: {failed}")
+
+wrong = client.get("/admin/profiles", headers={"X-Admin-Token": "nope"})
+profiled = client.get("/health", headers={"X-Profile": "s3cret"})
+profile_id = profiled.headers.get("x-profile-id")
+listed = client.get("/admin/profiles", headers={"X-Admin-Token": "s3cret"})
+fetched = client.get(f"/admin/profiles/{profile_id}", params={"format": "collapsed"},
+                     headers={"X-Admin-Token": "s3cret"})
+if wrong.status_code == 403 and profile_id and listed.status_code == 200 and fetched.status_code == 200 \
+        and any(p["id"] == profile_id for p in listed.json()["profiles"]):
+    print("✅ with the token: a profiled request is listed and downloadable under /admin")
+else:
+    print(f"❌ FAILED: wrong {wrong.status_code}, profile {profile_id}, list {listed.status_code}, "
+          f"get {fetched.status_code}")
+
+auth.ADMIN_TOKEN = ""
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Test targeted repair of truncated or partly invalid LLM answers against the fake Ollama server"""
+
+import json
+
+from benchmarks.fake_ollama import start_for_tests
+
+fake = start_for_tests(token_rate=5000, prompt_rate=50000)
+
+from app.services import llm_client, pipeline  # noqa: E402
+from app.services.preprocess import compress_report_text  # noqa: E402
+from app.utils.json_safe import salvage_array_items  # noqa: E402
+from app.utils.metrics import LLM_REPAIRS, OLLAMA_TOKENS  # noqa: E402
+from generate_reports import synthetic_report  # noqa: E402
+
+print("Testing LLM answer repair...")
+print("=" * 70)
+
+items = salvage_array_items('{"summary": {}, "parameters": [{"name": "A"}, {"name": "B"}, {"name": "C", "va', "parameters")
+if items == [{"name": "A"}, {"name": "B"}]:
+    print("✅ complete items are salvaged from truncated JSON")
+else:
+    print(f"❌ FAILED: salvaged {items}")
+
+text = compress_report_text(synthetic_report(n_params=10, seed=5)[0])
+llm_client.OLLAMA_NUM_PREDICT = 4000
+full = pipeline.parse_analysis(llm_client.analyze_text_with_llm(text))
+
+
+def prompt_tokens():
+    return OLLAMA_TOKENS.labels(llm_client.MODEL, "prompt")._value.get()
+
+
+def repairs(outcome):
+    return LLM_REPAIRS.labels(outcome)._value.get()
+
+
+# Truncated answer: only the first parameters are complete
+llm_client.OLLAMA_NUM_PREDICT = 200
+t0 = prompt_tokens()
+truncated = llm_client.analyze_text_with_llm(text)
+first_call = prompt_tokens() - t0
+kept = len(salvage_array_items(truncated, "parameters"))
+before = repairs("repaired")
+t0 = prompt_tokens()
+llm_client.OLLAMA_NUM_PREDICT = 120
+result = pipeline.result_stage(truncated, text)
+repair_call = prompt_tokens() - t0
+if 0 < kept < len(full.parameters) and len(result.parameters) == len(full.parameters) \
+        and repairs("repaired") == before + 1:
+    print(f"✅ truncated answer ({kept}/{len(full.parameters)} parameters) repaired to a full result")
+else:
+    print(f"❌ FAILED: {kept} salvaged, {len(result.parameters)} after repair")
+
+if repair_call < first_call:
+    print(f"✅ repair prompt is smaller than the full prompt ({repair_call:.0f} vs {first_call:.0f} tokens)")
+else:
+    print(f"❌ FAILED: repair prompt {repair_call} tokens, full prompt {first_call}")
+
+if [p.name for p in result.parameters] == [p.name for p in full.parameters] \
+        and result.summary.abnormal_count == sum(p.status != "normal" for p in result.parameters):
+    print("✅ merged parameters match the full answer and the summary is recomputed")
+else:
+    print(f"❌ FAILED: merged {[p.name for p in result.parameters]}")
+
+# One item fails Parameter validation: only its line is re-asked
+answer = json.loads(full.model_dump_json())
+answer["parameters"][3]["unit"] = 12
+broken = json.dumps(answer)
+result = pipeline.result_stage(broken, text)
+if len(result.parameters) == len(full.parameters) and result.parameters[-1].name == full.parameters[3].name:
+    print("✅ invalid item is dropped and re-extracted from its line")
+else:
+    print(f"❌ FAILED: {[p.name for p in result.parameters]}")
+
+# Complete answer: no repair call
+before = sum(repairs(o) for o in ("repaired", "unchanged", "failed"))
+result = pipeline.result_stage(full.model_dump_json(), text)
+if sum(repairs(o) for o in ("repaired", "unchanged", "failed")) == before:
+    print("✅ complete answer needs no repair")
+else:
+    print("❌ FAILED: complete answer was repaired")
+
+# Nothing usable and the model is gone: still a 500
+fake.stop()
+try:
+    pipeline.result_stage("not json at all", text)
+    print("❌ FAILED: garbage answer was accepted")
+except pipeline.AnalysisError as e:
+    if e.status_code == 500:
+        print("✅ unrepairable answer is a 500")
+    else:
+        print(f"❌ FAILED: status {e.status_code}")
+
+print("=" * 70)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Test the per-section LLM result cache against the fake Ollama server"""
+
+from benchmarks.fake_ollama import start_for_tests
+
+# Only the section cache: repeats must reach it, not the near-duplicate index
+fake = start_for_tests(caches=("sections",), token_rate=5000, prompt_rate=50000)
+
+from app.services import admission, llm_client, pipeline, section_cache  # noqa: E402
+from app.services.preprocess import compress_report_text  # noqa: E402
+from app.utils.metrics import OLLAMA_TOKENS  # noqa: E402
+from generate_reports import synthetic_report  # noqa: E402
+
+print("Testing section-level LLM result cache...")
+print("=" * 70)
+
+
+def prompt_tokens():
+    return OLLAMA_TOKENS.labels(llm_client.MODEL, "prompt")._value.get()
+
+
+def analyze(text):
+    """Result and prompt tokens spent on it"""
+    ticket = admission.admit("test", "normal", 1.0)
+    t0 = prompt_tokens()
+    result = pipeline.analyze_extracted(pipeline.Extracted(text), ticket)
+    return result, prompt_tokens() - t0
+
+
+report, labels = synthetic_report(n_params=40, seed=11)
+text = compress_report_text(report)
+
+sections = section_cache.split_sections(text)
+spaced = "\n\n".join("  " + line.replace(" ", "   ") for line in text.splitlines())
+if len(sections) > 1 and section_cache.split_sections(spaced) == sections:
+    print(f"✅ report split into {len(sections)} sections")
+else:
+    print(f"❌ FAILED: sections {sections}")
+
+first, first_tokens = analyze(text)
+if first_tokens > 0 and len(first.parameters) == len(labels):
+    print(f"✅ first report analyzed by the LLM ({len(first.parameters)} parameters, {first_tokens:.0f} prompt tokens)")
+else:
+    print(f"❌ FAILED: {len(first.parameters)}/{len(labels)} parameters, {first_tokens} prompt tokens")
+
+again, again_tokens = analyze(text)
+if again_tokens == 0 and again.model_dump() == first.model_dump():
+    print("✅ identical report served from the cache without an LLM call")
+else:
+    print(f"❌ FAILED: {again_tokens} prompt tokens on a repeat")
+
+# Amended report: one value reissued
+target = labels[5]
+old_line = next(line for line in report.splitlines() if line.startswith(f"{target['name']}:"))
+new_value = "987.6"
+amended_report = report.replace(old_line, old_line.replace(target["value"], new_value, 1))
+amended, amended_tokens = analyze(compress_report_text(amended_report))
+values = {p.name: p.value for p in amended.parameters}
+if 0 < amended_tokens < first_tokens / 2 and values.get(target["name"]) == new_value \
+        and len(amended.parameters) == len(labels):
+    print(f"✅ amended report cost one small call ({amended_tokens:.0f} vs {first_tokens:.0f} prompt tokens)")
+else:
+    print(f"❌ FAILED: {amended_tokens} prompt tokens, {target['name']}={values.get(target['name'])}, "
+          f"{len(amended.parameters)} parameters")
+
+fake.stop()
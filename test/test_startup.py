@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Test API warmup: heavy optional modules stay out and /ready gates on warmup"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+print("Testing API startup...")
+print("=" * 70)
+
+# Fresh interpreter: this process may already have imported anything
+probe = """
+import json, sys
+from fastapi.testclient import TestClient
+from app.services import warmup
+from main import app
+
+heavy = sorted({m.split(".")[0] for m in sys.modules} & {"reportlab", "streamlit", "matplotlib", "pandas"})
+client = TestClient(app)
+before = client.get("/ready").status_code
+warmup.run_warmup()
+after = client.get("/ready")
+print(json.dumps({"before": before, "after": after.status_code, "steps": after.json()["steps"], "heavy": heavy}))
+"""
+env = dict(os.environ, WARMUP_MODEL="0", PYTHONPATH=os.getcwd())
+proc = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, env=env)
+if proc.returncode != 0:
+    print(f"❌ FAILED: probe crashed\n{proc.stderr}")
+    sys.exit(1)
+report = json.loads(proc.stdout.strip().splitlines()[-1])
+
+if not report["heavy"]:
+    print("✅ reportlab/streamlit/pandas and friends are not imported by the API")
+else:
+    print(f"❌ FAILED: heavy modules imported: {report['heavy']}")
+
+if report["before"] == 503 and report["after"] == 200:
+    print("✅ /ready is 503 until warmup has run")
+else:
+    print(f"❌ FAILED: /ready before={report['before']} after={report['after']}")
+
+steps = report["steps"]
+if steps["pdf"]["ok"] and steps["text_pipeline"]["ok"] and steps["model"].get("skipped"):
+    print("✅ extractor and pipeline warmup steps ran")
+else:
+    print(f"❌ FAILED: steps {steps}")
+
+# A failing required step holds /ready at 503 until a background retry succeeds
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.services import warmup  # noqa: E402
+from main import app  # noqa: E402
+
+attempts = []
+
+
+def flaky_model():
+    attempts.append(time.monotonic())
+    if len(attempts) == 1:
+        raise RuntimeError("model preload failed")
+
+
+def broken_optional():
+    raise RuntimeError("no tesseract")
+
+
+warmup.READY_REQUIRED_STEPS, warmup.WARMUP_RETRY_SECONDS = frozenset({"flaky"}), 0.0
+warmup.run_warmup(steps=(("flaky", flaky_model), ("optional", broken_optional)))
+client = TestClient(app)
+failing = client.get("/ready")
+deadline = time.monotonic() + 5
+while warmup.status()["status"] == "unavailable" and time.monotonic() < deadline:
+    time.sleep(0.01)
+recovered = client.get("/ready")
+if failing.status_code == 503 and failing.json()["status"] == "unavailable" \
+        and recovered.status_code == 200 and recovered.json()["status"] == "degraded":
+    print("✅ a failed required step is 503 until retried; optional failures only degrade")
+else:
+    print(f"❌ FAILED: {failing.status_code} {failing.json()} -> {recovered.status_code} {recovered.json()}")
+
+print("=" * 70)
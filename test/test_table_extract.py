@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Test result-grid detection from PDF word geometry and the table-only result"""
+
+import tempfile
+from pathlib import Path
+
+import pdfplumber
+
+from app.services.table_extract import page_to_text, parse_table_line, table_result
+from generate_reports import TABLE_HEADER, create_pdf, synthetic_report
+
+out_dir = Path(tempfile.mkdtemp())
+
+
+def pdf_text(content: str, name: str) -> str:
+    path = create_pdf(name, content, out_dir)
+    with pdfplumber.open(path) as pdf:
+        return "\n".join(page_to_text(page) for page in pdf.pages)
+
+
+print("Testing table extraction...")
+print("=" * 70)
+
+content, labels = synthetic_report(n_params=12, n_pages=2, seed=7, layout="table")
+text = pdf_text(content, "table.pdf")
+rows = [r for r in map(parse_table_line, text.splitlines()) if r is not None]
+expected = [(l["name"], l["value"], l["unit"], l["normal_range"]) for l in labels]
+if [tuple(r) for r in rows] == expected:
+    print("✅ header grid rows normalized to name | value | unit | range (both pages)")
+else:
+    print(f"❌ FAILED: rows {rows}")
+
+if "Patient Name: Synthetic Patient 7" in text and "Test | Result" not in text:
+    print("✅ non-table lines kept, header row dropped")
+else:
+    print(f"❌ FAILED: text\n{text}")
+
+headerless = pdf_text(content.replace(TABLE_HEADER + "\n", ""), "headerless.pdf")
+if sum(1 for line in headerless.splitlines() if parse_table_line(line)) == len(labels):
+    print("✅ headerless grid detected from cell positions")
+else:
+    print(f"❌ FAILED: headerless text\n{headerless}")
+
+lines_text = pdf_text(synthetic_report(n_params=12, seed=7)[0], "lines.pdf")
+if not any(parse_table_line(line) for line in lines_text.splitlines()):
+    print("✅ 'Name: value unit (range)' reports are left alone")
+else:
+    print(f"❌ FAILED: lines layout produced table rows\n{lines_text}")
+
+print("\nTesting table-only results...")
+print("=" * 70)
+
+result = table_result(text)
+if result is not None and [p.status for p in result.parameters] == [l["status"] for l in labels]:
+    print("✅ clean table answered without the LLM, statuses from ranges")
+else:
+    print(f"❌ FAILED: table_result {result}")
+
+if result is not None and result.summary.abnormal_count == sum(l["status"] != "normal" for l in labels):
+    print("✅ summary derived from the rows")
+else:
+    print(f"❌ FAILED: summary {result and result.summary}")
+
+mixed = text + "\nESR: 32 mm/hr (0 - 20)"
+if table_result(mixed) is None:
+    print("✅ parameter lines outside the table send the report to the LLM")
+else:
+    print("❌ FAILED: mixed report treated as clean table")
+
+if table_result(lines_text) is None:
+    print("✅ no table, no table result")
+else:
+    print("❌ FAILED: table result without a table")
+
+print("=" * 70)